@@ -0,0 +1,163 @@
+import random
+
+import redis
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F, Case, When, Value, Max
+from django.db.models.functions import Substr
+
+from blog.models import Blog
+from config.redis_client import get_redis_client
+
+PUBLISHED_IDS_CACHE_KEY = 'blog:published_ids'
+PUBLISHED_IDS_CACHE_SECONDS = 60 * 60
+# Запись целиком для страницы записи и время последнего изменения опубликованных записей
+POST_CACHE_KEY = 'blog:post:{}'
+POST_CACHE_SECONDS = 60 * 60
+LAST_MODIFIED_CACHE_KEY = 'blog:last_modified'
+# Хеш Redis {pk записи: просмотры, еще не записанные в базу} и его копия на время переноса в базу
+VIEWS_HASH_KEY = 'blog:views'
+# Сколько символов текста записи показывается в карточке
+EXCERPT_LENGTH = 300
+# Поля, которые нужны карточке записи (blog/includes/inc_blog.html)
+CARD_FIELDS = ('pk', 'title', 'slug', 'preview', 'created_at', 'last_update', 'views_count')
+
+
+def get_published_ids() -> list:
+    """
+    Возвращает pk всех опубликованных записей. Список хранится в кеше и сбрасывается сигналами
+    при публикации, снятии с публикации или удалении записи
+    """
+    ids = cache.get(PUBLISHED_IDS_CACHE_KEY)
+    if ids is None:
+        ids = list(Blog.objects.filter(is_published=True).order_by('pk').values_list('pk', flat=True))
+        cache.set(PUBLISHED_IDS_CACHE_KEY, ids, PUBLISHED_IDS_CACHE_SECONDS)
+    return ids
+
+
+def invalidate_published_ids():
+    cache.delete(PUBLISHED_IDS_CACHE_KEY)
+
+
+def get_blog(pk: int):
+    """
+    Возвращает запись из кеша или загружает ее одним запросом. Кеш записи сбрасывается сигналами при сохранении
+    и удалении, а также при переносе просмотров в базу
+    :return: запись или None, если ее нет
+    """
+    key = POST_CACHE_KEY.format(pk)
+    blog = cache.get(key)
+    if blog is None:
+        blog = Blog.objects.filter(pk=pk).first()
+        if blog is not None:
+            cache.set(key, blog, POST_CACHE_SECONDS)
+    return blog
+
+
+def invalidate_blog(pk: int):
+    """Сбрасывает кеш записи после фиксации транзакции, чтобы параллельный запрос не закешировал старую версию"""
+    transaction.on_commit(lambda: cache.delete_many([POST_CACHE_KEY.format(pk), LAST_MODIFIED_CACHE_KEY]))
+
+
+def modified_at(blog: Blog):
+    """
+    Время последнего изменения записи. Поле created_at обновляется при каждом сохранении, а last_update
+    заполняется при создании, поэтому берется наибольшее из них
+    """
+    return max(filter(None, (blog.created_at, blog.last_update)), default=None)
+
+
+def published_last_modified():
+    """Время последнего изменения среди опубликованных записей, хранится в кеше до изменения любой записи"""
+    value = cache.get(LAST_MODIFIED_CACHE_KEY)
+    if value is None:
+        dates = Blog.objects.filter(is_published=True).aggregate(created_at=Max('created_at'),
+                                                                 last_update=Max('last_update'))
+        value = max(filter(None, dates.values()), default=None)
+        if value is not None:
+            cache.set(LAST_MODIFIED_CACHE_KEY, value, PUBLISHED_IDS_CACHE_SECONDS)
+    return value
+
+
+def random_published_blogs(count: int = 3) -> list:
+    """
+    Возвращает до count разных случайных опубликованных записей для карточек.
+    Из базы загружаются только выбранные строки и только поля карточки, вместо полного текста - его начало
+    :param count: сколько записей нужно
+    """
+    ids = get_published_ids()
+    chosen = random.sample(ids, min(count, len(ids)))
+    if not chosen:
+        return []
+
+    blogs = Blog.objects.filter(pk__in=chosen, is_published=True).only(*CARD_FIELDS).annotate(
+        excerpt=Substr('text', 1, EXCERPT_LENGTH + 1)
+    ).in_bulk()
+
+    result = []
+    for pk in chosen:
+        # запись могла быть удалена после того, как список pk попал в кеш
+        blog = blogs.get(pk)
+        if blog is None:
+            continue
+        excerpt = blog.excerpt or ''
+        # присваивание отложенного поля не обращается к базе; карточки только отображаются и не сохраняются
+        blog.text = excerpt[:EXCERPT_LENGTH].rstrip() + '…' if len(excerpt) > EXCERPT_LENGTH else excerpt
+        result.append(blog)
+    return result
+
+
+def record_view(blog_id: int) -> int:
+    """
+    Учитывает просмотр записи без записи в базу: счетчик копится в хеше Redis и переносится в базу
+    периодической задачей flush_blog_views. Если Redis недоступен, счетчик атомарно увеличивается в базе
+    :return: сколько просмотров записи еще не перенесено в базу (их нужно прибавить к views_count для показа)
+    """
+    client = get_redis_client()
+    if client is not None:
+        try:
+            return client.hincrby(VIEWS_HASH_KEY, blog_id, 1)
+        except redis.RedisError:
+            pass
+
+    Blog.objects.filter(pk=blog_id).update(views_count=F('views_count') + 1)
+    return 1
+
+
+def flush_views() -> int:
+    """
+    Переносит накопленные в Redis просмотры в базу одним UPDATE.
+    Хеш забирается и удаляется атомарно (MULTI/EXEC), поэтому новые просмотры копятся в новом хеше, а прерванный
+    перенос не повторяет уже учтенные просмотры. Если запись в базу не удалась, просмотры возвращаются в хеш
+    и будут перенесены при следующем запуске
+    :return: количество обновленных записей
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+
+    with client.pipeline() as pipe:
+        pipe.hgetall(VIEWS_HASH_KEY)
+        pipe.delete(VIEWS_HASH_KEY)
+        views, _ = pipe.execute()
+    if not views:
+        return 0
+
+    deltas = {int(pk): int(count) for pk, count in views.items()}
+    try:
+        with transaction.atomic():
+            updated = Blog.objects.filter(pk__in=deltas).update(views_count=F('views_count') + Case(
+                *(When(pk=pk, then=Value(count)) for pk, count in deltas.items()), default=Value(0)
+            ))
+    except DatabaseError:
+        with client.pipeline() as pipe:
+            for pk, count in deltas.items():
+                pipe.hincrby(VIEWS_HASH_KEY, pk, count)
+            pipe.execute()
+        raise
+
+    # update не отправляет сигналы: закешированные записи со старыми счетчиками сбрасываются явно, чтобы
+    # страница записи не показывала меньше просмотров, чем было. Версия блога и время изменения не меняются:
+    # просмотры не входят в ETag и Last-Modified, а счетчики в карточках списка обновятся вместе с фрагментом
+    cache.delete_many([POST_CACHE_KEY.format(pk) for pk in deltas])
+    return updated
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from blog import services
+from blog.models import Blog
+from main import caching
+from main.tasks import queue_image_variants, queue_image_variants_deletion
+
+
+@receiver(post_init, sender=Blog)
+def blog_loaded(sender, instance, **kwargs):
+    # имя изображения из базы: по нему при сохранении видно, что изображение заменили или убрали
+    preview = instance.__dict__.get('preview')
+    instance._loaded_preview = preview if isinstance(preview, str) else None
+
+
+@receiver(pre_save, sender=Blog)
+def blog_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'preview' not in update_fields:
+        return
+    loaded_preview = getattr(instance, '_loaded_preview', None)
+    if loaded_preview and loaded_preview != instance.preview.name:
+        queue_image_variants_deletion(loaded_preview)
+
+
+@receiver(post_save, sender=Blog)
+def blog_saved(sender, instance, created, update_fields=None, **kwargs):
+    caching.bump_version(caching.BLOG_SCOPE)
+    services.invalidate_blog(instance.pk)
+    queue_image_variants(instance.preview)
+    if update_fields is None or 'preview' in update_fields:
+        instance._loaded_preview = instance.preview.name
+    # список опубликованных записей сбрасывается, только если запись в нем больше не соответствует публикации
+    ids = cache.get(services.PUBLISHED_IDS_CACHE_KEY)
+    if ids is not None and (instance.pk in ids) != instance.is_published:
+        services.invalidate_published_ids()
+
+
+@receiver(post_delete, sender=Blog)
+def blog_deleted(sender, instance, **kwargs):
+    caching.bump_version(caching.BLOG_SCOPE)
+    services.invalidate_blog(instance.pk)
+    services.invalidate_published_ids()
+    queue_image_variants_deletion(instance.preview.name)
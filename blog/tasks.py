@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from blog import services
+
+
+@shared_task()
+def flush_blog_views():
+    """Периодически переносит просмотры записей, накопленные в Redis, в базу"""
+    return services.flush_views()
@@ -1,3 +1,193 @@
+from unittest import mock
+
+import fakeredis
+from django.core.cache import cache
+from django.db import connection, DatabaseError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog import services
+from blog.models import Blog
+from main.tests import QueryBudgetTestCase
+from users.models import User
+
+
+class BlogQueryBudgetTestCase(QueryBudgetTestCase):
+    namespace = 'blog'
+    budgets = {
+        'blog:blog_list': (2, 300),
+        'blog:blog_detail': (3, 300),
+        'blog:blog_create': (2, 300),
+        'blog:blog_update': (3, 300),
+        'blog:blog_delete': (3, 300),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(email='staff@example.com', is_staff=True)
+        Blog.objects.bulk_create(
+            Blog(title=f'Запись {number}', slug=f'zapis-{number}', text='Текст записи. ' * 100,
+                 is_published=bool(number % 10))
+            for number in range(500)
+        )
+        cls.blog = Blog.objects.filter(is_published=True).first()
+
+    def test_budgets(self):
+        self.assertWithinBudget('blog:blog_list', reverse('blog:blog_list'))
+        self.assertWithinBudget('blog:blog_detail', reverse('blog:blog_detail', args=[self.blog.pk]))
+
+        self.client.force_login(self.staff)
+        self.assertWithinBudget('blog:blog_create', reverse('blog:blog_create'))
+        self.assertWithinBudget('blog:blog_update', reverse('blog:blog_update', args=[self.blog.pk]))
+        self.assertWithinBudget('blog:blog_delete', reverse('blog:blog_delete', args=[self.blog.pk]))
+
+    def test_budgets_cover_all_routes(self):
+        self.assertBudgetsCoverAllRoutes()
+
+
+class PublishedSampleTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Blog.objects.bulk_create(
+            Blog(title=f'Запись {number}', slug=f'zapis-{number}', text='Текст записи', is_published=number < 6)
+            for number in range(10)
+        )
+        cls.published = set(Blog.objects.filter(is_published=True).values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sample_is_distinct_and_published(self):
+        for _ in range(20):
+            pks = [blog.pk for blog in services.random_published_blogs(3)]
+            self.assertEqual(len(pks), 3)
+            self.assertEqual(len(set(pks)), 3)
+            self.assertLessEqual(set(pks), self.published)
+
+    def test_small_pool_returns_all_published(self):
+        self.assertEqual({blog.pk for blog in services.random_published_blogs(10)}, self.published)
+        Blog.objects.update(is_published=False)
+        services.invalidate_published_ids()
+        self.assertEqual(services.random_published_blogs(3), [])
+
+    def test_post_unpublished_after_caching_is_skipped(self):
+        services.get_published_ids()
+        # update не отправляет сигналы, поэтому в кеше остается старый список pk
+        Blog.objects.filter(pk__in=self.published).update(is_published=False)
+        self.assertEqual(services.random_published_blogs(10), [])
+
+
+class ViewCounterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(title='Запись', slug='zapis', text='Текст записи', views_count=10)
+
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(services, 'get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for _ in range(3):
+            services.record_view(self.blog.pk)
+
+    def assertViewsCount(self, views_count):
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.views_count, views_count)
+
+    def test_views_are_flushed_once(self):
+        self.assertEqual(services.flush_views(), 1)
+        self.assertEqual(services.flush_views(), 0)
+        self.assertViewsCount(13)
+
+    def test_failed_update_returns_views_to_redis(self):
+        with mock.patch.object(Blog.objects, 'filter', side_effect=DatabaseError('connection lost')), \
+                self.assertRaises(DatabaseError):
+            services.flush_views()
+        self.assertViewsCount(10)
+        self.assertEqual(self.redis.hget(services.VIEWS_HASH_KEY, self.blog.pk), b'3')
+
+        services.flush_views()
+        self.assertViewsCount(13)
+
+    def test_flush_interrupted_after_update_is_not_repeated(self):
+        with mock.patch.object(services.cache, 'delete_many', side_effect=RuntimeError('worker lost')), \
+                self.assertRaises(RuntimeError):
+            services.flush_views()
+        services.record_view(self.blog.pk)
+
+        services.flush_views()
+        self.assertViewsCount(14)
+
+
+class ConditionalGetTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(title='Запись', slug='zapis', text='Текст записи')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        return response
+
+    def test_list_not_modified(self):
+        self.assertNotModified(reverse('blog:blog_list'))
+
+    def test_detail_not_modified_without_queries(self):
+        url = reverse('blog:blog_detail', args=[self.blog.pk])
+        response = self.assertNotModified(url)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # без Redis в базу пишутся только просмотры
+        self.assertEqual([query['sql'] for query in queries.captured_queries if 'SELECT' in query['sql']], [])
+
+    def test_detail_loads_post_once(self):
+        with mock.patch.object(services, 'get_blog', wraps=services.get_blog) as get_blog:
+            self.client.get(reverse('blog:blog_detail', args=[self.blog.pk]))
+        self.assertEqual(get_blog.call_count, 1)
+
+    def test_flushing_views_keeps_validators(self):
+        list_url, detail_url = reverse('blog:blog_list'), reverse('blog:blog_detail', args=[self.blog.pk])
+        with mock.patch.object(services, 'get_redis_client', return_value=fakeredis.FakeRedis()):
+            list_response = self.assertNotModified(list_url)
+            detail_response = self.assertNotModified(detail_url)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(services.flush_views(), 1)
+
+            for url, response in ((list_url, list_response), (detail_url, detail_response)):
+                revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'],
+                                              HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(revalidated.status_code, 304)
+            # на странице записи видны и перенесенные в базу, и новые просмотры
+            self.assertContains(self.client.get(detail_url), 'Кол-во просмотров: 4')
+
+    def test_save_changes_validators_and_cached_post(self):
+        url = reverse('blog:blog_detail', args=[self.blog.pk])
+        etag = self.client.get(url)['ETag']
+        list_etag = self.client.get(reverse('blog:blog_list'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog.title = 'Новый заголовок'
+            self.blog.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый заголовок')
+        response = self.client.get(reverse('blog:blog_list'), HTTP_IF_NONE_MATCH=list_etag)
+        self.assertContains(response, 'Новый заголовок')
 
-# Create your tests here.
+    def test_user_changes_etag(self):
+        url = reverse('blog:blog_detail', args=[self.blog.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(User.objects.create(email='staff@example.com', is_staff=True))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -1,5 +1,4 @@
 from django.urls import path
-from django.views.decorators.cache import cache_page
 
 from blog.apps import BlogConfig
 from blog.views import BlogListView, BlogCreateView, BlogUpdateView, BlogDeleteView, BlogDetailView
@@ -7,7 +6,7 @@ from blog.views import BlogListView, BlogCreateView, BlogUpdateView, BlogDeleteV
 app_name = BlogConfig.name
 
 urlpatterns = [
-    path('', cache_page(60)(BlogListView.as_view()), name='blog_list'),
+    path('', BlogListView.as_view(), name='blog_list'),
     path('<int:pk>/', BlogDetailView.as_view(), name='blog_detail'),
     path('create/', BlogCreateView.as_view(), name='blog_create'),
     path('update/<int:pk>/', BlogUpdateView.as_view(), name='blog_update'),
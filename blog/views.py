@@ -1,36 +1,96 @@
+import hashlib
+
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from pytils.translit import slugify
 
+from blog import services
 from blog.models import Blog
+from main import caching
+from main.mixins import FragmentCacheMixin
+from main.pagination import KeysetPaginationMixin
+
+
+def _make_etag(*parts) -> str:
+    # от пользователя зависят шапка страницы и кнопки сотрудника, поэтому он входит в ETag
+    return hashlib.md5('-'.join(map(str, parts)).encode()).hexdigest()
+
+
+def blog_list_etag(request, *args, **kwargs):
+    return _make_etag(caching.get_version(caching.BLOG_SCOPE), request.user.pk, request.user.is_staff)
+
+
+def blog_list_last_modified(request, *args, **kwargs):
+    return services.published_last_modified()
+
+
+def get_request_blog(request, pk):
+    """Запись из кеша, загруженная один раз за запрос: ее используют dispatch и обе проверки заголовков"""
+    if not hasattr(request, '_blog'):
+        request._blog = services.get_blog(pk)
+    return request._blog
+
+
+def blog_detail_etag(request, pk):
+    blog = get_request_blog(request, pk)
+    if blog is None:
+        return None
+    return _make_etag(blog.pk, services.modified_at(blog), request.user.pk, request.user.is_staff)
 
 
-class BlogListView(ListView):
+def blog_detail_last_modified(request, pk):
+    blog = get_request_blog(request, pk)
+    return services.modified_at(blog) if blog is not None else None
+
+
+@method_decorator(condition(etag_func=blog_list_etag, last_modified_func=blog_list_last_modified), name='get')
+class BlogListView(FragmentCacheMixin, KeysetPaginationMixin, ListView):
+    """
+    Список одинаков для всех пользователей, поэтому фрагмент зависит только от версии блога и страницы.
+    Браузер и прокси получают 304, пока записи блога не менялись
+    """
     model = Blog
     context_object_name = 'blogs'
+    fragment_name = 'blog_list'
 
     def get_queryset(self, *args, **kwargs):
         queryset = super().get_queryset(*args, **kwargs)
         queryset = queryset.filter(is_published=True)
         return queryset
 
+    def load_cache_version(self) -> str:
+        return caching.get_version(caching.BLOG_SCOPE)
+
+    def get_fragment_vary_on(self) -> list:
+        return [self.get_cache_version(), self.request.GET.get('after', ''), self.request.GET.get('before', '')]
 
+
+@method_decorator(condition(etag_func=blog_detail_etag, last_modified_func=blog_detail_last_modified), name='get')
 class BlogDetailView(DetailView):
+    """
+    Запись берется из кеша (services.get_blog). Просмотр учитывается в dispatch, до проверки заголовков
+    If-None-Match и If-Modified-Since, поэтому ответ 304 тоже считается просмотром. В ETag не входит
+    счетчик просмотров, так что при ответе 304 браузер показывает счетчик из своей копии страницы
+    """
     model = Blog
     context_object_name = 'blog'
 
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            self.object = get_request_blog(request, kwargs['pk'])
+            if self.object is None:
+                raise Http404('Запись не найдена')
+            # к значению из базы прибавляются еще не перенесенные из Redis просмотры
+            self.object.views_count += services.record_view(self.object.pk)
+        return super().dispatch(request, *args, **kwargs)
+
     def get_object(self, queryset=None):
-        self.object = super().get_object(queryset)
-        self.object.views_count += 1
-        self.object.save()
         return self.object
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
 
 class BlogCreateView(UserPassesTestMixin, CreateView):
     model = Blog
@@ -73,4 +133,4 @@ class BlogDeleteView(UserPassesTestMixin, DeleteView):
     success_url = reverse_lazy('blog:blog_list')
 
     def test_func(self):
-        return self.user.is_staff
+        return self.request.user.is_staff
@@ -0,0 +1,16 @@
+import redis
+from django.conf import settings
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    Клиент Redis, в котором настроен кеш по умолчанию, для операций, которых нет в API кеша Django
+    (хеши, Lua скрипты). None, если кеш хранится не в Redis (например, в локальной разработке и тестах)
+    """
+    global _redis_client
+    cache_settings = settings.CACHES['default']
+    if _redis_client is None and cache_settings['BACKEND'] == 'django.core.cache.backends.redis.RedisCache':
+        _redis_client = redis.Redis.from_url(cache_settings['LOCATION'])
+    return _redis_client
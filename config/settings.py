@@ -25,6 +25,9 @@ db_username: str = os.getenv('DB_USERNAME')
 db_name: str = os.getenv('DB_NAME')
 smtp_host: str = os.getenv('SMTP_HOST')
 smtp_port: int = int(os.getenv('SMTP_PORT'))
+site_url: str = os.getenv('SITE_URL', 'http://localhost:8000')
+mailing_rate_limit_per_minute: int = int(os.getenv('MAILING_RATE_LIMIT_PER_MINUTE', 60))
+mailing_rate_limit_per_day: int = int(os.getenv('MAILING_RATE_LIMIT_PER_DAY', 500))
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,6 +67,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -146,6 +150,18 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# В production (DEBUG = False) collectstatic добавляет к именам файлов хеш содержимого, пишет манифест и сжатые
+# копии .gz/.br, а StaticFilesMiddleware раздает их с долгим кешированием (см. config/staticfiles.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'config.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -154,6 +170,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Размеры уменьшенных копий загруженных изображений (рамка ширина x высота, пропорции сохраняются), см. main.images.
+# Карточка блога показывается в рамке 300x300, копия card сделана с запасом для экранов с высокой плотностью
+IMAGE_VARIANT_SIZES = {
+    'avatar': (96, 96),
+    'small': (320, 320),
+    'card': (600, 600),
+}
+
 AUTH_USER_MODEL = 'users.User'
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = '/'
@@ -166,6 +190,33 @@ EMAIL_PORT = 465
 EMAIL_HOST_USER = gmail_login
 EMAIL_HOST_PASSWORD = gmail_pass
 
+# Адрес сайта для абсолютных ссылок в письмах рассылки (ссылка отписки)
+SITE_URL = site_url
+
+# Сколько писем отправляется через одно SMTP соединение, после чего оно пересоздается
+MAILING_CONNECTION_MAX_MESSAGES = 100
+# Сколько получателей обрабатывает одна задача Celery при отправке рассылки
+MAILING_CHUNK_SIZE = 500
+# Сколько секунд воркер хранит в памяти загруженные письмо и настройки рассылки
+MAILING_CONTEXT_CACHE_SECONDS = 60
+# Лимиты отправки через один SMTP аккаунт, общие для всех воркеров (0 - без ограничения).
+# Если до следующего разрешенного письма дольше MAILING_RATE_LIMIT_MAX_WAIT секунд, пачка откладывается
+MAILING_RATE_LIMIT_PER_MINUTE = mailing_rate_limit_per_minute
+MAILING_RATE_LIMIT_PER_DAY = mailing_rate_limit_per_day
+MAILING_RATE_LIMIT_MAX_WAIT = 10
+# Сколько строк CSV записывается одним запросом при импорте клиентов
+CLIENT_IMPORT_BATCH_SIZE = 1000
+# Файлы больше этого размера (в байтах, около 5 тысяч строк) импортируются воркером Celery, а не в запросе
+CLIENT_IMPORT_SYNC_MAX_SIZE = 512 * 1024
+# Сколько строк читается из базы за один раз при потоковой выгрузке
+EXPORT_CHUNK_SIZE = 2000
+
+# Очередь служебных писем: сколько писем отправляется за один проход и сколько попыток дается каждому.
+# После неудачной попытки письмо откладывается на OUTBOX_RETRY_DELAY секунд, каждая следующая пауза вдвое дольше
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 5 * 60
+
 # Настройки CELERY
 CELERY_BROKER_URL = r_location
 CELERY_RESULT_BACKEND = r_location
@@ -175,6 +226,34 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Планировщик рассылок: раз в минуту отправляет в очередь рассылки, у которых наступило время запуска
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-due-mailings': {
+        'task': 'main.tasks.dispatch_due_mailings',
+        'schedule': 60.0,
+    },
+    'reconcile-dashboard-counters': {
+        'task': 'main.tasks.reconcile_dashboard_counters',
+        'schedule': 60.0 * 10,
+    },
+    'flush-blog-views': {
+        'task': 'blog.tasks.flush_blog_views',
+        'schedule': 60.0,
+    },
+    'drain-email-outbox': {
+        'task': 'users.tasks.drain_outbox',
+        'schedule': 60.0,
+    },
+    'maintain-messagelog-partitions': {
+        'task': 'main.tasks.maintain_messagelog_partitions',
+        'schedule': 60.0 * 60 * 24,
+    },
+}
+
+# Лог отправки хранится помесячными партициями: сколько месяцев создавать заранее и сколько хранить
+MESSAGELOG_PARTITIONS_AHEAD = 3
+MESSAGELOG_RETENTION_MONTHS = 12
+
 CACHE_ENABLED = True
 
 if CACHE_ENABLED:
@@ -184,3 +263,6 @@ if CACHE_ENABLED:
             "LOCATION": r_location,
         }
     }
+
+# Сколько живут фрагменты страниц в кеше ({% cache %}), устаревшие фрагменты сбрасываются сменой версии
+FRAGMENT_CACHE_TIMEOUT = 60 * 10
@@ -0,0 +1,168 @@
+"""
+Статика для production: имена файлов с хешем содержимого, заранее сжатые копии и раздача с долгим кешированием.
+
+collectstatic через CompressedManifestStaticFilesStorage копирует файлы в STATIC_ROOT, добавляет к именам хеш
+содержимого (css/base.css -> css/base.5af6c0a1b2c3.css, ссылки внутри CSS и source map переписываются),
+записывает манифест staticfiles.json и рядом с каждым текстовым файлом сохраняет сжатые копии .gz и, если
+установлен пакет brotli, .br. StaticFilesMiddleware отдает эти файлы без обращения к сессии и базе, выбирая
+сжатую копию по Accept-Encoding; файлы с хешем в имени кешируются браузером на год как неизменяемые.
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Расширения файлов, которые имеет смысл сжимать (изображения и шрифты woff уже сжаты)
+COMPRESS_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf',
+                       '.otf', '.eot')
+# Сжатая копия сохраняется, только если она меньше оригинала хотя бы на 5%
+MIN_COMPRESSION_RATIO = 0.95
+# Сжатые копии в порядке предпочтения: (кодировка, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Файлы без хеша в имени (например, запрошенные по старой ссылке) браузер перепроверяет раз в час
+CACHE_CONTROL = 'public, max-age=3600'
+
+
+def _compressors() -> list:
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def accepted_encodings(header: str) -> set:
+    """
+    Кодировки из заголовка Accept-Encoding, которые клиент принимает: 'br;q=0' или 'gzip;q=0' означают отказ.
+    '*' с q больше нуля принимает кодировки, не перечисленные явно
+    """
+    weights = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+
+    accepted = {coding for coding, weight in weights.items() if weight > 0}
+    if '*' in accepted:
+        accepted.update(coding for coding, _ in ENCODINGS if coding not in weights)
+    return accepted
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который после обработки файлов сохраняет рядом их сжатые копии"""
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            # копии стилей админки в static/css ссылаются на ../img, которой нет в проекте: битая ссылка
+            # остается как есть, вместо того чтобы прерывать collectstatic
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj[0]
+
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        # сжимаются исходные имена и окончательные имена с хешем из манифеста, промежуточные копии не нужны
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESS_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name: str):
+        with self.open(name) as file:
+            data = file.read()
+        for extension, compress in _compressors():
+            compressed = compress(data)
+            target = name + extension
+            if self.exists(target):
+                self.delete(target)
+            if len(compressed) < len(data) * MIN_COMPRESSION_RATIO:
+                self._save(target, ContentFile(compressed))
+
+
+class StaticFilesMiddleware:
+    """
+    Раздает файлы из STATIC_ROOT, когда DEBUG выключен (при DEBUG статику отдает runserver).
+    Ставится в MIDDLEWARE сразу после SecurityMiddleware, чтобы запросы статики не загружали сессию
+    """
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self._immutable_names = None
+
+    @property
+    def immutable_names(self) -> set:
+        """Имена файлов с хешем из манифеста collectstatic"""
+        if self._immutable_names is None:
+            self._immutable_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._immutable_names
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name: str):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        immutable = name in self.immutable_names
+        if not immutable and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            return HttpResponseNotModified()
+
+        content_type, _ = mimetypes.guess_type(name)
+        encoding = None
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for candidate, extension in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + extension):
+                path, encoding = path + extension, candidate
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if name.endswith(COMPRESS_EXTENSIONS):
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else CACHE_CONTROL
+        return response
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from main.models import Client, Mailer, MailingSettings, MessageLog, EmailMessage
+from main.models import Client, Mailer, MailingSettings, MessageLog, EmailMessage, MailingJob, MailerDailyStats
 
 
 @admin.register(Client)
@@ -26,5 +26,23 @@ class SettingsAdmin(admin.ModelAdmin):
 
 @admin.register(MessageLog)
 class MessageLogAdmin(admin.ModelAdmin):
-    list_display = ('server_response', 'last_attempt')
-    list_filter = ('server_response',)
+    list_display = ('last_attempt', 'mailer_id', 'client', 'status', 'smtp_code', 'server_response',)
+    # фильтр по дате позволяет PostgreSQL читать только нужные помесячные партиции
+    list_filter = ('last_attempt', 'status',)
+    list_select_related = ('client',)
+    raw_id_fields = ('mailer', 'client',)
+    ordering = ('-last_attempt',)
+    show_full_result_count = False
+
+
+@admin.register(MailingJob)
+class MailingJobAdmin(admin.ModelAdmin):
+    list_display = ('task_id', 'mailer_id', 'status', 'sent', 'failed', 'created_at',)
+    list_filter = ('status',)
+
+
+@admin.register(MailerDailyStats)
+class MailerDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'mailer_id', 'sent', 'failed',)
+    list_filter = ('day',)
+    raw_id_fields = ('mailer',)
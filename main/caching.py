@@ -0,0 +1,66 @@
+"""
+Версионированный кеш фрагментов страниц.
+
+У каждого владельца есть номер версии в кеше, который входит в ключ фрагментов его страниц ({% cache %}).
+Сигналы моделей увеличивают версию после фиксации транзакции, поэтому следующий запрос сразу получает новый ключ
+и рендерит фрагмент заново, а старые фрагменты просто истекают. Сотрудники видят записи всех пользователей,
+поэтому их фрагменты зависят от общей версии, которая увеличивается при любом изменении.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+ALL_SCOPE = 'all'
+BLOG_SCOPE = 'blog'
+
+
+def owner_scope(owner_id) -> str:
+    return f'owner:{owner_id}'
+
+
+def _version_key(scope: str) -> str:
+    return f'cache:version:{scope}'
+
+
+def get_version(*scopes: str) -> str:
+    """
+    Возвращает общую версию нескольких областей одним запросом get_many, например '17.4'.
+    Отсутствующая версия начинается с текущего времени в миллисекундах, а не с единицы, чтобы после вытеснения
+    ключа из кеша не совпасть с версией фрагментов, которые еще не истекли
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        value = values.get(key)
+        if value is None:
+            cache.add(key, time.time_ns() // 1_000_000, timeout=None)
+            value = cache.get(key)
+        versions.append(str(value))
+    return '.'.join(versions)
+
+
+def get_user_version(user) -> str:
+    """Версия фрагментов со списками записей пользователя"""
+    return get_version(ALL_SCOPE if user.is_staff else owner_scope(user.pk))
+
+
+def bump_version(*scopes: str):
+    """Увеличивает версии после фиксации транзакции; если версии нет в кеше, она будет создана при чтении"""
+    def apply():
+        for scope in scopes:
+            try:
+                cache.incr(_version_key(scope))
+            except ValueError:
+                pass
+
+    transaction.on_commit(apply)
+
+
+def bump_owner_version(owner_id):
+    """Изменились записи владельца: сбрасываются его фрагменты и фрагменты сотрудников"""
+    if owner_id is None:
+        bump_version(ALL_SCOPE)
+    else:
+        bump_version(owner_scope(owner_id), ALL_SCOPE)
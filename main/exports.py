@@ -0,0 +1,78 @@
+"""
+Потоковая выгрузка клиентов и логов отправки в CSV или JSON Lines.
+
+Строки читаются из базы итератором (на PostgreSQL - серверным курсором) пачками по EXPORT_CHUNK_SIZE
+и сразу отдаются клиенту через StreamingHttpResponse, поэтому память не зависит от объема выгрузки,
+а первые байты уходят до того, как прочитана вся таблица.
+"""
+import csv
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from main.models import Client, MessageLog
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+CLIENT_FIELDS = ('id', 'email', 'first_name', 'last_name', 'middle_name', 'comment')
+LOG_FIELDS = ('id', 'last_attempt', 'status', 'smtp_code', 'server_response', 'mailer_id', 'client_id',
+              'client__email')
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer, который возвращает записанную строку вместо буферизации"""
+
+    def write(self, value):
+        return value
+
+
+def client_queryset(user):
+    return Client.objects.for_user(user).order_by('pk')
+
+
+def log_queryset(user, mailer_id: int = None, since=None):
+    """
+    Логи рассылок, доступных пользователю. Без сортировки: упорядочивание миллионов строк по всем партициям
+    потребовало бы сортировки на сервере до отправки первой строки
+    :param mailer_id: только логи этой рассылки
+    :param since: только попытки начиная с этой даты (на PostgreSQL читаются только нужные партиции)
+    """
+    queryset = MessageLog.objects.all()
+    if not user.is_staff:
+        queryset = queryset.filter(mailer__owner=user)
+    if mailer_id is not None:
+        queryset = queryset.filter(mailer_id=mailer_id)
+    if since is not None:
+        # сравнение с границей дня, а не last_attempt__date: приведение колонки к дате отключило бы отсечение партиций
+        start = timezone.make_aware(datetime.datetime.combine(since, datetime.time()))
+        queryset = queryset.filter(last_attempt__gte=start)
+    return queryset
+
+
+def iter_rows(queryset, fields: tuple, export_format: str):
+    """Генератор строк выгрузки: заголовок и по одной строке на запись"""
+    rows = queryset.values_list(*fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    if export_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def streaming_export(queryset, fields: tuple, export_format: str, filename: str) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(iter_rows(queryset, fields, export_format),
+                                     content_type=FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -1,6 +1,6 @@
 from django import forms
-from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
+from django.db.models import Q
 from django_select2.forms import Select2MultipleWidget, Select2Widget
 from django.forms import SelectDateWidget, TimeInput
 
@@ -15,6 +15,12 @@ class ClientCreateForm(forms.ModelForm):
         fields = ['email', 'first_name', 'last_name', 'middle_name', 'comment']
 
 
+class ClientImportForm(forms.Form):
+    file = forms.FileField(label='CSV файл',
+                           help_text='Колонки: email, first_name, last_name, middle_name, comment')
+    delimiter = forms.ChoiceField(label='Разделитель', choices=((',', 'Запятая'), (';', 'Точка с запятой')))
+
+
 class MailerCreateForm(forms.ModelForm):
     clients = forms.ModelMultipleChoiceField(
         queryset=None,
@@ -28,11 +34,19 @@ class MailerCreateForm(forms.ModelForm):
         if user is not None:
             self.fields['clients'].queryset = Client.objects.filter(owner=user)
 
-        # Получаем все настройки, которые еще не связаны с существующими рассылками
-        existing_settings = MailingSettings.objects.filter(mailer__isnull=True)
+        # Получаем все настройки, которые еще не связаны с существующими рассылками,
+        # при редактировании к ним добавляются настройки самой рассылки
+        free_settings = Q(mailer__isnull=True)
+        if self.instance.pk:
+            free_settings |= Q(mailer=self.instance)
+            self.initial.setdefault('clients', list(self.instance.clients.values_list('pk', flat=True)))
+        existing_settings = MailingSettings.objects.filter(free_settings)
 
-        # Исключаем существующие настройки из выпадающего списка, а также определяем, что владелец авторизованный юзер
-        self.fields['mailing_settings'].queryset = MailingSettings.objects.filter(id__in=existing_settings, owner=user)
+        # Исключаем существующие настройки из выпадающего списка, а также определяем, что владелец авторизованный юзер.
+        # Период и статус нужны для подписи каждого варианта, поэтому загружаются тем же запросом
+        self.fields['mailing_settings'].queryset = MailingSettings.objects.filter(
+            id__in=existing_settings, owner=user
+        ).select_related('mailing_period', 'mailing_status')
 
         self.fields['email_message'].queryset = EmailMessage.objects.filter(owner=user)
 
@@ -56,15 +70,4 @@ class MailingSettingsForm(forms.ModelForm):
 class MailingPeriodForm(forms.ModelForm):
     class Meta:
         model = MailingPeriod
-        fields = ['daily', 'weekly', 'monthly']
-
-    def clean(self):
-        cleaned_data = super().clean()
-        daily = cleaned_data.get('daily')
-        weekly = cleaned_data.get('weekly')
-        monthly = cleaned_data.get('monthly')
-
-        # Проверка на то, что только одно из полей daily, weekly, monthly установлено как True
-        if sum([daily, weekly, monthly]) != 1:
-            raise ValidationError("Выберите ровно один вариант для периодичности")
-
+        fields = ['frequency', 'interval']
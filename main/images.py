@@ -0,0 +1,133 @@
+"""
+Уменьшенные копии загруженных изображений (Blog.preview, User.avatar).
+
+После загрузки изображения задача Celery один раз создает для каждого размера из IMAGE_VARIANT_SIZES две копии
+рядом с оригиналом: в формате для старых браузеров (JPEG, для PNG и GIF - PNG с прозрачностью) и в WebP, например
+preview/photo.jpg -> preview/photo.card.jpg и preview/photo.card.webp. Шаблоны запрашивают размер фильтрами
+thumbnail и webp (main/templatetags/media_path.py); пока копии не готовы, отдается оригинал. Готовность копий
+хранится в кеше, чтобы рендер страницы не обращался к хранилищу; копии удаляются вместе с записью или при замене
+изображения (delete_variants).
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+VARIANTS_CACHE_KEY = 'images:formats:{}'
+# Неполный ответ хранилища кешируется ненадолго: копии создает задача Celery, и отметка о готовности может опоздать
+MISSING_VARIANTS_CACHE_SECONDS = 60
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def variant_name(name: str, size: str, extension: str) -> str:
+    """Имя копии размера size рядом с оригиналом: preview/photo.jpg -> preview/photo.<size>.<extension>"""
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}.{extension}'
+
+
+def fallback_extension(name: str) -> str:
+    """Формат копии для браузеров без WebP: PNG сохраняет прозрачность, остальное сжимается в JPEG"""
+    return 'png' if os.path.splitext(name)[1].lower() in ('.png', '.gif') else 'jpg'
+
+
+def variant_formats(name: str) -> tuple:
+    """
+    Форматы, в которых созданы копии изображения, например ('jpg', 'webp'); WebP нет, если Pillow собран без него.
+    Хранилище проверяется (по копиям последнего размера, которые generate_variants записывает последними), только
+    если ответа нет в кеше; generate_variants и delete_variants обновляют его сами
+    """
+    key = VARIANTS_CACHE_KEY.format(name)
+    formats = cache.get(key)
+    if formats is None:
+        size = list(settings.IMAGE_VARIANT_SIZES)[-1]
+        formats = tuple(extension for extension in (fallback_extension(name), 'webp')
+                        if default_storage.exists(variant_name(name, size, extension)))
+        cache.set(key, formats, timeout=None if 'webp' in formats else MISSING_VARIANTS_CACHE_SECONDS)
+    return formats
+
+
+def variants_exist(name: str) -> bool:
+    """Созданы ли копии изображения"""
+    return bool(variant_formats(name))
+
+
+def _encode(image: Image.Image, extension: str) -> bytes:
+    buffer = BytesIO()
+    if extension == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+    elif extension == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_variants(name: str, overwrite: bool = False) -> list:
+    """
+    Создает копии изображения всех размеров из IMAGE_VARIANT_SIZES. Изображение уменьшается с сохранением
+    пропорций до размеров рамки и никогда не увеличивается; поворот из EXIF применяется, а метаданные
+    не копируются. Уже созданные копии пропускаются
+    :param name: имя файла в хранилище, например preview/photo.jpg
+    :param overwrite: создать копии заново (например, после замены файла с тем же именем)
+    :return: имена созданных файлов
+    """
+    if not name or not default_storage.exists(name):
+        return []
+
+    try:
+        with default_storage.open(name, 'rb') as file:
+            original = ImageOps.exif_transpose(Image.open(file))
+            original.load()
+    except (UnidentifiedImageError, OSError):
+        return []
+
+    if not _has_alpha(original) and original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+    elif _has_alpha(original) and original.mode != 'RGBA':
+        original = original.convert('RGBA')
+
+    extensions = [fallback_extension(name)]
+    if features.check('webp'):
+        # WebP записывается последним: если он есть в хранилище, готовы все копии
+        extensions.append('webp')
+
+    created = []
+    for size, box in settings.IMAGE_VARIANT_SIZES.items():
+        image = original.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        for extension in extensions:
+            target = variant_name(name, size, extension)
+            if default_storage.exists(target):
+                if not overwrite:
+                    continue
+                default_storage.delete(target)
+            created.append(default_storage.save(target, ContentFile(_encode(image, extension))))
+    cache.set(VARIANTS_CACHE_KEY.format(name), tuple(extensions), timeout=None)
+    return created
+
+
+def delete_variants(name: str) -> list:
+    """
+    Удаляет копии изображения всех размеров, оригинал остается
+    :param name: имя оригинала в хранилище
+    :return: имена удаленных файлов
+    """
+    deleted = []
+    for size in settings.IMAGE_VARIANT_SIZES:
+        for extension in (fallback_extension(name), 'webp'):
+            target = variant_name(name, size, extension)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+                deleted.append(target)
+    cache.delete(VARIANTS_CACHE_KEY.format(name))
+    return deleted
@@ -0,0 +1,145 @@
+"""
+Массовый импорт клиентов из CSV.
+
+Файл читается построчно (csv.DictReader поверх потока), поэтому в памяти находятся только текущая пачка строк
+и адреса уже записанных пачек, по которым считаются повторы во всем файле.
+Каждая пачка проверяется и записывается одним запросом INSERT ... ON CONFLICT (email) DO UPDATE, так что повторный
+импорт того же файла обновляет имена и комментарии, а не создает дубликаты.
+"""
+import csv
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db import transaction
+
+from main import stats, caching
+from main.models import Client
+
+IMPORT_FIELDS = ('email', 'first_name', 'last_name', 'middle_name', 'comment')
+REQUIRED_FIELDS = ('email', 'first_name', 'last_name')
+UPDATE_FIELDS = ('first_name', 'last_name', 'middle_name', 'comment')
+# Сколько ошибок сохраняется для отчета, остальные только подсчитываются
+MAX_REPORTED_ERRORS = 1000
+
+validate_email = EmailValidator(message='Некорректный email адрес')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _clean_row(row: dict) -> dict:
+    """
+    Проверяет строку файла и возвращает значения полей клиента
+    :raises ValidationError: если строка не может быть импортирована
+    """
+    values = {name: (row.get(name) or '').strip() for name in IMPORT_FIELDS}
+    missing = [name for name in REQUIRED_FIELDS if not values[name]]
+    if missing:
+        raise ValidationError(f'Не заполнены поля: {", ".join(missing)}')
+
+    values['email'] = BaseUserManager.normalize_email(values['email'])
+    validate_email(values['email'])
+
+    max_length = Client._meta.get_field('email').max_length
+    too_long = [name for name in IMPORT_FIELDS if name != 'comment' and len(values[name]) > max_length]
+    if too_long:
+        raise ValidationError(f'Слишком длинные значения полей: {", ".join(too_long)}')
+
+    for name in ('middle_name', 'comment'):
+        values[name] = values[name] or None
+    return values
+
+
+def _save_batch(batch: dict, owner, result: ImportResult, written: set):
+    """
+    Записывает пачку {email: (номер строки, значения)} одним upsert. Адреса, которые уже принадлежат клиентам
+    другого пользователя, не перезаписываются и попадают в ошибки. Адреса из written записаны предыдущими
+    пачками этого же файла: они уже посчитаны как повторы и не считаются обновленными
+    """
+    existing = dict(Client.objects.filter(email__in=batch).values_list('email', 'owner_id'))
+    clients = []
+    for email, (line, values) in batch.items():
+        if email in existing and existing[email] != owner.pk:
+            result.add_error(line, f'Клиент {email} уже добавлен другим пользователем')
+            continue
+        clients.append(Client(owner=owner, **values))
+
+    if not clients:
+        return
+
+    with transaction.atomic():
+        Client.objects.bulk_create(clients, update_conflicts=True, unique_fields=['email'],
+                                   update_fields=UPDATE_FIELDS)
+        created = sum(1 for client in clients if client.email not in existing)
+        # bulk_create не отправляет сигналы, поэтому счетчик клиентов на главной странице и версия кеша
+        # страниц владельца обновляются явно
+        stats.change_dashboard_counter('clients', created)
+        caching.bump_owner_version(owner.pk)
+
+    result.created += created
+    result.updated += sum(1 for client in clients if client.email in existing and client.email not in written)
+
+
+def import_clients(stream, owner, batch_size: int = None, delimiter: str = ',') -> ImportResult:
+    """
+    Импортирует клиентов из CSV с заголовком (email, first_name, last_name, middle_name, comment).
+    Строки с ошибками пропускаются и попадают в отчет с номером строки, остальные записываются пачками
+    :param stream: текстовый поток или итератор строк CSV
+    :param owner: пользователь, которому будут принадлежать клиенты
+    :param batch_size: сколько строк записывается одним запросом, по умолчанию CLIENT_IMPORT_BATCH_SIZE
+    :param delimiter: разделитель полей
+    :raises ValueError: если в заголовке нет обязательных колонок
+    """
+    batch_size = batch_size or settings.CLIENT_IMPORT_BATCH_SIZE
+    reader = csv.DictReader(stream, delimiter=delimiter)
+    missing = [name for name in REQUIRED_FIELDS if name not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f'В заголовке файла нет колонок: {", ".join(missing)}')
+
+    result = ImportResult()
+    batch = {}
+    written = set()
+    for row in reader:
+        try:
+            values = _clean_row(row)
+        except ValidationError as e:
+            result.add_error(reader.line_num, '; '.join(e.messages))
+            continue
+
+        if values['email'] in batch or values['email'] in written:
+            # записывается последняя строка с этим адресом, как и при повторном импорте
+            result.duplicates += 1
+        batch[values['email']] = (reader.line_num, values)
+
+        if len(batch) >= batch_size:
+            _save_batch(batch, owner, result, written)
+            written.update(batch)
+            batch = {}
+
+    if batch:
+        _save_batch(batch, owner, result, written)
+    return result
+
+
+def format_report(result: ImportResult) -> str:
+    """Текстовый отчет об импорте для письма владельцу"""
+    lines = [f'Добавлено: {result.created}, обновлено: {result.updated}, повторов в файле: {result.duplicates}, '
+             f'ошибок: {result.error_count}']
+    lines.extend(f'Строка {line}: {message}' for line, message in result.errors)
+    if result.error_count > len(result.errors):
+        lines.append(f'... и еще {result.error_count - len(result.errors)} ошибок')
+    return '\n'.join(lines)
@@ -0,0 +1,160 @@
+import smtplib
+import time
+from dataclasses import dataclass
+from functools import cached_property
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from main.models import Mailer, Client, MailingStatus
+from main.personalization import CompiledMessage, CLIENT_FIELDS
+
+# Ошибки, после которых соединение с SMTP сервером считается разорванным и открывается заново
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def describe_smtp_error(error: smtplib.SMTPException) -> tuple:
+    """
+    Возвращает код и текст ответа SMTP сервера из исключения smtplib
+    :return: кортеж (код ответа или None, текст ответа)
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        code, response = next(iter(error.recipients.values()))
+        return code, response.decode(errors='replace') if isinstance(response, bytes) else str(response)
+    if isinstance(error, smtplib.SMTPResponseException):
+        response = error.smtp_error
+        return error.smtp_code, response.decode(errors='replace') if isinstance(response, bytes) else str(response)
+    return None, str(error)
+
+
+class BatchMailSender:
+    """
+    Отправляет пачку писем через одно SMTP соединение вместо нового соединения (и TLS рукопожатия) на каждое письмо.
+    Разорванное соединение переоткрывается и письмо отправляется повторно, а после max_messages писем
+    соединение пересоздается, чтобы не упираться в ограничения почтового сервера на одну сессию.
+    Если передан rate_limiter, перед каждым письмом ожидается разрешение лимита отправки (см. main.ratelimit).
+    Соединение открывается при отправке первого письма, уже после получения разрешения: когда лимит исчерпан,
+    повтор задачи не открывает SMTP соединение и TLS сессию впустую.
+
+    Использование:
+        with BatchMailSender() as sender:
+            for message in messages:
+                sender.send(message)
+    """
+
+    def __init__(self, max_messages: int = None, connection_factory=get_connection, rate_limiter=None):
+        self.max_messages = max_messages or settings.MAILING_CONNECTION_MAX_MESSAGES
+        self.connection_factory = connection_factory
+        self.rate_limiter = rate_limiter
+        self.connection = None
+        self.sent_on_connection = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        self.connection = self.connection_factory()
+        self.connection.open()
+        self.sent_on_connection = 0
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except CONNECTION_ERRORS:
+                pass
+            self.connection = None
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
+    def send(self, message):
+        """
+        Отправляет одно письмо через текущее соединение, предварительно дождавшись разрешения лимита отправки.
+        Ошибки отправки самого письма (например, отклоненный адрес) пробрасываются вызывающему коду
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        if self.connection is None or self.sent_on_connection >= self.max_messages:
+            self.reconnect()
+
+        message.connection = self.connection
+        try:
+            self.connection.send_messages([message])
+        except CONNECTION_ERRORS:
+            # сервер мог закрыть простаивающее соединение, повторяем один раз через новое
+            self.reconnect()
+            message.connection = self.connection
+            self.connection.send_messages([message])
+        self.sent_on_connection += 1
+
+    def send_many(self, messages) -> int:
+        count = 0
+        for message in messages:
+            self.send(message)
+            count += 1
+        return count
+
+
+@dataclass
+class MailingContext:
+    """
+    Данные рассылки, нужные воркеру для отправки: письмо, статус и получатели.
+    Письмо и настройки загружаются одним запросом, список получателей - только при первом обращении
+    """
+    mailer_id: int
+    message_title: str
+    message_body: str
+    status_id: int
+    loaded_at: float
+
+    @cached_property
+    def message(self) -> CompiledMessage:
+        """Шаблон письма компилируется один раз и живет в кеше воркера вместе с контекстом"""
+        return CompiledMessage(self.mailer_id, self.message_title, self.message_body)
+
+    @cached_property
+    def recipient_ids(self) -> list:
+        return list(Client.objects.filter(mailer=self.mailer_id).order_by('pk').values_list('pk', flat=True))
+
+    def recipients(self, first_id: int, last_id: int):
+        """Получатели рассылки с pk в диапазоне [first_id, last_id] в порядке возрастания pk"""
+        return Client.objects.filter(mailer=self.mailer_id, pk__range=(first_id, last_id)).order_by('pk').only(
+            'pk', *CLIENT_FIELDS
+        )
+
+    def is_cancelled(self) -> bool:
+        """Статус всегда читается из базы, чтобы остановка рассылки была видна при следующей проверке"""
+        return not MailingStatus.objects.filter(pk=self.status_id, is_started=True).exists()
+
+
+# Кеш контекстов в памяти процесса воркера: пачки одной рассылки не перечитывают письмо из базы
+_context_cache = {}
+
+
+def get_mailing_context(mailer_id: int, refresh: bool = False) -> MailingContext:
+    """
+    Возвращает контекст рассылки из кеша воркера или загружает его одним запросом.
+    Запись кеша живет MAILING_CONTEXT_CACHE_SECONDS секунд, refresh=True загружает контекст заново
+    """
+    now = time.monotonic()
+    context = _context_cache.get(mailer_id)
+    if context is not None and not refresh and now - context.loaded_at < settings.MAILING_CONTEXT_CACHE_SECONDS:
+        return context
+
+    message_title, message_body, status_id = Mailer.objects.filter(pk=mailer_id).values_list(
+        'email_message__message_title', 'email_message__message_body', 'mailing_settings__mailing_status_id'
+    ).get()
+    context = MailingContext(mailer_id, message_title, message_body, status_id, loaded_at=now)
+
+    # устаревшие записи удаляются при каждой загрузке, чтобы кеш не рос вместе с количеством рассылок
+    for cached_id in [key for key, value in _context_cache.items()
+                      if now - value.loaded_at >= settings.MAILING_CONTEXT_CACHE_SECONDS]:
+        del _context_cache[cached_id]
+    _context_cache[mailer_id] = context
+    return context
@@ -0,0 +1,156 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import Client, EmailMessage, Mailer, MailingPeriod, MailingSettings, MailingStatus, MessageLog
+from users.models import User
+
+# Индексы миграции 0010_hot_path_indexes и одиночные индексы внешних ключей, которые были до нее
+NEW_INDEXES = [(model, index) for model in (Client, Mailer, MailingSettings, MailingStatus, MessageLog)
+               for index in model._meta.indexes]
+OLD_INDEXES = [
+    (Client, models.Index(fields=['owner'], name='bench_client_owner_idx')),
+    (Mailer, models.Index(fields=['owner'], name='bench_mailer_owner_idx')),
+    (MailingSettings, models.Index(fields=['owner'], name='bench_settings_owner_idx')),
+    (MessageLog, models.Index(fields=['mailer'], name='bench_messagelog_mailer_idx')),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает планы и время горячих запросов без составных индексов и с ними на сгенерированных данных. ' \
+           'Данные создаются в транзакции, которая откатывается в конце, поэтому база не меняется'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=50, help='Количество пользователей')
+        parser.add_argument('--clients', type=int, default=100000, help='Количество клиентов')
+        parser.add_argument('--logs', type=int, default=300000, help='Количество записей лога отправки')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз выполняется каждый запрос')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['owners'], options['clients'], options['logs'])
+                queries = self.hot_queries()
+
+                before = self.measure(queries, options['repeat'], indexes_enabled=False)
+                after = self.measure(queries, options['repeat'], indexes_enabled=True)
+                self.report(queries, before, after)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, owners: int, clients: int, logs: int):
+        started = time.perf_counter()
+        users = User.objects.bulk_create(User(email=f'bench-owner{number}@localhost') for number in range(owners))
+        Client.objects.bulk_create(
+            (Client(email=f'bench-client{number}@localhost', first_name='Имя', last_name='Фамилия',
+                    owner=users[number % owners]) for number in range(clients)),
+            batch_size=5000,
+        )
+
+        periods = MailingPeriod.objects.bulk_create(MailingPeriod(owner=user) for user in users)
+        # запущена примерно каждая двадцатая рассылка
+        statuses = MailingStatus.objects.bulk_create(
+            MailingStatus(is_started=number % 20 == 0) for number in range(owners * 40)
+        )
+        settings = MailingSettings.objects.bulk_create(
+            MailingSettings(mailing_date=datetime.date.today(), mailing_time=datetime.time(10),
+                            mailing_period=periods[number % owners], mailing_status=status,
+                            owner=users[number % owners])
+            for number, status in enumerate(statuses)
+        )
+        messages = EmailMessage.objects.bulk_create(
+            EmailMessage(message_title='Письмо', message_body='Текст', owner=user) for user in users
+        )
+        # у половины настроек есть рассылка, остальные свободны и предлагаются в форме рассылки
+        mailers = Mailer.objects.bulk_create(
+            Mailer(email_message=messages[number % owners], mailing_settings=mailing_settings,
+                   owner=users[number % owners])
+            for number, mailing_settings in enumerate(settings[::2])
+        )
+
+        now = timezone.now()
+        client_ids = list(Client.objects.filter(owner__in=users).values_list('pk', flat=True))
+        MessageLog.objects.bulk_create(
+            (MessageLog(mailer=random.choice(mailers), client_id=random.choice(client_ids), status=True,
+                        last_attempt=now - datetime.timedelta(minutes=random.randrange(60 * 24 * 180)))
+             for _ in range(logs)),
+            batch_size=5000,
+        )
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (Client, Mailer, MailingSettings, MailingStatus, MessageLog):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        self.owner = users[owners // 2]
+        self.mailer = mailers[len(mailers) // 2]
+        self.cursor = Client.objects.filter(owner=self.owner).order_by('pk').values_list('pk', flat=True)[
+            clients // owners // 2]
+        self.stdout.write(f'Данные созданы за {time.perf_counter() - started:.1f} с: пользователей {owners}, '
+                          f'клиентов {clients}, записей лога {logs}')
+
+    def hot_queries(self) -> list:
+        """Запросы с теми же условиями, что и в приложении: (название, функция, возвращающая queryset)"""
+        since = timezone.now() - datetime.timedelta(days=30)
+        return [
+            ('Страница клиентов владельца (курсорная пагинация)',
+             lambda: Client.objects.filter(owner=self.owner, pk__gt=self.cursor).order_by('pk')[:24]),
+            ('Свободные настройки в форме рассылки',
+             lambda: MailingSettings.objects.filter(Q(mailer__isnull=True), owner=self.owner)),
+            ('Активные рассылки (счетчик на главной)',
+             lambda: Mailer.objects.filter(mailing_settings__mailing_status__is_started=True).values('pk')),
+            ('Лог рассылки за 30 дней',
+             lambda: MessageLog.objects.filter(mailer=self.mailer, last_attempt__gte=since)),
+        ]
+
+    def set_indexes(self, enabled: bool):
+        """Оставляет в базе только новые или только старые индексы. DDL выполняется в той же транзакции"""
+        editor = connection.schema_editor()
+        drop, create = (OLD_INDEXES, NEW_INDEXES) if enabled else (NEW_INDEXES, OLD_INDEXES)
+        with connection.cursor() as cursor:
+            existing = {
+                model: connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for model in {model for model, _ in drop + create}
+            }
+            for model, index in drop:
+                if index.name in existing[model]:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+            for model, index in create:
+                if index.name not in existing[model]:
+                    cursor.execute(str(index.create_sql(model, editor)))
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+
+    def measure(self, queries: list, repeat: int, indexes_enabled: bool) -> dict:
+        self.set_indexes(indexes_enabled)
+        results = {}
+        for name, make_queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(make_queryset())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), make_queryset().explain())
+        return results
+
+    def report(self, queries: list, before: dict, after: dict):
+        for name, _ in queries:
+            before_ms, before_plan = before[name]
+            after_ms, after_plan = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(f'  без составных индексов: {before_ms:.2f} мс')
+            self.stdout.write('    ' + before_plan.replace('\n', '\n    '))
+            self.stdout.write(f'  с индексами: {after_ms:.2f} мс')
+            self.stdout.write('    ' + after_plan.replace('\n', '\n    '))
+            self.stdout.write(self.style.SUCCESS(f'  ускорение: x{before_ms / after_ms:.1f}'))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management import BaseCommand
+from django.template import Context, Template
+
+from main.models import Client
+from main.personalization import CompiledMessage
+
+TITLE = '{{ first_name }}, новости недели'
+BODY = 'Здравствуйте, {{ first_name }} {{ middle_name }}!\n\n' \
+       'Письмо отправлено на {{ email }}. ' + 'Текст письма рассылки. ' * 50 + '\n\n' \
+       'Отписаться: {{ unsubscribe_url }}'
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость персонализации писем (писем в секунду): разбор шаблона Django для каждого письма ' \
+           'против шаблона, скомпилированного один раз на запуск рассылки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Количество писем в замере')
+
+    def handle(self, *args, **options):
+        clients = [
+            Client(pk=number, email=f'client{number}@localhost', first_name=f'Имя{number}',
+                   last_name=f'Фамилия{number}', middle_name='Отчество')
+            for number in range(1, options['messages'] + 1)
+        ]
+
+        started = time.perf_counter()
+        for client in clients:
+            context = Context({'first_name': client.first_name, 'middle_name': client.middle_name,
+                               'email': client.email, 'unsubscribe_url': ''})
+            Template(TITLE).render(context)
+            Template(BODY).render(context)
+            Template(BODY.replace('\n', '<br>\n')).render(context)
+        per_message = len(clients) / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        message = CompiledMessage(1, TITLE, BODY)
+        for client in clients:
+            message.render(client)
+        compiled = len(clients) / (time.perf_counter() - started)
+
+        self.stdout.write(f'Писем в замере: {len(clients)} (тема, текст и HTML версия)')
+        self.stdout.write(f'Шаблон Django разбирается для каждого письма: {per_message:.0f} писем/с')
+        self.stdout.write(f'Шаблон скомпилирован один раз (со ссылкой отписки): {compiled:.0f} писем/с')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{compiled / per_message:.1f}'))
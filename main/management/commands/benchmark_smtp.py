@@ -0,0 +1,96 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management import BaseCommand
+
+from main.mailing import BatchMailSender
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP сервер-заглушка: принимает письма и ничего не отправляет.
+    Задержка приветствия имитирует стоимость установки соединения (TCP + TLS рукопожатие) у реального сервера
+    """
+
+    def reply(self, line: str):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        time.sleep(self.server.handshake_delay)
+        self.reply('220 localhost stand-in ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.received += 1
+                self.reply('250 OK queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay: float):
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.handshake_delay = handshake_delay
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость отправки писем (писем в секунду) на локальный SMTP сервер-заглушку: ' \
+           'новое соединение на каждое письмо против одного соединения на пачку'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Количество писем в замере')
+        parser.add_argument('--handshake-ms', type=float, default=30.0,
+                            help='Имитация задержки установки соединения, мс')
+        parser.add_argument('--max-messages', type=int, default=100,
+                            help='Количество писем на одно соединение до его пересоздания')
+
+    def handle(self, *args, **options):
+        server = SMTPStandInServer(options['handshake_ms'] / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+        def connection_factory():
+            return get_connection('django.core.mail.backends.smtp.EmailBackend', host=host, port=port,
+                                  username='', password='', use_tls=False, use_ssl=False)
+
+        def messages():
+            for number in range(options['messages']):
+                yield EmailMultiAlternatives(f'Письмо {number}', 'Текст письма', 'bench@localhost',
+                                             [f'client{number}@localhost'])
+
+        try:
+            started = time.perf_counter()
+            for message in messages():
+                message.connection = connection_factory()
+                message.send()
+            per_message = options['messages'] / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with BatchMailSender(max_messages=options['max_messages'], connection_factory=connection_factory) as sender:
+                sender.send_many(messages())
+            batched = options['messages'] / (time.perf_counter() - started)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f'Писем в замере: {options["messages"]}, принято сервером за оба замера: {server.received}')
+        self.stdout.write(f'Соединение на каждое письмо: {per_message:.1f} писем/с')
+        self.stdout.write(f'Одно соединение на {options["max_messages"]} писем: {batched:.1f} писем/с')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{batched / per_message:.1f}'))
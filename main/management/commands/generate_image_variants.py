@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from blog.models import Blog
+from main import images
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений, загруженных до появления копий (превью блога и аватары)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--overwrite', action='store_true', help='Создать копии заново')
+
+    def handle(self, *args, **options):
+        names = set(Blog.objects.exclude(preview='').exclude(preview=None).values_list('preview', flat=True))
+        names.update(User.objects.exclude(avatar='').exclude(avatar=None).values_list('avatar', flat=True))
+
+        created = 0
+        for name in sorted(names):
+            files = images.generate_variants(name, overwrite=options['overwrite'])
+            created += len(files)
+            if files:
+                self.stdout.write(f'{name}: {len(files)} копий')
+
+        self.stdout.write(self.style.SUCCESS(f'Изображений: {len(names)}, создано копий: {created}'))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from main import imports
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Импортирует клиентов из CSV файла (email, first_name, last_name, middle_name, comment)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV файлу')
+        parser.add_argument('--owner', required=True, help='Email пользователя, которому будут принадлежать клиенты')
+        parser.add_argument('--batch-size', type=int, help='Сколько строк записывать одним запросом')
+        parser.add_argument('--delimiter', default=',', help='Разделитель полей')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["owner"]} не найден')
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = imports.import_clients(stream, owner, options['batch_size'], options['delimiter'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for line, message in result.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... и еще {result.error_count - len(result.errors)} ошибок')
+
+        rows = result.created + result.updated + result.duplicates + result.error_count
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {result.created}, обновлено: {result.updated}, повторов в файле: {result.duplicates}, '
+            f'ошибок: {result.error_count} ({rows / elapsed:.0f} строк/с)'
+        ))
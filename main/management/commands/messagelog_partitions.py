@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from main import partitions
+
+
+class Command(BaseCommand):
+    help = 'Создает будущие помесячные партиции лога отправки и удаляет (или архивирует) партиции ' \
+           'старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.MESSAGELOG_PARTITIONS_AHEAD,
+                            help='На сколько месяцев вперед создавать партиции')
+        parser.add_argument('--retention-months', type=int, default=settings.MESSAGELOG_RETENTION_MONTHS,
+                            help='Сколько месяцев хранить логи')
+        parser.add_argument('--archive-dir', help='Перед удалением выгрузить партицию в сжатый CSV в эту папку')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported() or not partitions.is_partitioned():
+            raise CommandError('Таблица логов не секционирована: требуется PostgreSQL и миграция main.0009')
+
+        if options['dry_run']:
+            self.stdout.write(f'Существующие партиции: {", ".join(sorted(partitions.list_partitions().values()))}')
+        else:
+            for name in partitions.ensure_partitions(options['ahead']):
+                self.stdout.write(f'Создана партиция {name}')
+
+        for month, name in sorted(partitions.expired_partitions(options['retention_months']).items()):
+            if options['dry_run']:
+                self.stdout.write(f'Будет удалена партиция {name}')
+                continue
+
+            if options['archive_dir']:
+                path = partitions.archive_partition(name, options['archive_dir'])
+                self.stdout.write(f'Партиция {name} выгружена в {path}')
+            partitions.drop_partition(name)
+            self.stdout.write(self.style.SUCCESS(f'Удалена партиция {name}'))
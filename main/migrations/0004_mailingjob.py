@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_mailingperiod_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=50, unique=True, verbose_name='Идентификатор задачи Celery')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], default='queued', max_length=20, verbose_name='Статус')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего получателей')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Ошибок отправки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена в очередь')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последнее обновление')),
+                ('mailer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.mailer', verbose_name='Рассылка')),
+            ],
+            options={
+                'verbose_name': 'Задача рассылки',
+                'verbose_name_plural': 'Задачи рассылки',
+            },
+        ),
+    ]
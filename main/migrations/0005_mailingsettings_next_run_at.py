@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:05
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+from main import recurrence
+
+# Флаги периодичности модели MailingPeriod до появления поля frequency
+PERIOD_FLAGS = (recurrence.DAILY, recurrence.WEEKLY, recurrence.MONTHLY)
+
+
+def schedule_started_mailings(apps, schema_editor):
+    # Запущенные ранее рассылки ждали в sleep внутри воркера, теперь их запуск хранится в next_run_at.
+    # Повторения считаются тем же календарным правилом, что и в планировщике (ежемесячно - по календарным месяцам)
+    MailingSettings = apps.get_model('main', 'MailingSettings')
+    now = timezone.now()
+
+    for mailing_settings in MailingSettings.objects.filter(mailing_status__is_started=True).select_related('mailing_period'):
+        period = mailing_settings.mailing_period
+        frequency = next((name for name in PERIOD_FLAGS if period is not None and getattr(period, name)), None)
+        next_run_at = recurrence.next_occurrence(mailing_settings.mailing_date, mailing_settings.mailing_time,
+                                                 frequency, 1, now, inclusive=True)
+        # разовая рассылка, время которой уже прошло, запускается при первом тике планировщика
+        mailing_settings.next_run_at = next_run_at or timezone.make_aware(
+            datetime.datetime.combine(mailing_settings.mailing_date, mailing_settings.mailing_time)
+        )
+        mailing_settings.save(update_fields=['next_run_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_mailingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingjob',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Запланированное время запуска'),
+        ),
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Следующий запуск'),
+        ),
+        migrations.AlterField(
+            model_name='mailingjob',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Запланирована'), ('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], default='queued', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.RunPython(schedule_started_mailings, migrations.RunPython.noop),
+    ]
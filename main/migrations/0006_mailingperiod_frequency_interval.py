@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:06
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def copy_period_flags(apps, schema_editor):
+    MailingPeriod = apps.get_model('main', 'MailingPeriod')
+    for frequency in ('weekly', 'monthly'):
+        MailingPeriod.objects.filter(**{frequency: True}).update(frequency=frequency)
+    # периодичность без флагов означала разовую рассылку ("Периодичность не задана")
+    MailingPeriod.objects.filter(daily=False, weekly=False, monthly=False).update(frequency='once')
+
+
+def restore_period_flags(apps, schema_editor):
+    MailingPeriod = apps.get_model('main', 'MailingPeriod')
+    for frequency in ('daily', 'weekly', 'monthly'):
+        MailingPeriod.objects.filter(frequency=frequency).update(**{frequency: True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_mailingsettings_next_run_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingperiod',
+            name='frequency',
+            field=models.CharField(choices=[('daily', 'Ежедневно'), ('weekly', 'Еженедельно'), ('monthly', 'Ежемесячно')], default='daily', max_length=10, verbose_name='Периодичность'),
+        ),
+        migrations.AddField(
+            model_name='mailingperiod',
+            name='interval',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Количество дней, недель или месяцев между отправками', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Интервал'),
+        ),
+        migrations.RunPython(copy_period_flags, restore_period_flags),
+        migrations.RemoveField(
+            model_name='mailingperiod',
+            name='daily',
+        ),
+        migrations.RemoveField(
+            model_name='mailingperiod',
+            name='monthly',
+        ),
+        migrations.RemoveField(
+            model_name='mailingperiod',
+            name='weekly',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_mailingperiod_frequency_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.client', verbose_name='Получатель'),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='smtp_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Код ответа SMTP'),
+        ),
+        migrations.AlterField(
+            model_name='messagelog',
+            name='last_attempt',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата и время последней попытки'),
+        ),
+    ]
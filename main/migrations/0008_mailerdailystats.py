@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_daily_stats(apps, schema_editor):
+    MessageLog = apps.get_model('main', 'MessageLog')
+    MailerDailyStats = apps.get_model('main', 'MailerDailyStats')
+    rows = (
+        MessageLog.objects.filter(mailer__isnull=False)
+        .annotate(day=TruncDate('last_attempt'))
+        .values('mailer_id', 'day')
+        .annotate(sent=Count('pk', filter=Q(status=True)), failed=Count('pk', filter=Q(status=False)))
+    )
+    MailerDailyStats.objects.bulk_create(
+        (MailerDailyStats(mailer_id=row['mailer_id'], day=row['day'], sent=row['sent'], failed=row['failed'])
+         for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_messagelog_per_recipient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Ошибок отправки')),
+                ('mailer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.mailer', verbose_name='Рассылка')),
+            ],
+            options={
+                'verbose_name': 'Статистика рассылки за день',
+                'verbose_name_plural': 'Статистика рассылок по дням',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mailerdailystats',
+            constraint=models.UniqueConstraint(fields=('mailer', 'day'), name='unique_mailer_daily_stats'),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+import datetime
+
+from django.db import migrations
+
+TABLE = 'main_messagelog'
+SEQUENCE = f'{TABLE}_id_seq'
+MONTHS_AHEAD = 3
+
+
+def _add_months(day, months):
+    month_index = day.month - 1 + months
+    return datetime.date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_bounds(month):
+    return (datetime.datetime.combine(month, datetime.time(), tzinfo=datetime.timezone.utc),
+            datetime.datetime.combine(_add_months(month, 1), datetime.time(), tzinfo=datetime.timezone.utc))
+
+
+def _add_constraints(cursor, primary_key):
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})')
+    for column, target in (('mailer_id', 'main_mailer'), ('client_id', 'main_client')):
+        cursor.execute(f'CREATE INDEX {TABLE}_{column}_idx ON {TABLE} ({column})')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_{column}_fk FOREIGN KEY ({column}) '
+            f'REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+def _recreate_table(cursor, partition_clause=''):
+    """
+    Переименовывает текущую таблицу, создает на ее месте новую с теми же колонками и собственной
+    последовательностью для id. Возвращает имя старой таблицы, данные из которой нужно перенести
+    """
+    old_table = f'{TABLE}_old'
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old_table}')
+    cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old_table}) {partition_clause}')
+    cursor.execute(f'CREATE SEQUENCE {SEQUENCE}_new')
+    cursor.execute(f"SELECT setval('{SEQUENCE}_new', COALESCE((SELECT MAX(id) FROM {old_table}), 0) + 1, false)")
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}_new')")
+    return old_table
+
+
+def _move_rows(cursor, old_table):
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old_table}')
+    # Старая последовательность принадлежит старой таблице и удаляется вместе с ней
+    cursor.execute(f'ALTER SEQUENCE {SEQUENCE}_new OWNED BY NONE')
+    cursor.execute(f'DROP TABLE {old_table} CASCADE')
+    cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+    cursor.execute(f'ALTER SEQUENCE {SEQUENCE}_new RENAME TO {SEQUENCE}')
+    cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+
+
+def partition_messagelog(apps, schema_editor):
+    """
+    Превращает таблицу логов в секционированную по месяцам last_attempt. Первичный ключ секционированной таблицы
+    обязан включать ключ секционирования, поэтому он становится (id, last_attempt), для Django pk остается id
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(last_attempt) FROM {TABLE}')
+        oldest = cursor.fetchone()[0]
+        old_table = _recreate_table(cursor, 'PARTITION BY RANGE (last_attempt)')
+
+        today = datetime.date.today().replace(day=1)
+        month = (oldest.date() if oldest else today).replace(day=1)
+        while month <= _add_months(today, MONTHS_AHEAD):
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                _month_bounds(month),
+            )
+            month = _add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        _move_rows(cursor, old_table)
+        _add_constraints(cursor, 'id, last_attempt')
+
+
+def unpartition_messagelog(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        old_table = _recreate_table(cursor)
+        _move_rows(cursor, old_table)
+        _add_constraints(cursor, 'id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_mailerdailystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_messagelog, unpartition_messagelog),
+    ]
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Индексы внешних ключей, которые стали началом составных индексов и поэтому у полей стоит db_index=False:
+# (таблица, колонка)
+REDUNDANT_INDEXES = (
+    ('main_client', 'owner_id'),
+    ('main_mailer', 'owner_id'),
+    ('main_mailingsettings', 'owner_id'),
+    ('main_messagelog', 'mailer_id'),
+)
+
+
+def _column_indexes(schema_editor, table, column):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    return [
+        name for name, info in constraints.items()
+        if info['index'] and info['columns'] == [column]
+        and not (info['unique'] or info['primary_key'] or info['foreign_key'])
+    ]
+
+
+def drop_redundant_indexes(apps, schema_editor):
+    """
+    Удаляет одиночные индексы внешних ключей, найдя их по колонке: на PostgreSQL индекс лога отправки
+    пересоздан при секционировании под своим именем. AlterField с db_index=False удалил бы и заново создал
+    ограничения внешних ключей с проверкой всех строк, поэтому в базе удаляются только индексы
+    """
+    quote_name = schema_editor.quote_name
+    for table, column in REDUNDANT_INDEXES:
+        for name in _column_indexes(schema_editor, table, column):
+            schema_editor.execute(schema_editor.sql_delete_index % {'table': quote_name(table), 'name': quote_name(name)})
+
+
+def create_column_indexes(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    for table, column in REDUNDANT_INDEXES:
+        if not _column_indexes(schema_editor, table, column):
+            schema_editor.execute(
+                f'CREATE INDEX {quote_name(f"{table}_{column}_idx")} ON {quote_name(table)} ({quote_name(column)})'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0009_partition_messagelog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['owner', 'id'], name='client_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailer',
+            index=models.Index(fields=['owner', 'id'], name='mailer_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingsettings',
+            index=models.Index(fields=['owner', 'id'], name='mailingsettings_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingstatus',
+            index=models.Index(condition=models.Q(('is_started', True)), fields=['id'], name='mailingstatus_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['mailer', 'last_attempt'], name='messagelog_mailer_attempt_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(drop_redundant_indexes, create_column_indexes),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='client',
+                    name='owner',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+                ),
+                migrations.AlterField(
+                    model_name='mailer',
+                    name='owner',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+                ),
+                migrations.AlterField(
+                    model_name='mailingsettings',
+                    name='owner',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+                ),
+                migrations.AlterField(
+                    model_name='messagelog',
+                    name='mailer',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.mailer', verbose_name='Рассылка'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailingperiod',
+            name='frequency',
+            field=models.CharField(choices=[('once', 'Однократно'), ('daily', 'Ежедневно'), ('weekly', 'Еженедельно'), ('monthly', 'Ежемесячно')], default='daily', max_length=10, verbose_name='Периодичность'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.safestring import mark_safe
+
+from main import caching
+
+
+class OwnerObjectMixin:
+    """
+    Для DetailView, UpdateView и DeleteView: объект выбирается одним запросом сразу с условием на владельца
+    (сотрудник видит все записи) и со связанными записями, а затем запоминается на время запроса.
+    Чужая или несуществующая запись дает 404, без отдельной загрузки владельца для сравнения
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().for_user(self.request.user)
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_owned_object'):
+            self._owned_object = super().get_object()
+        return self._owned_object
+
+
+class FragmentCacheMixin:
+    """
+    Для ListView, список которого в шаблоне закеширован тегом
+    {% cache fragment_timeout <fragment_name> user.pk cache_version request.GET.after request.GET.before %}.
+    Фрагмент читается из кеша один раз, в представлении, и передается в шаблон переменной cached_fragment:
+    шаблон выводит ее вместо тега {% cache %}, а список не запрашивается из базы - страница строится из пустого
+    queryset, для которого Django не выполняет запрос. Если фрагмента нет, тег {% cache %} рендерит список
+    и сохраняет его. Ставится перед миксином пагинации
+    """
+    fragment_name = None
+
+    def load_cache_version(self) -> str:
+        return caching.get_user_version(self.request.user)
+
+    def get_cache_version(self) -> str:
+        if not hasattr(self, '_cache_version'):
+            self._cache_version = self.load_cache_version()
+        return self._cache_version
+
+    def get_fragment_vary_on(self) -> list:
+        """Значения vary_on в том же порядке, что и в теге {% cache %} шаблона"""
+        return [self.request.user.pk, self.get_cache_version(),
+                self.request.GET.get('after', ''), self.request.GET.get('before', '')]
+
+    def get_cached_fragment(self):
+        """HTML фрагмента из кеша или None, если его нет"""
+        if not hasattr(self, '_cached_fragment'):
+            fragment = cache.get(make_template_fragment_key(self.fragment_name, self.get_fragment_vary_on()))
+            self._cached_fragment = mark_safe(fragment) if fragment is not None else None
+        return self._cached_fragment
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_cached_fragment() is not None:
+            queryset = queryset.none()
+        return super().paginate_queryset(queryset, page_size)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cached_fragment'] = self.get_cached_fragment()
+        context['cache_version'] = self.get_cache_version()
+        context['fragment_timeout'] = settings.FRAGMENT_CACHE_TIMEOUT
+        return context
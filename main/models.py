@@ -1,16 +1,61 @@
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Count
+from django.utils import timezone
+from pytils.numeral import get_plural
 
+from main import recurrence
 from users.models import User
 
 NULLABLE = {'blank': True, 'null': True}
 
 
+class OwnedQuerySet(models.QuerySet):
+    """
+    Выборка записей, у которых есть владелец. Связанные записи, которые выводятся на страницах списков и деталей,
+    загружаются заранее (select_related_fields одним JOIN, prefetch_related_fields отдельным запросом на всю
+    страницу), поэтому количество запросов не зависит от количества записей
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    def for_user(self, user):
+        """Записи, доступные пользователю: сотрудник видит все, остальные - только свои"""
+        queryset = self if user.is_staff else self.filter(owner=user)
+        return queryset.with_related()
+
+    def with_related(self):
+        queryset = self
+        if self.select_related_fields:
+            queryset = queryset.select_related(*self.select_related_fields)
+        if self.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*self.prefetch_related_fields)
+        return queryset
+
+
+class MailingSettingsQuerySet(OwnedQuerySet):
+    select_related_fields = ('mailing_period', 'mailing_status')
+
+
+class MailerQuerySet(OwnedQuerySet):
+    select_related_fields = ('email_message', 'mailing_settings__mailing_period', 'mailing_settings__mailing_status')
+
+    def with_related(self):
+        """
+        Клиенты рассылки не загружаются: их могут быть сотни тысяч на одну рассылку, поэтому в карточки
+        передается только их количество client_count, посчитанное в том же запросе
+        """
+        return super().with_related().annotate(client_count=Count('clients'))
+
+
 class EmailMessage(models.Model):
     message_title = models.CharField(max_length=250, verbose_name='Тема письма')
     message_body = models.TextField(verbose_name='Тело письма')
 
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', **NULLABLE)
 
+    objects = OwnedQuerySet.as_manager()
+
     def __str__(self):
         return self.message_title
 
@@ -28,7 +73,10 @@ class Client(models.Model):
 
     comment = models.TextField(verbose_name='Комментарий', **NULLABLE)
 
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', **NULLABLE)
+    # индекс по владельцу - первая колонка составного индекса (owner, id) в Meta.indexes
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', db_index=False, **NULLABLE)
+
+    objects = OwnedQuerySet.as_manager()
 
     def __str__(self):
         return f'Клиент: {self.last_name} {self.first_name}, email: {self.email}'
@@ -36,24 +84,32 @@ class Client(models.Model):
     class Meta:
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
+        indexes = [
+            # список клиентов владельца с курсорной пагинацией: WHERE owner_id = X AND id > Y ORDER BY id
+            models.Index(fields=('owner', 'id'), name='client_owner_id_idx'),
+        ]
 
 
 class MailingPeriod(models.Model):
-    daily = models.BooleanField(default=False, verbose_name='Ежедневно')
-    weekly = models.BooleanField(default=False, verbose_name='Еженедельно')
-    monthly = models.BooleanField(default=False, verbose_name='Ежемесячно')
+    frequency = models.CharField(max_length=10, choices=recurrence.FREQUENCY_CHOICES, default=recurrence.DAILY,
+                                 verbose_name='Периодичность')
+    interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)],
+                                                verbose_name='Интервал',
+                                                help_text='Количество дней, недель или месяцев между отправками')
 
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', **NULLABLE)
 
+    objects = OwnedQuerySet.as_manager()
+
     def __str__(self):
-        if self.daily:
-            return 'Периодичность рассылки: ежедневно'
-        elif self.weekly:
-            return 'Периодичность рассылки: еженедельно'
-        elif self.monthly:
-            return 'Периодичность рассылки: ежемесячно'
-        else:
-            return 'Периодичность не задана'
+        if self.frequency == recurrence.ONCE or self.interval == 1:
+            return f'Периодичность рассылки: {self.get_frequency_display().lower()}'
+        units = {
+            recurrence.DAILY: ('день', 'дня', 'дней'),
+            recurrence.WEEKLY: ('неделю', 'недели', 'недель'),
+            recurrence.MONTHLY: ('месяц', 'месяца', 'месяцев'),
+        }
+        return f'Периодичность рассылки: раз в {get_plural(self.interval, units[self.frequency])}'
 
     class Meta:
         verbose_name = 'Периодичность'
@@ -78,6 +134,11 @@ class MailingStatus(models.Model):
     class Meta:
         verbose_name = 'Статус рассылки'
         verbose_name_plural = 'Статусы рассылки'
+        indexes = [
+            # частичный индекс только по запущенным рассылкам: их немного по сравнению со всеми статусами,
+            # а именно они нужны планировщику, счетчику активных рассылок и проверке остановки во время отправки
+            models.Index(fields=('id',), condition=models.Q(is_started=True), name='mailingstatus_started_idx'),
+        ]
 
 
 class MailingSettings(models.Model):
@@ -85,8 +146,11 @@ class MailingSettings(models.Model):
     mailing_time = models.TimeField(verbose_name='Время для рассылки')
     mailing_period = models.ForeignKey(MailingPeriod, on_delete=models.CASCADE, verbose_name='Периодичность рассылки')
     mailing_status = models.ForeignKey(MailingStatus, on_delete=models.CASCADE, verbose_name='Статус рассылки')
+    next_run_at = models.DateTimeField(db_index=True, verbose_name='Следующий запуск', **NULLABLE)
 
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', **NULLABLE)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', db_index=False, **NULLABLE)
+
+    objects = MailingSettingsQuerySet.as_manager()
 
     def __str__(self):
         return f'Время рассылки: {self.mailing_time}, периодичность: {self.mailing_period}, статус: {self.mailing_status}'
@@ -94,6 +158,11 @@ class MailingSettings(models.Model):
     class Meta:
         verbose_name = 'Настройки рассылки'
         verbose_name_plural = 'Настройки рассылок'
+        indexes = [
+            # списки и выбор свободных настроек в форме рассылки (владелец + отсутствие рассылки, которое
+            # проверяется по индексу main_mailer.mailing_settings_id)
+            models.Index(fields=('owner', 'id'), name='mailingsettings_owner_id_idx'),
+        ]
 
 
 class Mailer(models.Model):
@@ -101,24 +170,34 @@ class Mailer(models.Model):
     clients = models.ManyToManyField(Client, verbose_name='Клиенты')
     mailing_settings = models.ForeignKey(MailingSettings, on_delete=models.CASCADE, verbose_name='Настройки рассылки')
 
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', **NULLABLE)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Владелец', db_index=False, **NULLABLE)
+
+    objects = MailerQuerySet.as_manager()
 
     def __str__(self):
-        client_emails = ', '.join([client.email for client in self.clients.all()])
-        return f'Клиенты: {client_emails}, Письмо: {self.email_message.message_title}, ' \
+        client_count = getattr(self, 'client_count', None)
+        if client_count is None:
+            client_count = self.clients.count()
+        return f'Клиентов: {client_count}, Письмо: {self.email_message.message_title}, ' \
                f'{self.mailing_settings.mailing_period}, ' \
                f'Дата и время начала рассылки: {self.mailing_settings.mailing_date} {self.mailing_settings.mailing_time}'
 
     class Meta:
         verbose_name = 'Рассылка'
         verbose_name_plural = 'Рассылки'
+        indexes = [
+            models.Index(fields=('owner', 'id'), name='mailer_owner_id_idx'),
+        ]
 
 
 class MessageLog(models.Model):
-    last_attempt = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время последней попытки')
+    last_attempt = models.DateTimeField(default=timezone.now, verbose_name='Дата и время последней попытки')
     status = models.BooleanField(default=False, verbose_name='Статус отправки')
+    smtp_code = models.PositiveSmallIntegerField(verbose_name='Код ответа SMTP', **NULLABLE)
     server_response = models.TextField(verbose_name='Ответ почтового сервера', **NULLABLE)
-    mailer = models.ForeignKey(Mailer, on_delete=models.CASCADE, verbose_name='Рассылка', **NULLABLE)
+    # индекс по рассылке - первая колонка составного индекса (mailer, last_attempt) в Meta.indexes
+    mailer = models.ForeignKey(Mailer, on_delete=models.CASCADE, verbose_name='Рассылка', db_index=False, **NULLABLE)
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, verbose_name='Получатель', **NULLABLE)
 
     def __str__(self):
         return f'время попытки: {self.last_attempt}, статус {self.status}'
@@ -126,3 +205,74 @@ class MessageLog(models.Model):
     class Meta:
         verbose_name = 'Лог'
         verbose_name_plural = 'Логи'
+        indexes = [
+            # лог рассылки за период (выгрузка, статистика): WHERE mailer_id = X AND last_attempt >= Y
+            models.Index(fields=('mailer', 'last_attempt'), name='messagelog_mailer_attempt_idx'),
+        ]
+
+
+class MailingJob(models.Model):
+    STATUS_SCHEDULED = 'scheduled'
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+
+    STATUS_CHOICES = (
+        (STATUS_SCHEDULED, 'Запланирована'),
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_CANCELLED, 'Отменена'),
+    )
+
+    mailer = models.ForeignKey(Mailer, on_delete=models.CASCADE, verbose_name='Рассылка')
+    task_id = models.CharField(max_length=50, unique=True, verbose_name='Идентификатор задачи Celery')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='Статус')
+    scheduled_at = models.DateTimeField(verbose_name='Запланированное время запуска', **NULLABLE)
+
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего получателей')
+    sent = models.PositiveIntegerField(default=0, verbose_name='Отправлено')
+    failed = models.PositiveIntegerField(default=0, verbose_name='Ошибок отправки')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлена в очередь')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Последнее обновление')
+
+    def __str__(self):
+        return f'Задача {self.task_id}: {self.get_status_display()}'
+
+    def get_counts(self) -> dict:
+        """
+        Возвращает количество писем по состояниям: ожидающие в очереди, отправляемые в данный момент,
+        отправленные и неотправленные. Ожидающие письма считаются "в очереди", пока задача не взята воркером
+        """
+        pending = max(self.total - self.sent - self.failed, 0)
+        return {
+            'queued': pending if self.status in (self.STATUS_SCHEDULED, self.STATUS_QUEUED) else 0,
+            'running': pending if self.status == self.STATUS_RUNNING else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+        }
+
+    class Meta:
+        verbose_name = 'Задача рассылки'
+        verbose_name_plural = 'Задачи рассылки'
+
+
+class MailerDailyStats(models.Model):
+    mailer = models.ForeignKey(Mailer, on_delete=models.CASCADE, verbose_name='Рассылка')
+    day = models.DateField(verbose_name='День')
+    sent = models.PositiveIntegerField(default=0, verbose_name='Отправлено')
+    failed = models.PositiveIntegerField(default=0, verbose_name='Ошибок отправки')
+
+    def __str__(self):
+        return f'{self.day}: отправлено {self.sent}, ошибок {self.failed}'
+
+    class Meta:
+        verbose_name = 'Статистика рассылки за день'
+        verbose_name_plural = 'Статистика рассылок по дням'
+        constraints = [
+            models.UniqueConstraint(fields=('mailer', 'day'), name='unique_mailer_daily_stats'),
+        ]
@@ -0,0 +1,74 @@
+from django.http import Http404
+
+
+class KeysetPage:
+    """
+    Страница курсорной пагинации. В отличие от Page из django.core.paginator не знает общего количества записей
+    и номера страницы, зато не требует COUNT(*) и OFFSET
+    """
+
+    def __init__(self, object_list: list, has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        # курсоры соседних страниц берутся из записей страницы: у пустой страницы (курсор за пределами списка)
+        # ссылок на соседние страницы нет
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.object_list else None
+
+
+class KeysetPaginationMixin:
+    """
+    Курсорная (keyset) пагинация для ListView по возрастанию pk.
+    Следующая страница запрашивается параметром ?after=<pk последней записи>, предыдущая - ?before=<pk первой записи>,
+    поэтому любая страница выбирается одним запросом WHERE pk > X ORDER BY pk LIMIT N по индексу первичного ключа,
+    и ее стоимость не зависит от того, насколько далеко она от начала списка
+    """
+    paginate_by = 24
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self._get_cursor('after')
+        before = self._get_cursor('before')
+
+        if before is not None:
+            object_list = list(queryset.filter(pk__lt=before).order_by('-pk')[:page_size + 1])
+            has_previous = len(object_list) > page_size
+            page = KeysetPage(object_list[:page_size][::-1], has_next=True, has_previous=has_previous)
+        else:
+            if after is not None:
+                queryset = queryset.filter(pk__gt=after)
+            object_list = list(queryset.order_by('pk')[:page_size + 1])
+            has_next = len(object_list) > page_size
+            page = KeysetPage(object_list[:page_size], has_next=has_next, has_previous=after is not None)
+
+        return None, page, page.object_list, page.has_other_pages()
+
+    def _get_cursor(self, name: str):
+        value = self.request.GET.get(name)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise Http404('Некорректный параметр страницы')
@@ -0,0 +1,155 @@
+"""
+Помесячные партиции таблицы логов отправки (PostgreSQL, секционирование по диапазону last_attempt).
+
+Партиции называются <таблица>_pГГГГММ, например main_messagelog_p202401. Новые партиции создаются заранее,
+а партиции старше срока хранения целиком удаляются (DROP TABLE вместо DELETE по сотням миллионов строк)
+или предварительно выгружаются в архив.
+"""
+import datetime
+import gzip
+import logging
+import os
+import re
+
+from django.db import connection, transaction
+
+from main.models import MessageLog
+
+TABLE = MessageLog._meta.db_table
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+# Партиция для строк, месяц которых еще не создан (создается миграцией main.0009)
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+logger = logging.getLogger(__name__)
+
+
+def is_supported() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.month - 1 + months
+    return datetime.date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> dict:
+    """
+    Возвращает помесячные партиции таблицы логов
+    :return: словарь {первое число месяца: имя партиции}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def month_bounds(month: datetime.date) -> tuple:
+    return (datetime.datetime.combine(month, datetime.time(), tzinfo=datetime.timezone.utc),
+            datetime.datetime.combine(add_months(month, 1), datetime.time(), tzinfo=datetime.timezone.utc))
+
+
+def _default_partition_rows_exist(cursor, bounds: tuple) -> bool:
+    cursor.execute('SELECT to_regclass(%s)', [DEFAULT_PARTITION])
+    if cursor.fetchone()[0] is None:
+        return False
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE last_attempt >= %s AND last_attempt < %s)',
+        bounds,
+    )
+    return cursor.fetchone()[0]
+
+
+def create_partition(month: datetime.date):
+    """
+    Создает партицию месяца. Если задача обслуживания не запускалась дольше MESSAGELOG_PARTITIONS_AHEAD месяцев,
+    строки этого месяца уже лежат в партиции по умолчанию, и PostgreSQL не даст создать партицию поверх них.
+    Тогда в одной транзакции партиция по умолчанию отсоединяется, строки месяца переносятся из нее в новую
+    партицию, и она присоединяется обратно. На время переноса вставки в таблицу логов ждут блокировку
+    """
+    name = partition_name(month)
+    bounds = month_bounds(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not _default_partition_rows_exist(cursor, bounds):
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                           bounds)
+            return name
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"')
+        cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)', bounds)
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE last_attempt >= %s AND last_attempt < %s '
+            f'RETURNING *) INSERT INTO "{name}" SELECT * FROM moved',
+            bounds,
+        )
+        moved = cursor.rowcount
+        cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+
+    logger.warning('Партиция %s создана после того, как логи за этот месяц начали записываться в %s: '
+                   'перенесено строк: %s. Проверьте, что задача maintain_messagelog_partitions запускается',
+                   name, DEFAULT_PARTITION, moved)
+    return name
+
+
+def ensure_partitions(months_ahead: int, today: datetime.date = None) -> list:
+    """
+    Создает партиции текущего месяца и months_ahead следующих, чтобы новые логи не попадали в партицию по умолчанию
+    :return: список имен созданных партиций
+    """
+    current = month_start(today or datetime.date.today())
+    existing = list_partitions()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(month))
+    return created
+
+
+def expired_partitions(retention_months: int, today: datetime.date = None) -> dict:
+    """Партиции, все строки которых старше срока хранения"""
+    oldest_kept = add_months(month_start(today or datetime.date.today()), -retention_months)
+    return {month: name for month, name in list_partitions().items() if month < oldest_kept}
+
+
+def archive_partition(name: str, directory: str) -> str:
+    """Выгружает партицию в сжатый CSV файл и возвращает путь к нему"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.csv.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as archive, connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH CSV HEADER', archive)
+    return path
+
+
+def drop_partition(name: str):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
@@ -0,0 +1,114 @@
+"""
+Персонализация писем рассылки.
+
+В теме и тексте письма можно использовать подстановки {{ first_name }}, {{ last_name }}, {{ middle_name }},
+{{ email }} и {{ unsubscribe_url }}. Шаблон разбирается регулярным выражением один раз на запуск рассылки
+(и хранится в кеше контекста воркера), а для каждого получателя остается только склеить готовые части
+со значениями полей клиента. Неизвестные подстановки остаются в тексте как есть, а выполнить произвольный код
+шаблонизатора автор письма не может.
+"""
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.html import escape
+
+PLACEHOLDER_RE = re.compile(r'{{\s*(\w+)\s*}}')
+CLIENT_FIELDS = ('first_name', 'last_name', 'middle_name', 'email')
+FIELDS = CLIENT_FIELDS + ('unsubscribe_url',)
+
+UNSUBSCRIBE_SALT = 'main.unsubscribe'
+
+
+_signer = signing.Signer(salt=UNSUBSCRIBE_SALT)
+
+
+def make_unsubscribe_token(mailer_id: int, client_id: int) -> str:
+    return _signer.sign(f'{mailer_id}-{client_id}')
+
+
+def read_unsubscribe_token(token: str) -> tuple:
+    """
+    :return: (pk рассылки, pk клиента)
+    :raises signing.BadSignature: если ссылка подделана или повреждена
+    """
+    mailer_id, client_id = _signer.unsign(token).split('-')
+    return int(mailer_id), int(client_id)
+
+
+def unsubscribe_url(mailer_id: int, client_id: int) -> str:
+    path = reverse('main:unsubscribe', args=[make_unsubscribe_token(mailer_id, client_id)])
+    return f'{settings.SITE_URL.rstrip("/")}{path}'
+
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный на готовые куски текста и имена полей между ними
+    :param source: текст шаблона
+    :param html: для HTML версии письма - экранировать текст и значения полей, переводить строки в <br>
+                 и выводить ссылку отписки тегом <a>
+    """
+
+    def __init__(self, source: str, html: bool = False):
+        self.html = html
+        self.texts = []
+        self.fields = []
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(source):
+            if match[1] not in FIELDS:
+                # неизвестная подстановка остается частью текста
+                continue
+            self.texts.append(source[position:match.start()])
+            self.fields.append(match[1])
+            position = match.end()
+        self.texts.append(source[position:])
+
+        if html:
+            self.texts = [escape(text).replace('\n', '<br>\n') for text in self.texts]
+
+    def render(self, values: dict) -> str:
+        parts = [self.texts[0]]
+        for field, text in zip(self.fields, self.texts[1:]):
+            value = values.get(field) or ''
+            if self.html:
+                value = escape(value)
+                if field == 'unsubscribe_url':
+                    value = f'<a href="{value}">{value}</a>'
+            parts.append(value)
+            parts.append(text)
+        return ''.join(parts)
+
+
+class CompiledMessage:
+    """
+    Тема, текст и HTML версия письма рассылки, скомпилированные один раз.
+    Если в тексте нет ссылки отписки, она добавляется в конец письма
+    """
+
+    def __init__(self, mailer_id: int, title: str, body: str):
+        if 'unsubscribe_url' not in PLACEHOLDER_RE.findall(body):
+            body = f'{body}\n\nОтписаться от рассылки: {{{{ unsubscribe_url }}}}'
+        self.mailer_id = mailer_id
+        self.subject = CompiledTemplate(' '.join(title.splitlines()))
+        self.text = CompiledTemplate(body)
+        self.html = CompiledTemplate(body, html=True)
+        # адрес страницы отписки вычисляется один раз, для получателя подставляется только подписанный токен
+        self.unsubscribe_prefix, self.unsubscribe_suffix = unsubscribe_url(0, 0).split(make_unsubscribe_token(0, 0))
+
+    def render(self, client) -> dict:
+        """
+        Подставляет данные получателя
+        :param client: клиент с загруженными полями first_name, last_name, middle_name и email
+        :return: словарь с ключами subject, text, html и unsubscribe_url
+        """
+        values = {name: getattr(client, name) for name in CLIENT_FIELDS}
+        values['unsubscribe_url'] = (self.unsubscribe_prefix + make_unsubscribe_token(self.mailer_id, client.pk)
+                                     + self.unsubscribe_suffix)
+
+        return {
+            'subject': self.subject.render(values),
+            'text': self.text.render(values),
+            'html': self.html.render(values),
+            'unsubscribe_url': values['unsubscribe_url'],
+        }
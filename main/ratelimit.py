@@ -0,0 +1,113 @@
+"""
+Ограничение скорости отправки писем через один SMTP сервер (token bucket в Redis).
+
+Почтовые сервисы ограничивают количество писем с одного аккаунта в минуту и в сутки. Счетчики хранятся в Redis,
+поэтому лимит общий для всех воркеров Celery: каждый воркер перед отправкой письма забирает жетон из всех корзин
+аккаунта одним атомарным Lua скриптом, а если жетонов нет - получает время, через которое они появятся.
+"""
+import time
+
+import redis
+from django.conf import settings
+
+from config.redis_client import get_redis_client
+
+# KEYS - корзины, ARGV - количество запрашиваемых жетонов и пары (емкость, скорость пополнения в секунду).
+# Жетоны забираются только если их хватает во всех корзинах, иначе возвращается время ожидания в секундах.
+# Время берется с сервера Redis, чтобы расхождение часов воркеров не влияло на пополнение.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local requested = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated_at) * rate)
+    tokens[i] = available
+    if available < requested then
+        wait = math.max(wait, (requested - available) / rate)
+    end
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tokens[i] - requested, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Жетоны появятся не раньше, чем через retry_after секунд - задаче выгоднее освободить воркер"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'Лимит отправки исчерпан, повторить через {retry_after:.0f} с')
+        self.retry_after = retry_after
+
+
+class SmtpRateLimiter:
+    """
+    Лимит отправки для одного SMTP аккаунта: корзина на минуту и корзина на сутки.
+    Без Redis (локальная разработка, тесты) или при нулевых лимитах ограничение не действует
+    """
+
+    def __init__(self, account: str = None, per_minute: int = None, per_day: int = None, client=None):
+        self.account = account or f'{settings.EMAIL_HOST}:{settings.EMAIL_HOST_USER}'
+        per_minute = settings.MAILING_RATE_LIMIT_PER_MINUTE if per_minute is None else per_minute
+        per_day = settings.MAILING_RATE_LIMIT_PER_DAY if per_day is None else per_day
+        # (имя корзины, емкость, пополнение в секунду)
+        self.buckets = [
+            (name, limit, limit / period)
+            for name, limit, period in (('minute', per_minute, 60), ('day', per_day, 60 * 60 * 24))
+            if limit
+        ]
+        self.client = client if client is not None else get_redis_client()
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT) if self.client is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.script is not None and bool(self.buckets)
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        Забирает жетоны, если они есть во всех корзинах
+        :return: 0, если жетоны получены, иначе через сколько секунд их будет достаточно
+        """
+        if not self.enabled:
+            return 0
+
+        keys = [f'ratelimit:smtp:{self.account}:{name}' for name, _, _ in self.buckets]
+        args = [tokens]
+        for _, capacity, rate in self.buckets:
+            args.extend((capacity, rate))
+        try:
+            return float(self.script(keys=keys, args=args))
+        except redis.RedisError:
+            # недоступность Redis не должна останавливать рассылку, лимит сервера все равно ответит ошибкой
+            return 0
+
+    def acquire(self, tokens: int = 1, max_wait: float = None):
+        """
+        Ждет жетоны, пока ожидание не длиннее max_wait секунд
+        :raises RateLimitExceeded: если жетонов придется ждать дольше max_wait
+        """
+        max_wait = settings.MAILING_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            if wait > max_wait:
+                raise RateLimitExceeded(wait)
+            time.sleep(wait)
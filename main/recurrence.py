@@ -0,0 +1,126 @@
+"""
+Расчет времени повторных запусков рассылки по календарю.
+
+Повторения считаются в местном времени сервера (settings.TIME_ZONE): ежедневная рассылка в 10:00 приходит в 10:00
+и до, и после перехода на летнее время, а ежемесячная рассылка, начатая 31 января, приходит в последний день
+февраля и снова 31 марта. Каждое повторение вычисляется от даты начала, а не от предыдущего запуска,
+поэтому сдвиги не накапливаются.
+"""
+import calendar
+import datetime
+
+from django.utils import timezone
+
+ONCE = 'once'
+DAILY = 'daily'
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+
+FREQUENCY_CHOICES = (
+    (ONCE, 'Однократно'),
+    (DAILY, 'Ежедневно'),
+    (WEEKLY, 'Еженедельно'),
+    (MONTHLY, 'Ежемесячно'),
+)
+
+_STEP_DAYS = {DAILY: 1, WEEKLY: 7}
+
+
+def _localize(wall_time: datetime.datetime, tz) -> datetime.datetime:
+    """
+    Переводит местное время в aware datetime. Несуществующее время (час, пропущенный при переходе на летнее время)
+    сдвигается вперед на величину перехода, из неоднозначного (повторяющийся час осенью) берется первое
+    """
+    aware = wall_time.replace(tzinfo=tz, fold=0)
+    return aware.astimezone(datetime.timezone.utc).astimezone(tz)
+
+
+def _add_months(wall_time: datetime.datetime, months: int) -> datetime.datetime:
+    month_index = wall_time.month - 1 + months
+    year = wall_time.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(wall_time.day, calendar.monthrange(year, month)[1])
+    return wall_time.replace(year=year, month=month, day=day)
+
+
+def occurrence(start: datetime.datetime, frequency: str, interval: int, index: int, tz) -> datetime.datetime:
+    """
+    Возвращает index-й запуск (начиная с нуля) повторения
+    :param start: местное (naive) время первого запуска
+    :param frequency: единица периода - DAILY, WEEKLY или MONTHLY
+    :param interval: количество единиц между запусками
+    :param index: номер запуска
+    :param tz: часовой пояс, в котором задано время запуска
+    """
+    if frequency == MONTHLY:
+        return _localize(_add_months(start, index * interval), tz)
+    return _localize(start + datetime.timedelta(days=index * interval * _STEP_DAYS[frequency]), tz)
+
+
+def next_occurrence(start_date: datetime.date,
+                    start_time: datetime.time,
+                    frequency: str | None,
+                    interval: int,
+                    after: datetime.datetime,
+                    inclusive: bool = False,
+                    tz=None) -> datetime.datetime | None:
+    """
+    Возвращает первый запуск позже after (или не раньше, если inclusive=True).
+    Номер запуска вычисляется по разнице дат, поэтому время расчета не зависит от того, как давно началась рассылка
+    :param start_date: дата начала рассылки
+    :param start_time: время рассылки
+    :param frequency: единица периода, ONCE или None для разовой рассылки
+    :param interval: количество единиц между запусками
+    :param after: aware datetime, после которого ищется запуск
+    :param inclusive: считать ли запуск, совпадающий с after
+    :param tz: часовой пояс расчета, по умолчанию часовой пояс сервера
+    :return: aware datetime или None, если разовая рассылка уже прошла
+    """
+    tz = tz or timezone.get_default_timezone()
+    start = datetime.datetime.combine(start_date, start_time)
+
+    def is_next(candidate):
+        return candidate >= after if inclusive else candidate > after
+
+    first = _localize(start, tz)
+    if is_next(first):
+        return first
+    if frequency in (None, ONCE):
+        return None
+
+    interval = max(interval, 1)
+    after_local = after.astimezone(tz)
+    if frequency == MONTHLY:
+        months_passed = (after_local.year - start.year) * 12 + after_local.month - start.month
+        index = max(months_passed // interval, 0)
+    else:
+        days_passed = (after_local.date() - start.date()).days
+        index = max(days_passed // (interval * _STEP_DAYS[frequency]), 0)
+
+    # оценка по датам отстает от нужного запуска не больше чем на один-два шага
+    candidate = occurrence(start, frequency, interval, index, tz)
+    while not is_next(candidate):
+        index += 1
+        candidate = occurrence(start, frequency, interval, index, tz)
+    return candidate
+
+
+def next_run(mailing_settings, after: datetime.datetime, inclusive: bool = False, tz=None):
+    """Следующий запуск для записи MailingSettings с загруженной периодичностью"""
+    period = mailing_settings.mailing_period
+    return next_occurrence(mailing_settings.mailing_date, mailing_settings.mailing_time,
+                           period.frequency if period else None, period.interval if period else 1,
+                           after, inclusive=inclusive, tz=tz)
+
+
+def next_runs(mailing_settings_list, after: datetime.datetime, inclusive: bool = False, tz=None) -> dict:
+    """
+    Рассчитывает следующий запуск сразу для пачки настроек рассылок за один проход, без обращений к базе.
+    Периодичность должна быть загружена заранее (select_related('mailing_period'))
+    :return: словарь {pk настроек: aware datetime или None}
+    """
+    tz = tz or timezone.get_default_timezone()
+    return {
+        mailing_settings.pk: next_run(mailing_settings, after, inclusive=inclusive, tz=tz)
+        for mailing_settings in mailing_settings_list
+    }
@@ -0,0 +1,134 @@
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from main import recurrence
+from main.models import MailingSettings, Mailer, MailingJob, MailingPeriod
+
+# Сколько настроек рассылки обрабатывается за один тик планировщика
+DISPATCH_BATCH_SIZE = 500
+
+
+def compute_next_run(mailing_settings: MailingSettings, after, inclusive: bool = True):
+    """
+    Возвращает ближайшее время запуска рассылки не раньше after (или строго позже, если inclusive=False).
+    Если периодичность не задана, рассылка выполняется один раз в момент начала
+    :param mailing_settings: настройки рассылки с датой, временем начала и периодичностью
+    :param after: момент времени (aware datetime), после которого ищется запуск
+    :param inclusive: учитывать ли запуск, совпадающий с after
+    """
+    return recurrence.next_run(mailing_settings, after, inclusive=inclusive)
+
+
+def _new_job(mailer, run_at, total, status=MailingJob.STATUS_SCHEDULED):
+    return MailingJob(mailer=mailer, task_id=str(uuid4()), status=status, scheduled_at=run_at, total=total)
+
+
+def schedule_mailer(mailer: Mailer, now=None) -> MailingJob:
+    """
+    Рассчитывает первый запуск рассылки, сохраняет его в настройках и создает запланированную задачу,
+    идентификатор которой можно сразу вернуть пользователю. Разовая рассылка с прошедшей датой запускается сразу
+    """
+    now = now or timezone.now()
+    mailing_settings = mailer.mailing_settings
+    mailing_settings.next_run_at = compute_next_run(mailing_settings, now) or now
+    mailing_settings.save(update_fields=['next_run_at'])
+
+    job = _new_job(mailer, mailing_settings.next_run_at, mailer.clients.count())
+    job.save()
+    return job
+
+
+def unschedule_mailer(mailer: Mailer):
+    """Снимает рассылку с расписания и отменяет ее запланированные задачи"""
+    MailingSettings.objects.filter(pk=mailer.mailing_settings_id).update(next_run_at=None)
+    MailingJob.objects.filter(mailer=mailer, status=MailingJob.STATUS_SCHEDULED).update(
+        status=MailingJob.STATUS_CANCELLED
+    )
+
+
+def reschedule_settings(mailing_settings: MailingSettings, now=None):
+    """Пересчитывает время запуска после изменения даты, времени или периодичности запущенной рассылки"""
+    if mailing_settings.next_run_at is None:
+        return
+
+    now = now or timezone.now()
+    mailing_settings.next_run_at = compute_next_run(mailing_settings, now)
+    mailing_settings.save(update_fields=['next_run_at'])
+    MailingJob.objects.filter(
+        mailer__mailing_settings=mailing_settings, status=MailingJob.STATUS_SCHEDULED
+    ).update(scheduled_at=mailing_settings.next_run_at)
+
+
+def reschedule_period(mailing_period: MailingPeriod, now=None):
+    """Пересчитывает время запуска запущенных рассылок с этой периодичностью после ее изменения"""
+    now = now or timezone.now()
+    for mailing_settings in MailingSettings.objects.filter(mailing_period=mailing_period, next_run_at__isnull=False):
+        # периодичность уже загружена и изменена, повторно из базы она не читается
+        mailing_settings.mailing_period = mailing_period
+        reschedule_settings(mailing_settings, now)
+
+
+def dispatch_due_mailings(enqueue, now=None, batch_size=DISPATCH_BATCH_SIZE) -> int:
+    """
+    Выбирает из базы только те настройки рассылок, время запуска которых наступило, переводит их запланированные
+    задачи в очередь, сдвигает next_run_at на следующий период и планирует следующую задачу.
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому тики могут выполняться параллельно
+    :param enqueue: функция постановки задачи отправки в очередь, принимает запись MailingJob
+    :param now: текущее время, по умолчанию timezone.now()
+    :param batch_size: максимальное количество настроек за один вызов
+    :return: количество поставленных в очередь задач
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        due_settings = list(
+            MailingSettings.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('mailing_period')
+            .filter(next_run_at__lte=now, mailing_status__is_started=True)
+            .order_by('next_run_at')[:batch_size]
+        )
+        if not due_settings:
+            return 0
+
+        mailers = list(
+            Mailer.objects
+            .filter(mailing_settings__in=due_settings)
+            .annotate(clients_count=Count('clients'))
+        )
+        scheduled_jobs = {
+            job.mailer_id: job
+            for job in MailingJob.objects.filter(mailer__in=mailers, status=MailingJob.STATUS_SCHEDULED)
+        }
+
+        # Пропущенные периоды (например, во время простоя) не догоняются, берется ближайший будущий запуск
+        next_runs = recurrence.next_runs(due_settings, now)
+        for mailing_settings in due_settings:
+            mailing_settings.next_run_at = next_runs[mailing_settings.pk]
+        MailingSettings.objects.bulk_update(due_settings, ['next_run_at'])
+
+        queued_jobs = []
+        new_jobs = []
+        for mailer in mailers:
+            job = scheduled_jobs.get(mailer.pk)
+            if job is None:
+                job = _new_job(mailer, now, mailer.clients_count, status=MailingJob.STATUS_QUEUED)
+                new_jobs.append(job)
+            else:
+                job.status = MailingJob.STATUS_QUEUED
+                job.total = mailer.clients_count
+            queued_jobs.append(job)
+
+            next_run = next_runs[mailer.mailing_settings_id]
+            if next_run is not None:
+                new_jobs.append(_new_job(mailer, next_run, mailer.clients_count))
+
+        MailingJob.objects.bulk_update([job for job in queued_jobs if job.pk], ['status', 'total'])
+        MailingJob.objects.bulk_create(new_jobs)
+
+        transaction.on_commit(lambda: [enqueue(job) for job in queued_jobs])
+
+    return len(queued_jobs)
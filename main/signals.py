@@ -0,0 +1,62 @@
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from main import stats, caching
+from main.models import Mailer, Client, MailingStatus, MailingSettings, EmailMessage, MailingPeriod
+
+
+@receiver(post_save, sender=Mailer)
+def mailer_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.change_dashboard_counter('mailers', 1)
+
+
+@receiver(post_delete, sender=Mailer)
+def mailer_deleted(sender, instance, **kwargs):
+    stats.change_dashboard_counter('mailers', -1)
+    # удаленная рассылка могла быть активной, счетчик активных пересчитается при следующем чтении
+    stats.reset_dashboard_counter('active_mailers')
+
+
+@receiver(post_save, sender=Client)
+def client_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.change_dashboard_counter('clients', 1)
+
+
+@receiver(post_delete, sender=Client)
+def client_deleted(sender, instance, **kwargs):
+    stats.change_dashboard_counter('clients', -1)
+
+
+@receiver(pre_save, sender=MailingStatus)
+def remember_mailing_status(sender, instance, **kwargs):
+    instance._was_started = bool(
+        instance.pk and MailingStatus.objects.filter(pk=instance.pk, is_started=True).exists()
+    )
+
+
+@receiver(post_save, sender=MailingStatus)
+def mailing_status_saved(sender, instance, **kwargs):
+    was_started = getattr(instance, '_was_started', False)
+    if bool(instance.is_started) != was_started:
+        mailers = Mailer.objects.filter(mailing_settings__mailing_status=instance).count()
+        if mailers:
+            stats.change_dashboard_counter('active_mailers', mailers if instance.is_started else -mailers)
+
+
+@receiver(post_save, sender=MailingStatus)
+def mailing_status_changed(sender, instance, **kwargs):
+    # у статуса нет владельца, версии сбрасываются у владельцев настроек с этим статусом
+    for owner_id in MailingSettings.objects.filter(mailing_status=instance).values_list('owner_id', flat=True):
+        caching.bump_owner_version(owner_id)
+
+
+def owned_object_changed(sender, instance, **kwargs):
+    caching.bump_owner_version(instance.owner_id)
+
+
+for model in (Client, Mailer, MailingSettings, EmailMessage, MailingPeriod):
+    post_save.connect(owned_object_changed, sender=model, dispatch_uid=f'cache_version_{model.__name__}_save')
+    post_delete.connect(owned_object_changed, sender=model, dispatch_uid=f'cache_version_{model.__name__}_delete')
+m2m_changed.connect(owned_object_changed, sender=Mailer.clients.through, dispatch_uid='cache_version_mailer_clients')
@@ -0,0 +1,85 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main.models import MailerDailyStats, Mailer, Client
+
+# Счетчики главной страницы и запросы для их точного пересчета
+DASHBOARD_COUNTERS = {
+    'mailers': lambda: Mailer.objects.count(),
+    'active_mailers': lambda: Mailer.objects.filter(mailing_settings__mailing_status__is_started=True).count(),
+    'clients': lambda: Client.objects.count(),
+}
+
+
+def _counter_key(name: str) -> str:
+    return f'stats:dashboard:{name}'
+
+
+def get_dashboard_counters() -> dict:
+    """
+    Возвращает счетчики главной страницы из кеша (Redis) одним запросом get_many.
+    Отсутствующий в кеше счетчик считается по базе один раз и сохраняется без срока жизни
+    """
+    values = cache.get_many([_counter_key(name) for name in DASHBOARD_COUNTERS])
+    counters = {}
+    for name, count in DASHBOARD_COUNTERS.items():
+        value = values.get(_counter_key(name))
+        if value is None:
+            value = count()
+            cache.add(_counter_key(name), value, timeout=None)
+        counters[name] = value
+    return counters
+
+
+def change_dashboard_counter(name: str, delta: int):
+    """Изменяет счетчик после фиксации транзакции; если счетчика нет в кеше, он будет посчитан при чтении"""
+    def apply():
+        try:
+            cache.incr(_counter_key(name), delta)
+        except ValueError:
+            pass
+
+    transaction.on_commit(apply)
+
+
+def reset_dashboard_counter(name: str):
+    transaction.on_commit(lambda: cache.delete(_counter_key(name)))
+
+
+def reconcile_dashboard_counters() -> dict:
+    """Пересчитывает все счетчики по базе, исправляя расхождения после массовых операций без сигналов"""
+    counters = {name: count() for name, count in DASHBOARD_COUNTERS.items()}
+    cache.set_many({_counter_key(name): value for name, value in counters.items()}, timeout=None)
+    return counters
+
+
+def add_daily_stats(mailer_id: int, day, sent: int = 0, failed: int = 0):
+    """
+    Прибавляет количество отправленных и неотправленных писем к сводке рассылки за день.
+    Обычно это один UPDATE, строка за день создается только при первой записи
+    """
+    counters = MailerDailyStats.objects.filter(mailer_id=mailer_id, day=day)
+    if counters.update(sent=F('sent') + sent, failed=F('failed') + failed):
+        return
+
+    try:
+        with transaction.atomic():
+            MailerDailyStats.objects.create(mailer_id=mailer_id, day=day, sent=sent, failed=failed)
+    except IntegrityError:
+        # строку за этот день успел создать параллельный воркер
+        counters.update(sent=F('sent') + sent, failed=F('failed') + failed)
+
+
+def record_logs(logs):
+    """Обновляет сводку по дням для пачки записей MessageLog"""
+    totals = Counter()
+    for log in logs:
+        key = (log.mailer_id, timezone.localdate(log.last_attempt))
+        totals[key + (log.status,)] += 1
+
+    for mailer_id, day in {key[:2] for key in totals}:
+        add_daily_stats(mailer_id, day, sent=totals[(mailer_id, day, True)], failed=totals[(mailer_id, day, False)])
@@ -1,76 +1,249 @@
-import datetime
+import csv
+import io
 import smtplib
-from time import sleep
 
-from celery import shared_task
+from celery import shared_task, chord
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import F
 
-from main.models import MessageLog
+from main import scheduler, stats, partitions, images, imports
+from main.mailing import BatchMailSender, CONNECTION_ERRORS, describe_smtp_error, get_mailing_context
+from main.ratelimit import SmtpRateLimiter, RateLimitExceeded
+from main.models import MessageLog, Mailer, MailingJob
+from users import outbox
+from users.models import User
+
+
+# Как часто (в письмах) пачка перепроверяет, не остановлена ли рассылка
+CANCEL_CHECK_EVERY = 100
+# Сколько раз пачка повторяется после ошибки соединения с SMTP сервером
+CONNECTION_RETRIES = 5
+
+
+def split_into_ranges(ids: list, size: int) -> list:
+    """Делит отсортированный список pk на пачки и возвращает границы пачек [(первый pk, последний pk), ...]"""
+    return [(ids[start], ids[min(start + size, len(ids)) - 1]) for start in range(0, len(ids), size)]
 
 
 @shared_task()
-def send_mail(mailer,
-              emails: list,
-              message_title: str,
-              message_body: str,
-              date,
-              time,
-              period,
-              from_email):
+def send_mail(mailer_id: int, job_id: int):
+    """
+    Выполняет один запуск рассылки: разбивает получателей на пачки по MAILING_CHUNK_SIZE и отправляет каждую пачку
+    отдельной задачей send_mail_chunk, поэтому большая рассылка распределяется по всем воркерам, а ошибка повторяет
+    только затронутую пачку. После обработки всех пачек chord вызывает finish_mailing_job, а если пачка завершилась
+    непредвиденной ошибкой - fail_mailing_job.
+    Периодичность обеспечивает планировщик dispatch_due_mailings, который ставит эту задачу в очередь,
+    когда наступает время запуска, поэтому воркер не простаивает в ожидании следующего периода.
+    В задачи передаются только идентификаторы и границы диапазонов pk, так как брокер сериализует аргументы в json
+    :param mailer_id: pk записи из модели Mailer - рассылка в которой указаны клиент, письмо и настройки рассылки
+    :param job_id: pk записи из модели MailingJob, в которой ведется учет состояния задачи
+    """
+    context = get_mailing_context(mailer_id, refresh=True)
+    jobs = MailingJob.objects.filter(pk=job_id)
+
+    if context.is_cancelled():
+        jobs.update(status=MailingJob.STATUS_CANCELLED)
+        return
+
+    client_ids = context.recipient_ids
+    jobs.update(status=MailingJob.STATUS_RUNNING, total=len(client_ids))
+
+    if not client_ids:
+        finish_mailing_job(mailer_id, job_id)
+        return
+
+    chord(
+        send_mail_chunk.s(mailer_id, job_id, first_id, last_id)
+        for first_id, last_id in split_into_ranges(client_ids, settings.MAILING_CHUNK_SIZE)
+    )(finish_mailing_job.si(mailer_id, job_id).on_error(fail_mailing_job.s(job_id)))
+
+
+@shared_task(bind=True, max_retries=None, default_retry_delay=60)
+def send_mail_chunk(self, mailer_id: int, job_id: int, first_id: int, last_id: int, failed_attempts: int = 0):
     """
-    Функция send_mail берет за основу класс django EmailMultiAlternatives для отправки писем, но обрабатывыает логику
-    периодичности отправки писем, а также логику отправки по заданному времени, используя функцию ожидания sleep,
-    благодаря декоратору @shared_task из библиотеки Celery эта функция будет рботать асинхронно в фоновом режиме
-    :param mailer: запись из модели Mailer - рассылка в которой указаны клиент, письмо и настройки рассылки
-    :param emails: список электронных почт клиентов
-    :param message_title: заголовок письма
-    :param message_body: тело письма
-    :param date: дата начала отправки письма
-    :param time: время в которое нужно отправлять письмо
-    :param period: периодичность отправки, начиная с заданной даты и времени отправки
-    :param from_email: хост email из настроек указанных в настройках проекта
+    Отправляет пачку писем: каждому получателю отдельное письмо, чтобы адреса клиентов не раскрывались друг другу.
+    Все письма пачки идут через одно SMTP соединение с темпом, который разрешает лимит SMTP аккаунта.
+    Если соединение не удается восстановить, задача повторяется только для еще не обработанных получателей,
+    а после CONNECTION_RETRIES неудачных попыток они учитываются как неотправленные. Если лимит аккаунта исчерпан
+    надолго, задача освобождает воркер и повторяется, когда лимит восстановится, не расходуя попытки.
+    Результат по каждому получателю копится в памяти и записывается в лог одним bulk_create на пачку
+    :param mailer_id: pk рассылки
+    :param job_id: pk задачи рассылки
+    :param first_id: pk первого клиента пачки
+    :param last_id: pk последнего клиента пачки
+    :param failed_attempts: сколько предыдущих попыток завершились ошибкой соединения
     """
-    now_time = datetime.datetime.now()
+    context = get_mailing_context(mailer_id)
+    if context.is_cancelled():
+        return
 
+    from_email = settings.EMAIL_HOST_USER
+    logs = []
     try:
-        task_datetime = datetime.datetime.combine(date, time)
-    except ValueError:
-        raise ValueError("Invalid date or time format")
-
-    while True:
-        if not mailer.mailing_settings.mailing_status.is_started:
-            break
-
-        else:
-            if now_time > task_datetime:
-                delta_after_time = (now_time - task_datetime).total_seconds()
-
-                if period.daily:
-                    delay_seconds = delta_after_time + (86400 - delta_after_time)
-                elif period.weekly:
-                    delay_seconds = delta_after_time + (604800 - delta_after_time)
-                elif period.monthly:
-                    delay_seconds = delta_after_time + (
-                                16934400 - delta_after_time)  # расчет сделан для 28 дней в месяце
-            else:
-                delay_seconds = (task_datetime - now_time).total_seconds()
-
-            if delay_seconds > 0:
-                sleep(delay_seconds)
-
-            try:
-                email_message = EmailMultiAlternatives(message_title, message_body, from_email, emails)
-                email_message.send()
-
-                # Запись успешной отправки в лог
-                log = MessageLog(mailer=mailer, status=True, server_response='Message sent', last_attempt=now_time)
-                log.save()
-            except smtplib.SMTPException as e:
-                # Обработка ошибки при отправке почты
-                error_message = f"Failed to send email: {str(e)}"
-
-                # Запись ошибки в лог
-                log = MessageLog(mailer=mailer, status=False, server_response=error_message, last_attempt=now_time)
-                log.save()
+        with BatchMailSender(rate_limiter=SmtpRateLimiter()) as sender:
+            for number, client in enumerate(context.recipients(first_id, last_id), start=1):
+                if number % CANCEL_CHECK_EVERY == 0 and context.is_cancelled():
+                    break
+                rendered = context.message.render(client)
+                email_message = EmailMultiAlternatives(
+                    rendered['subject'], rendered['text'], from_email, [client.email],
+                    headers={'List-Unsubscribe': f'<{rendered["unsubscribe_url"]}>',
+                             'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click'},
+                )
+                email_message.attach_alternative(rendered['html'], 'text/html')
+                try:
+                    sender.send(email_message)
+                    # smtplib возвращает управление только после ответа 250 на команду DATA
+                    logs.append(MessageLog(mailer_id=mailer_id, client_id=client.pk, status=True,
+                                           smtp_code=250, server_response='Message sent'))
+                except CONNECTION_ERRORS:
+                    raise
+                except smtplib.SMTPException as e:
+                    # Ошибка конкретного получателя (например, адрес отклонен сервером) не мешает остальным
+                    smtp_code, response = describe_smtp_error(e)
+                    logs.append(MessageLog(mailer_id=mailer_id, client_id=client.pk, status=False,
+                                           smtp_code=smtp_code, server_response=f'Failed to send email: {response}'))
+    except RateLimitExceeded as e:
+        _record_chunk(job_id, logs)
+        raise self.retry(args=(mailer_id, job_id, _remaining_from(logs, first_id), last_id, failed_attempts),
+                         countdown=e.retry_after, exc=e)
+    except (*CONNECTION_ERRORS, smtplib.SMTPException) as e:
+        remaining_from = _remaining_from(logs, first_id)
+        if failed_attempts < CONNECTION_RETRIES:
+            _record_chunk(job_id, logs)
+            raise self.retry(args=(mailer_id, job_id, remaining_from, last_id, failed_attempts + 1), exc=e)
+
+        smtp_code, response = describe_smtp_error(e)
+        logs.extend(
+            MessageLog(mailer_id=mailer_id, client_id=client.pk, status=False,
+                       smtp_code=smtp_code, server_response=f'Failed to send email: {response}')
+            for client in context.recipients(remaining_from, last_id)
+        )
+
+    _record_chunk(job_id, logs)
+
+
+def _remaining_from(logs: list, first_id: int) -> int:
+    """
+    Первый pk еще не обработанного получателя пачки. Получатели обрабатываются по возрастанию pk,
+    поэтому необработанные образуют непрерывный диапазон
+    """
+    return logs[-1].client_id + 1 if logs else first_id
+
+
+def _record_chunk(job_id: int, logs: list):
+    """Записывает результаты пачки одним запросом в лог и обновляет счетчики задачи и сводку по дням"""
+    if not logs:
+        return
+
+    MessageLog.objects.bulk_create(logs, batch_size=settings.MAILING_CHUNK_SIZE)
+    stats.record_logs(logs)
+    sent = sum(1 for log in logs if log.status)
+    MailingJob.objects.filter(pk=job_id).update(sent=F('sent') + sent, failed=F('failed') + len(logs) - sent)
+
+
+@shared_task()
+def fail_mailing_job(request, exc, traceback, job_id: int):
+    """
+    Обработчик ошибки chord рассылки: пачка завершилась ошибкой, которую она не обрабатывает сама (например, ошибкой
+    базы данных), и finish_mailing_job не будет вызван. Задача отмечается неудачной, чтобы не остаться выполняемой
+    """
+    MailingJob.objects.filter(pk=job_id, status=MailingJob.STATUS_RUNNING).update(status=MailingJob.STATUS_FAILED)
+
+
+@shared_task()
+def finish_mailing_job(mailer_id: int, job_id: int):
+    """Завершает запуск рассылки после обработки всех пачек"""
+    mailer = Mailer.objects.select_related('mailing_settings__mailing_status').get(pk=mailer_id)
+    job = MailingJob.objects.get(pk=job_id)
+
+    if not mailer.mailing_settings.mailing_status.is_started:
+        job.status = MailingJob.STATUS_CANCELLED
+    elif job.failed and not job.sent:
+        job.status = MailingJob.STATUS_FAILED
+    else:
+        job.status = MailingJob.STATUS_DONE
+    job.save(update_fields=['status', 'updated_at'])
+
+    # Разовая рассылка без периодичности завершается после первого запуска
+    mailing_status = mailer.mailing_settings.mailing_status
+    if mailer.mailing_settings.next_run_at is None and mailing_status.is_started:
+        mailing_status.is_started = False
+        mailing_status.is_complete = True
+        mailing_status.save()
 
 
+def enqueue_job(job: MailingJob):
+    send_mail.apply_async(args=(job.mailer_id, job.pk), task_id=job.task_id)
+
+
+@shared_task()
+def dispatch_due_mailings():
+    """
+    Периодический тик планировщика (запускается celery beat): отправляет в очередь рассылки,
+    у которых наступило время next_run_at
+    """
+    return scheduler.dispatch_due_mailings(enqueue_job)
+
+
+@shared_task()
+def maintain_messagelog_partitions():
+    """Заранее создает помесячные партиции лога отправки (только для PostgreSQL)"""
+    if partitions.is_supported() and partitions.is_partitioned():
+        return partitions.ensure_partitions(settings.MESSAGELOG_PARTITIONS_AHEAD)
+
+
+@shared_task()
+def reconcile_dashboard_counters():
+    """Периодически сверяет счетчики главной страницы с базой"""
+    return stats.reconcile_dashboard_counters()
+
+
+@shared_task()
+def generate_image_variants(name: str):
+    """Создает уменьшенные копии загруженного изображения (см. main.images)"""
+    return images.generate_variants(name)
+
+
+def queue_image_variants(field_file):
+    """
+    Ставит создание копий изображения в очередь после фиксации транзакции, если копий еще нет.
+    Вызывается сигналами post_save моделей с изображениями
+    """
+    if field_file and not images.variants_exist(field_file.name):
+        name = field_file.name
+        transaction.on_commit(lambda: generate_image_variants.delay(name))
+
+
+@shared_task()
+def delete_image_variants(name: str):
+    """Удаляет уменьшенные копии изображения, которое удалено или заменено другим"""
+    return images.delete_variants(name)
+
+
+def queue_image_variants_deletion(name: str):
+    """Ставит удаление копий изображения в очередь после фиксации транзакции"""
+    if name:
+        transaction.on_commit(lambda: delete_image_variants.delay(name))
+
+
+@shared_task()
+def import_clients_file(name: str, owner_id: int, delimiter: str = ','):
+    """
+    Импортирует клиентов из CSV файла, сохраненного в хранилище при загрузке, и отправляет владельцу отчет
+    на почту. Файл удаляется после импорта
+    """
+    owner = User.objects.get(pk=owner_id)
+    try:
+        with default_storage.open(name, 'rb') as file:
+            stream = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+            report = imports.format_report(imports.import_clients(stream, owner, delimiter=delimiter))
+    except (ValueError, csv.Error) as e:
+        report = f'Файл не импортирован: {e}'
+    finally:
+        default_storage.delete(name)
+
+    outbox.enqueue_email('Импорт клиентов завершен', report, owner.email)
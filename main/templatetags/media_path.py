@@ -1,4 +1,8 @@
 from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from main import images
 
 register = template.Library()
 
@@ -8,3 +12,32 @@ def mymedia(val):
     if val:
         return f'/media/{val}'
     return '#'
+
+
+def _variant_url(val, size: str, extension: str = None):
+    if size not in settings.IMAGE_VARIANT_SIZES:
+        raise template.TemplateSyntaxError(f'Неизвестный размер изображения: {size}')
+    name = str(val)
+    extension = extension or images.fallback_extension(name)
+    if extension not in images.variant_formats(name):
+        return None
+    return default_storage.url(images.variant_name(name, size, extension))
+
+
+@register.filter()
+def thumbnail(val, size):
+    """
+    Адрес уменьшенной копии изображения: {{ blog.preview|thumbnail:'card' }}.
+    Пока копии не созданы, возвращается адрес оригинала
+    """
+    if not val:
+        return '#'
+    return _variant_url(val, size) or mymedia(val)
+
+
+@register.filter()
+def webp(val, size):
+    """Адрес копии изображения в WebP для <source type="image/webp">, пустая строка, если копий еще нет"""
+    if not val:
+        return ''
+    return _variant_url(val, size, 'webp') or ''
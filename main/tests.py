@@ -1,3 +1,1163 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock, skipIf, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import fakeredis
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.storage import default_storage, FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.templatetags.static import static
+from django.urls import get_resolver, reverse, URLResolver
+from django.utils import timezone
+from PIL import Image
+
+from blog.models import Blog
+from config.staticfiles import accepted_encodings
+from main import recurrence, personalization, images, imports, partitions, scheduler, mailing, stats, tasks
+from main.mailing import BatchMailSender
+from main.mixins import FragmentCacheMixin
+from main.ratelimit import SmtpRateLimiter, RateLimitExceeded
+from main.tasks import fail_mailing_job, finish_mailing_job, send_mail_chunk
+from main.templatetags import media_path
+from main.models import Client, EmailMessage, MailingPeriod, MailingStatus, MailingSettings, Mailer, MessageLog, \
+    MailingJob, MailerDailyStats
+from users.models import User, OutboxEmail
+
+BERLIN = ZoneInfo('Europe/Berlin')
+UTC = datetime.timezone.utc
+
+
+def local(*args):
+    return datetime.datetime(*args, tzinfo=BERLIN)
+
+
+class NextOccurrenceTestCase(SimpleTestCase):
+
+    def next_after(self, start, frequency, after, interval=1, inclusive=False):
+        return recurrence.next_occurrence(start.date(), start.time(), frequency, interval, after,
+                                          inclusive=inclusive, tz=BERLIN)
+
+    def test_first_run_in_future(self):
+        start = datetime.datetime(2024, 5, 10, 9, 0)
+        self.assertEqual(self.next_after(start, recurrence.DAILY, local(2024, 5, 1, 12, 0)), local(2024, 5, 10, 9, 0))
+
+    def test_inclusive_boundary(self):
+        start = datetime.datetime(2024, 5, 10, 9, 0)
+        after = local(2024, 5, 12, 9, 0)
+        self.assertEqual(self.next_after(start, recurrence.DAILY, after, inclusive=True), after)
+        self.assertEqual(self.next_after(start, recurrence.DAILY, after), local(2024, 5, 13, 9, 0))
+
+    def test_one_off_in_past(self):
+        start = datetime.datetime(2024, 5, 10, 9, 0)
+        self.assertIsNone(self.next_after(start, None, local(2024, 5, 11, 9, 0)))
+
+    def test_once_runs_only_at_start(self):
+        start = datetime.datetime(2024, 5, 10, 9, 0)
+        self.assertEqual(self.next_after(start, recurrence.ONCE, local(2024, 5, 1, 12, 0)), local(2024, 5, 10, 9, 0))
+        self.assertIsNone(self.next_after(start, recurrence.ONCE, local(2024, 5, 10, 9, 0)))
+
+    def test_daily_keeps_wall_time_across_spring_forward(self):
+        # 31 марта 2024 в Берлине часы переводятся с 02:00 на 03:00
+        start = datetime.datetime(2024, 3, 25, 10, 0)
+        result = self.next_after(start, recurrence.DAILY, local(2024, 3, 30, 10, 0))
+        self.assertEqual(result, local(2024, 3, 31, 10, 0))
+        self.assertEqual(result.astimezone(UTC).hour, 8)
+
+    def test_daily_keeps_wall_time_across_fall_back(self):
+        # 27 октября 2024 в Берлине часы переводятся с 03:00 на 02:00
+        start = datetime.datetime(2024, 10, 20, 10, 0)
+        result = self.next_after(start, recurrence.DAILY, local(2024, 10, 26, 10, 0))
+        self.assertEqual(result, local(2024, 10, 27, 10, 0))
+        self.assertEqual(result.astimezone(UTC).hour, 9)
+
+    def test_nonexistent_time_is_shifted_forward(self):
+        start = datetime.datetime(2024, 3, 30, 2, 30)
+        result = self.next_after(start, recurrence.DAILY, local(2024, 3, 30, 12, 0))
+        self.assertEqual(result.astimezone(UTC), datetime.datetime(2024, 3, 31, 1, 30, tzinfo=UTC))
+        self.assertEqual((result.hour, result.minute), (3, 30))
+        self.assertEqual(self.next_after(start, recurrence.DAILY, result), local(2024, 4, 1, 2, 30))
+
+    def test_ambiguous_time_uses_first_occurrence(self):
+        start = datetime.datetime(2024, 10, 26, 2, 30)
+        result = self.next_after(start, recurrence.DAILY, local(2024, 10, 26, 12, 0))
+        self.assertEqual(result.astimezone(UTC), datetime.datetime(2024, 10, 27, 0, 30, tzinfo=UTC))
+        # повтор того же часа после перевода часов не считается новым запуском
+        self.assertEqual(self.next_after(start, recurrence.DAILY, result + datetime.timedelta(hours=1)),
+                         local(2024, 10, 28, 2, 30))
+
+    def test_weekly_across_dst(self):
+        start = datetime.datetime(2024, 3, 27, 18, 0)
+        result = self.next_after(start, recurrence.WEEKLY, local(2024, 3, 28, 0, 0))
+        self.assertEqual(result, local(2024, 4, 3, 18, 0))
+        self.assertEqual(result - local(2024, 3, 27, 18, 0).astimezone(UTC), datetime.timedelta(days=7, hours=-1))
+
+    def test_monthly_clamps_to_month_end(self):
+        start = datetime.datetime(2024, 1, 31, 9, 0)
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2024, 2, 1, 0, 0)), local(2024, 2, 29, 9, 0))
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2023, 2, 1, 0, 0)), local(2024, 1, 31, 9, 0))
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2025, 2, 1, 0, 0)), local(2025, 2, 28, 9, 0))
+
+    def test_monthly_returns_to_anchor_day(self):
+        start = datetime.datetime(2024, 1, 31, 9, 0)
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2024, 2, 29, 9, 0)), local(2024, 3, 31, 9, 0))
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2024, 4, 1, 0, 0)), local(2024, 4, 30, 9, 0))
+
+    def test_monthly_across_year_end(self):
+        start = datetime.datetime(2023, 11, 30, 23, 0)
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2023, 12, 31, 0, 0)),
+                         local(2024, 1, 30, 23, 0))
+
+    def test_custom_intervals(self):
+        start = datetime.datetime(2024, 1, 1, 8, 0)
+        self.assertEqual(self.next_after(start, recurrence.DAILY, local(2024, 1, 2, 0, 0), interval=3),
+                         local(2024, 1, 4, 8, 0))
+        self.assertEqual(self.next_after(start, recurrence.WEEKLY, local(2024, 1, 2, 0, 0), interval=2),
+                         local(2024, 1, 15, 8, 0))
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2024, 2, 1, 0, 0), interval=3),
+                         local(2024, 4, 1, 8, 0))
+
+    def test_long_running_mailing(self):
+        start = datetime.datetime(2000, 2, 29, 12, 0)
+        self.assertEqual(self.next_after(start, recurrence.MONTHLY, local(2030, 6, 15, 0, 0)), local(2030, 6, 29, 12, 0))
+        self.assertEqual(self.next_after(start, recurrence.DAILY, local(2030, 6, 15, 13, 0)), local(2030, 6, 16, 12, 0))
+
+
+class NextRunsBatchTestCase(SimpleTestCase):
+
+    def make_settings(self, pk, start, frequency, interval=1):
+        period = SimpleNamespace(frequency=frequency, interval=interval) if frequency else None
+        return SimpleNamespace(pk=pk, mailing_date=start.date(), mailing_time=start.time(), mailing_period=period)
+
+    def test_batch_matches_single_computation(self):
+        after = local(2024, 3, 30, 12, 0)
+        batch = [
+            self.make_settings(1, datetime.datetime(2024, 3, 1, 10, 0), recurrence.DAILY),
+            self.make_settings(2, datetime.datetime(2024, 1, 31, 9, 0), recurrence.MONTHLY),
+            self.make_settings(3, datetime.datetime(2024, 3, 20, 18, 0), recurrence.WEEKLY, interval=2),
+            self.make_settings(4, datetime.datetime(2024, 3, 1, 10, 0), None),
+        ]
+
+        result = recurrence.next_runs(batch, after, tz=BERLIN)
+
+        self.assertEqual(result, {
+            1: local(2024, 3, 31, 10, 0),
+            2: local(2024, 3, 31, 9, 0),
+            3: local(2024, 4, 3, 18, 0),
+            4: None,
+        })
+        for mailing_settings in batch:
+            self.assertEqual(result[mailing_settings.pk], recurrence.next_run(mailing_settings, after, tz=BERLIN))
+
+
+@override_settings(SITE_URL='https://mailer.example.com/')
+class PersonalizationTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.recipient = Client(pk=7, email='ivan@example.com', first_name='<b>Иван</b>', last_name='Иванов & сын')
+
+    def test_client_fields_are_escaped_in_html(self):
+        message = personalization.CompiledMessage(3, 'Привет, {{ first_name }}',
+                                                  'Здравствуйте, {{first_name}} {{ last_name }}!')
+        rendered = message.render(self.recipient)
+
+        self.assertEqual(rendered['subject'], 'Привет, <b>Иван</b>')
+        self.assertTrue(rendered['text'].startswith('Здравствуйте, <b>Иван</b> Иванов & сын!'))
+        self.assertTrue(rendered['html'].startswith('Здравствуйте, &lt;b&gt;Иван&lt;/b&gt; Иванов &amp; сын!'))
+
+    def test_unknown_and_malformed_placeholders_are_kept(self):
+        template = personalization.CompiledTemplate('{{ password }} {{ first_name.upper }} {first_name} '
+                                                    '{{ first_name }} {{ middle_name }}.')
+        self.assertEqual(template.render({'first_name': 'Иван'}),
+                         '{{ password }} {{ first_name.upper }} {first_name} Иван .')
+
+    def test_unsubscribe_link_is_appended(self):
+        rendered = personalization.CompiledMessage(3, 'Тема', 'Текст').render(self.recipient)
+
+        url = rendered['unsubscribe_url']
+        self.assertEqual(url, 'https://mailer.example.com'
+                              + reverse('main:unsubscribe', args=[personalization.make_unsubscribe_token(3, 7)]))
+        self.assertTrue(rendered['text'].endswith(f'Отписаться от рассылки: {url}'))
+        self.assertIn(f'<a href="{url}">{url}</a>', rendered['html'])
+
+    def test_unsubscribe_link_from_body_is_not_duplicated(self):
+        rendered = personalization.CompiledMessage(3, 'Тема', 'Отписка: {{ unsubscribe_url }}').render(self.recipient)
+        self.assertEqual(rendered['text'], f'Отписка: {rendered["unsubscribe_url"]}')
+
+    def test_token_round_trip(self):
+        token = personalization.make_unsubscribe_token(3, 7)
+        self.assertEqual(personalization.read_unsubscribe_token(token), (3, 7))
+
+    def test_tampered_token_is_rejected(self):
+        token = personalization.make_unsubscribe_token(3, 7)
+        value, signature = token.rsplit(':', 1)
+        for tampered in (f'3-8:{signature}', f'{value}:{signature[:-1]}', value):
+            with self.subTest(token=tampered), self.assertRaises(signing.BadSignature):
+                personalization.read_unsubscribe_token(tampered)
+
+
+class SchedulerTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        cls.period = MailingPeriod.objects.create(frequency=recurrence.DAILY, owner=cls.owner)
+        cls.mailing_settings = MailingSettings.objects.create(
+            mailing_date=datetime.date(2024, 1, 1), mailing_time=datetime.time(10, 0), mailing_period=cls.period,
+            mailing_status=MailingStatus.objects.create(is_created=False, is_started=True), owner=cls.owner,
+        )
+        cls.mailer = Mailer.objects.create(email_message=EmailMessage.objects.create(
+            message_title='Письмо', message_body='Текст', owner=cls.owner
+        ), mailing_settings=cls.mailing_settings, owner=cls.owner)
+        cls.mailer.clients.set(Client.objects.bulk_create(
+            Client(email=f'client{number}@example.com', first_name='Имя', last_name='Фамилия', owner=cls.owner)
+            for number in range(3)
+        ))
+
+    def make_due(self, now):
+        job = scheduler.schedule_mailer(self.mailer, now=now - datetime.timedelta(days=1))
+        MailingSettings.objects.filter(pk=self.mailing_settings.pk).update(
+            next_run_at=now - datetime.timedelta(minutes=1)
+        )
+        return job
+
+    def test_due_mailing_is_enqueued_after_commit(self):
+        now = timezone.now()
+        job = self.make_due(now)
+        enqueue = mock.Mock()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(scheduler.dispatch_due_mailings(enqueue, now=now), 1)
+            enqueue.assert_not_called()
+        for callback in callbacks:
+            callback()
+
+        enqueue.assert_called_once()
+        queued = enqueue.call_args.args[0]
+        self.assertEqual(queued.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total), (MailingJob.STATUS_QUEUED, 3))
+
+    def test_next_run_advances_and_next_job_is_scheduled(self):
+        now = timezone.now()
+        self.make_due(now)
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduler.dispatch_due_mailings(mock.Mock(), now=now)
+
+        self.mailing_settings.refresh_from_db()
+        self.assertEqual(self.mailing_settings.next_run_at, recurrence.next_run(self.mailing_settings, now))
+        self.assertGreater(self.mailing_settings.next_run_at, now)
+        scheduled = MailingJob.objects.get(mailer=self.mailer, status=MailingJob.STATUS_SCHEDULED)
+        self.assertEqual(scheduled.scheduled_at, self.mailing_settings.next_run_at)
+
+        # следующий тик до наступления нового времени запуска ничего не делает
+        self.assertEqual(scheduler.dispatch_due_mailings(mock.Mock(), now=now), 0)
+
+    def test_stopped_mailing_is_not_dispatched(self):
+        now = timezone.now()
+        self.make_due(now)
+        MailingStatus.objects.filter(pk=self.mailing_settings.mailing_status_id).update(is_started=False)
+        self.assertEqual(scheduler.dispatch_due_mailings(mock.Mock(), now=now), 0)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_due_settings_are_locked_with_skip_locked(self):
+        now = timezone.now()
+        self.make_due(now)
+        with CaptureQueriesContext(connection) as queries:
+            scheduler.dispatch_due_mailings(mock.Mock(), now=now)
+        self.assertTrue(any('SKIP LOCKED' in query['sql'] for query in queries.captured_queries))
+
+    def test_one_off_mailing_completes_after_run(self):
+        MailingPeriod.objects.filter(pk=self.period.pk).update(frequency=recurrence.ONCE)
+        now = timezone.now()
+        job = self.make_due(now)
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduler.dispatch_due_mailings(mock.Mock(), now=now)
+
+        self.mailing_settings.refresh_from_db()
+        self.assertIsNone(self.mailing_settings.next_run_at)
+        self.assertFalse(MailingJob.objects.filter(mailer=self.mailer, status=MailingJob.STATUS_SCHEDULED).exists())
+
+        finish_mailing_job(self.mailer.pk, job.pk)
+        status = MailingStatus.objects.get(pk=self.mailing_settings.mailing_status_id)
+        self.assertEqual((status.is_started, status.is_complete), (False, True))
+
+    def test_period_update_reschedules_settings(self):
+        job = scheduler.schedule_mailer(self.mailer)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('main:mail_period_update', args=[self.period.pk]),
+                         {'frequency': recurrence.MONTHLY, 'interval': 3})
+
+        self.mailing_settings.refresh_from_db()
+        next_run = recurrence.next_run(self.mailing_settings, timezone.now(), inclusive=True)
+        self.assertEqual(self.mailing_settings.next_run_at, next_run)
+        self.assertEqual(next_run.day, 1)
+        self.assertEqual((next_run.month - 1) % 3, 0)
+        job.refresh_from_db()
+        self.assertEqual(job.scheduled_at, next_run)
+
+
+class ChunkRetried(Exception):
+
+    def __init__(self, **kwargs):
+        super().__init__('retry')
+        self.kwargs = kwargs
+
+
+class MailChunkTestCase(TestCase):
+    """Отправка пачки send_mail_chunk с почтовым backend locmem; повтор задачи подменяется исключением ChunkRetried"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        cls.mailer = Mailer.objects.create(
+            email_message=EmailMessage.objects.create(message_title='Письмо', message_body='Текст', owner=cls.owner),
+            mailing_settings=MailingSettings.objects.create(
+                mailing_date=datetime.date(2024, 1, 1), mailing_time=datetime.time(10, 0),
+                mailing_period=MailingPeriod.objects.create(owner=cls.owner),
+                mailing_status=MailingStatus.objects.create(is_created=False, is_started=True), owner=cls.owner,
+            ),
+            owner=cls.owner,
+        )
+        cls.mailer.clients.set(Client.objects.bulk_create(
+            Client(email=f'client{number}@example.com', first_name='Имя', last_name='Фамилия', owner=cls.owner)
+            for number in range(5)
+        ))
+        cls.client_ids = sorted(cls.mailer.clients.values_list('pk', flat=True))
+        cls.job = MailingJob.objects.create(mailer=cls.mailer, task_id='chunk-job', status=MailingJob.STATUS_RUNNING,
+                                            total=5)
+
+    def setUp(self):
+        mailing._context_cache.clear()
+
+    def run_chunk(self, failed_attempts=0, fail_from=None, error=smtplib.SMTPServerDisconnected('Connection closed'),
+                  refused=()):
+        """
+        Отправляет пачку; начиная с письма номер fail_from (с нуля) каждая отправка завершается ошибкой error,
+        а адреса из refused отклоняются сервером
+        """
+        send_messages = EmailBackend.send_messages
+        sent = []
+
+        def send(backend, messages):
+            if fail_from is not None and len(sent) >= fail_from:
+                raise error
+            if messages[0].to[0] in refused:
+                raise smtplib.SMTPRecipientsRefused({messages[0].to[0]: (550, b'No such user')})
+            sent.extend(messages)
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', send), \
+                mock.patch.object(send_mail_chunk, 'retry', side_effect=lambda **kwargs: ChunkRetried(**kwargs)):
+            send_mail_chunk(self.mailer.pk, self.job.pk, self.client_ids[0], self.client_ids[-1], failed_attempts)
+        return sent
+
+    def test_disconnect_retries_only_remaining_recipients(self):
+        with self.assertRaises(ChunkRetried) as retried:
+            self.run_chunk(fail_from=2)
+
+        self.assertEqual(retried.exception.kwargs['args'],
+                         (self.mailer.pk, self.job.pk, self.client_ids[2], self.client_ids[-1], 1))
+        self.assertEqual(MessageLog.objects.filter(mailer=self.mailer, status=True).count(), 2)
+
+    def test_recipients_fail_after_connection_retries(self):
+        self.run_chunk(failed_attempts=tasks.CONNECTION_RETRIES, fail_from=0)
+
+        self.assertEqual(MessageLog.objects.filter(mailer=self.mailer, status=False).count(), 5)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.sent, self.job.failed), (0, 5))
+
+    def test_rate_limit_retry_does_not_count_as_attempt(self):
+        limiter = mock.Mock()
+        limiter.acquire.side_effect = [None, None, None, RateLimitExceeded(120)]
+        with mock.patch.object(tasks, 'SmtpRateLimiter', return_value=limiter), \
+                self.assertRaises(ChunkRetried) as retried:
+            self.run_chunk(failed_attempts=2)
+
+        self.assertEqual(retried.exception.kwargs['args'],
+                         (self.mailer.pk, self.job.pk, self.client_ids[3], self.client_ids[-1], 2))
+        self.assertEqual(retried.exception.kwargs['countdown'], 120)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.sent, 3)
+
+    def test_chunk_results_are_written_by_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.run_chunk(refused={'client1@example.com'})
+
+        log_table = MessageLog._meta.db_table
+        inserts = [query['sql'] for query in queries if query['sql'].startswith(f'INSERT INTO "{log_table}"')]
+        self.assertEqual(len(inserts), 1)
+        refused = MessageLog.objects.get(mailer=self.mailer, status=False)
+        self.assertEqual((refused.client.email, refused.smtp_code), ('client1@example.com', 550))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.sent, self.job.failed), (4, 1))
+        daily = MailerDailyStats.objects.get(mailer=self.mailer)
+        self.assertEqual((daily.day, daily.sent, daily.failed), (timezone.localdate(), 4, 1))
+
+    def test_retried_chunk_adds_to_job_counters(self):
+        with self.assertRaises(ChunkRetried) as retried:
+            self.run_chunk(fail_from=2)
+        with mock.patch.object(send_mail_chunk, 'retry'):
+            send_mail_chunk(*retried.exception.kwargs['args'])
+
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.sent, self.job.failed), (5, 0))
+        self.assertEqual(MailerDailyStats.objects.get(mailer=self.mailer).sent, 5)
+        self.assertEqual(MessageLog.objects.filter(mailer=self.mailer).count(), 5)
+
+    def test_context_is_reused_within_ttl(self):
+        context = mailing.get_mailing_context(self.mailer.pk)
+        with self.assertNumQueries(0):
+            self.assertIs(mailing.get_mailing_context(self.mailer.pk), context)
+
+    def test_context_refresh_reloads_message(self):
+        context = mailing.get_mailing_context(self.mailer.pk)
+        EmailMessage.objects.filter(pk=self.mailer.email_message_id).update(message_title='Новое письмо')
+        with self.assertNumQueries(1):
+            refreshed = mailing.get_mailing_context(self.mailer.pk, refresh=True)
+        self.assertIsNot(refreshed, context)
+        self.assertEqual(refreshed.message_title, 'Новое письмо')
+
+    def test_expired_context_is_reloaded(self):
+        context = mailing.get_mailing_context(self.mailer.pk)
+        expired = context.loaded_at + settings.MAILING_CONTEXT_CACHE_SECONDS
+        with mock.patch.object(mailing.time, 'monotonic', return_value=expired), self.assertNumQueries(1):
+            reloaded = mailing.get_mailing_context(self.mailer.pk)
+        self.assertIsNot(reloaded, context)
+        self.assertEqual(reloaded.loaded_at, expired)
+
+    def test_cached_context_reads_status_from_database(self):
+        context = mailing.get_mailing_context(self.mailer.pk)
+        self.assertFalse(context.is_cancelled())
+        MailingStatus.objects.filter(pk=context.status_id).update(is_started=False)
+        with self.assertNumQueries(1):
+            self.assertTrue(mailing.get_mailing_context(self.mailer.pk).is_cancelled())
+
+    def test_failed_chunk_marks_job_failed(self):
+        with mock.patch.object(tasks, 'chord') as mailing_chord:
+            tasks.send_mail(self.mailer.pk, self.job.pk)
+        body = mailing_chord.return_value.call_args.args[0]
+        errback = body.options['link_error'][0]
+        self.assertEqual(errback.task, fail_mailing_job.name)
+
+        # так Celery вызывает обработчик ошибки chord: (request, exc, traceback) и аргументы подписи
+        errback(SimpleNamespace(id='chunk'), RuntimeError('database is locked'), None)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, MailingJob.STATUS_FAILED)
+
+
+@override_settings(MAILING_RATE_LIMIT_MAX_WAIT=5)
+class SmtpRateLimiterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def make_limiter(self, per_minute=2, per_day=1000):
+        return SmtpRateLimiter('smtp.example.com:sender', per_minute=per_minute, per_day=per_day, client=self.redis)
+
+    def test_bucket_is_shared_between_workers(self):
+        first, second = self.make_limiter(), self.make_limiter()
+        self.assertEqual(first.try_acquire(), 0)
+        self.assertEqual(second.try_acquire(), 0)
+        # минутная корзина на 2 письма пополняется одним жетоном за 30 секунд
+        self.assertAlmostEqual(first.try_acquire(), 30, delta=1)
+
+    def test_tokens_are_taken_only_if_all_buckets_have_them(self):
+        limiter = self.make_limiter(per_minute=10, per_day=1)
+        self.assertEqual(limiter.try_acquire(), 0)
+        self.assertGreater(limiter.try_acquire(), 60 * 60)
+        tokens = float(self.redis.hget('ratelimit:smtp:smtp.example.com:sender:minute', 'tokens'))
+        self.assertAlmostEqual(tokens, 9, delta=0.1)
+
+    def test_long_wait_raises(self):
+        limiter = self.make_limiter(per_minute=1)
+        limiter.acquire()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.acquire()
+        self.assertAlmostEqual(raised.exception.retry_after, 60, delta=1)
+
+    def test_disabled_without_redis_or_limits(self):
+        self.assertFalse(SmtpRateLimiter(per_minute=0, per_day=0, client=self.redis).enabled)
+        self.assertEqual(self.make_limiter(per_minute=0, per_day=0).try_acquire(), 0)
+
+    def test_connection_is_not_opened_when_limit_is_exhausted(self):
+        limiter = self.make_limiter(per_minute=1)
+        limiter.acquire()
+        connection_factory = mock.Mock()
+        with self.assertRaises(RateLimitExceeded):
+            with BatchMailSender(connection_factory=connection_factory, rate_limiter=limiter) as sender:
+                sender.send(mock.Mock())
+        connection_factory.assert_not_called()
+
+
+# Отчет о запросах и времени ответа всех страниц, перезаписывается при каждом прогоне тестов
+QUERY_BUDGET_REPORT = os.path.join(settings.BASE_DIR, 'bench_output.txt')
+# Время ответа по умолчанию только записывается в отчет, потому что зависит от загрузки машины. Чтобы тест падал
+# при превышении бюджета времени, задайте множитель бюджета (например, QUERY_BUDGET_TIME_FACTOR=1 локально)
+QUERY_BUDGET_TIME_FACTOR = float(os.getenv('QUERY_BUDGET_TIME_FACTOR', 0)) or None
+
+_report_rows = []
+
+
+def write_query_budget_report():
+    lines = [f'{"Адрес":<40} {"Метод":<6} {"Запросов":>8} {"Бюджет":>7} {"Время, мс":>10} {"Бюджет, мс":>10}']
+    for name, method, queries, max_queries, elapsed, max_elapsed in sorted(_report_rows):
+        over_budget = '  превышено время' if elapsed > max_elapsed else ''
+        lines.append(f'{name:<40} {method:<6} {queries:>8} {max_queries:>7} {elapsed:>10.1f} {max_elapsed:>10.0f}'
+                     f'{over_budget}')
+    with open(QUERY_BUDGET_REPORT, 'w', encoding='utf-8') as report:
+        report.write('\n'.join(lines) + '\n')
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Базовый класс проверки бюджетов страниц: для каждого адреса приложения задается максимум SQL запросов
+    и времени ответа на заполненной базе. Новый N+1 запрос ломает тест, а время ответа проверяется, только если
+    задан QUERY_BUDGET_TIME_FACTOR. Все замеры записываются в отчет QUERY_BUDGET_REPORT для сравнения между прогонами.
+    В наследнике нужно задать namespace приложения и budgets - {имя адреса: (запросов, миллисекунд)}
+    """
+    namespace = None
+    budgets = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        write_query_budget_report()
+
+    def setUp(self):
+        # страницы под cache_page и счетчики в кеше измеряются без прогретого кеша
+        cache.clear()
+
+    def assertBudgetsCoverAllRoutes(self):
+        names = set()
+        for resolver in get_resolver().url_patterns:
+            if isinstance(resolver, URLResolver) and resolver.namespace == self.namespace:
+                names.update(f'{self.namespace}:{pattern.name}' for pattern in resolver.url_patterns)
+        self.assertEqual(set(self.budgets), names, 'Для каждого адреса приложения нужен бюджет')
+
+    def assertWithinBudget(self, name, url, method='get', data=None, status=200):
+        max_queries, max_elapsed = self.budgets[name]
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        _report_rows.append((name, method.upper(), len(queries), max_queries, elapsed, max_elapsed))
+
+        with self.subTest(name):
+            self.assertEqual(response.status_code, status)
+            self.assertLessEqual(len(queries), max_queries, '\n'.join(q['sql'] for q in queries.captured_queries))
+            if QUERY_BUDGET_TIME_FACTOR is not None:
+                self.assertLessEqual(elapsed, max_elapsed * QUERY_BUDGET_TIME_FACTOR)
+
+
+class MainQueryBudgetTestCase(QueryBudgetTestCase):
+    namespace = 'main'
+    budgets = {
+        # сессия, пользователь, три счетчика при пустом кеше, список записей блога и сами записи
+        'main:index': (7, 300),
+        'main:client_list': (3, 300),
+        'main:client_form': (2, 300),
+        'main:client_import': (2, 300),
+        'main:client_detail': (3, 300),
+        'main:client_delete': (3, 300),
+        'main:client_update': (4, 300),
+        'main:emailmessage_list': (3, 300),
+        'main:emailmessage_form': (2, 300),
+        'main:emailmessage_detail': (3, 300),
+        'main:emailmessage_delete': (3, 300),
+        'main:emailmessage_update': (3, 300),
+        'main:mailer_list': (3, 300),
+        # в форме рассылки выводится список выбора из всех клиентов владельца
+        'main:mailer_form': (5, 1000),
+        'main:mailer_detail': (3, 300),
+        'main:mailer_delete': (3, 300),
+        'main:mailer_update': (8, 1000),
+        'main:mail_settings_list': (3, 300),
+        'main:mail_settings_form': (3, 300),
+        'main:mail_settings_detail': (3, 300),
+        'main:mail_settings_delete': (3, 300),
+        'main:mail_settings_update': (4, 300),
+        'main:start_mailer': (12, 300),
+        'main:complete_mailer': (10, 300),
+        'main:mailing_job_status': (3, 300),
+        'main:export_clients': (3, 1000),
+        'main:export_logs': (3, 1000),
+        'main:unsubscribe': (3, 300),
+        'main:mail_period_list': (3, 300),
+        'main:mail_period_form': (2, 300),
+        'main:mail_period_detail': (3, 300),
+        'main:mail_period_delete': (3, 300),
+        'main:mail_period_update': (3, 300),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        other = User.objects.create(email='other@example.com')
+
+        Client.objects.bulk_create(
+            Client(email=f'client{number}@example.com', first_name=f'Имя{number}', last_name=f'Фамилия{number}',
+                   owner=cls.owner if number % 5 else other)
+            for number in range(3000)
+        )
+        periods = MailingPeriod.objects.bulk_create(MailingPeriod(owner=cls.owner) for _ in range(200))
+        statuses = MailingStatus.objects.bulk_create(MailingStatus() for _ in range(200))
+        mailing_settings = MailingSettings.objects.bulk_create(
+            MailingSettings(mailing_date=datetime.date(2024, 1, 1), mailing_time=datetime.time(10, 0),
+                            mailing_period=period, mailing_status=status, owner=cls.owner)
+            for period, status in zip(periods, statuses)
+        )
+        messages = EmailMessage.objects.bulk_create(
+            EmailMessage(message_title=f'Письмо {number}', message_body='Текст', owner=cls.owner)
+            for number in range(200)
+        )
+        mailers = Mailer.objects.bulk_create(
+            Mailer(email_message=message, mailing_settings=settings_, owner=cls.owner)
+            for message, settings_ in zip(messages, mailing_settings)
+        )
+        client_ids = list(Client.objects.filter(owner=cls.owner).values_list('pk', flat=True))
+        Mailer.clients.through.objects.bulk_create(
+            Mailer.clients.through(mailer_id=mailer.pk, client_id=client_id)
+            for mailer in mailers for client_id in client_ids[mailer.pk % 100:][:20]
+        )
+        MessageLog.objects.bulk_create(
+            MessageLog(mailer=mailers[number % len(mailers)], client_id=client_ids[number % len(client_ids)],
+                       status=bool(number % 7), smtp_code=250, last_attempt=timezone.now())
+            for number in range(5000)
+        )
+
+        cls.mailer = mailers[0]
+        cls.client_obj = Client.objects.get(pk=client_ids[0])
+        cls.job = MailingJob.objects.create(mailer=cls.mailer, task_id='budget-job')
+
+    def test_budgets(self):
+        self.client.force_login(self.owner)
+        mailer = self.mailer
+        period_id = mailer.mailing_settings.mailing_period_id
+        urls = [
+            ('main:index', reverse('main:index')),
+            ('main:client_list', reverse('main:client_list')),
+            ('main:client_form', reverse('main:client_form')),
+            ('main:client_import', reverse('main:client_import')),
+            ('main:client_detail', reverse('main:client_detail', args=[self.client_obj.pk])),
+            ('main:client_delete', reverse('main:client_delete', args=[self.client_obj.pk])),
+            ('main:client_update', reverse('main:client_update', args=[self.client_obj.pk])),
+            ('main:emailmessage_list', reverse('main:emailmessage_list')),
+            ('main:emailmessage_form', reverse('main:emailmessage_form')),
+            ('main:emailmessage_detail', reverse('main:emailmessage_detail', args=[mailer.email_message_id])),
+            ('main:emailmessage_delete', reverse('main:emailmessage_delete', args=[mailer.email_message_id])),
+            ('main:emailmessage_update', reverse('main:emailmessage_update', args=[mailer.email_message_id])),
+            ('main:mailer_list', reverse('main:mailer_list')),
+            ('main:mailer_form', reverse('main:mailer_form')),
+            ('main:mailer_detail', reverse('main:mailer_detail', args=[mailer.pk])),
+            ('main:mailer_delete', reverse('main:mailer_delete', args=[mailer.pk])),
+            ('main:mailer_update', reverse('main:mailer_update', args=[mailer.pk])),
+            ('main:mail_settings_list', reverse('main:mail_settings_list')),
+            ('main:mail_settings_form', reverse('main:mail_settings_form')),
+            ('main:mail_settings_detail', reverse('main:mail_settings_detail', args=[mailer.mailing_settings_id])),
+            ('main:mail_settings_delete', reverse('main:mail_settings_delete', args=[mailer.mailing_settings_id])),
+            ('main:mail_settings_update', reverse('main:mail_settings_update', args=[mailer.mailing_settings_id])),
+            ('main:mailing_job_status', reverse('main:mailing_job_status', args=[self.job.pk])),
+            ('main:export_clients', reverse('main:export_clients')),
+            ('main:export_logs', reverse('main:export_logs')),
+            ('main:mail_period_list', reverse('main:mail_period_list')),
+            ('main:mail_period_form', reverse('main:mail_period_form')),
+            ('main:mail_period_detail', reverse('main:mail_period_detail', args=[period_id])),
+            ('main:mail_period_delete', reverse('main:mail_period_delete', args=[period_id])),
+            ('main:mail_period_update', reverse('main:mail_period_update', args=[period_id])),
+        ]
+        for name, url in urls:
+            self.assertWithinBudget(name, url)
+
+        self.assertWithinBudget('main:start_mailer', reverse('main:start_mailer', args=[mailer.pk]), method='post',
+                                status=302)
+        self.assertWithinBudget('main:complete_mailer', reverse('main:complete_mailer', args=[mailer.pk]),
+                                method='post', status=302)
+
+        unsubscribe_url = reverse('main:unsubscribe', args=[
+            personalization.make_unsubscribe_token(mailer.pk, self.client_obj.pk)
+        ])
+        self.assertWithinBudget('main:unsubscribe', unsubscribe_url)
+
+    def test_budgets_cover_all_routes(self):
+        self.assertBudgetsCoverAllRoutes()
+
+
+class FragmentCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        cls.other = User.objects.create(email='other@example.com')
+        cls.client_record = Client.objects.create(email='first@example.com', first_name='Иван', last_name='Первый',
+                                                  owner=cls.owner)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_client_list(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('main:client_list'))
+
+    def test_fragment_is_per_user(self):
+        self.assertContains(self.get_client_list(self.owner), 'Первый')
+        self.assertNotContains(self.get_client_list(self.other), 'Первый')
+
+    def test_cached_fragment_skips_list_query(self):
+        self.get_client_list(self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('main:client_list'))
+        self.assertContains(response, 'Первый')
+        self.assertFalse(any('main_client' in query['sql'] for query in queries.captured_queries))
+
+    def test_fragment_evicted_after_lookup_is_still_rendered(self):
+        self.get_client_list(self.owner)
+        lookup = FragmentCacheMixin.get_cached_fragment
+
+        def lookup_then_evict(view):
+            fragment = lookup(view)
+            cache.clear()
+            return fragment
+
+        with mock.patch.object(FragmentCacheMixin, 'get_cached_fragment', lookup_then_evict):
+            response = self.client.get(reverse('main:client_list'))
+        self.assertContains(response, 'Первый')
+
+    def test_change_invalidates_owner_fragment(self):
+        self.get_client_list(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(email='second@example.com', first_name='Петр', last_name='Второй',
+                                  owner=self.owner)
+        self.assertContains(self.get_client_list(self.owner), 'Второй')
+
+    def test_dashboard_counters_are_fresh(self):
+        self.client.force_login(self.owner)
+        self.assertContains(self.client.get(reverse('main:index')), 'Кол-во получателей рассылок: 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(email='second@example.com', first_name='Петр', last_name='Второй',
+                                  owner=self.other)
+        self.assertContains(self.client.get(reverse('main:index')), 'Кол-во получателей рассылок: 2')
+
+    def test_dashboard_survives_unrelated_changes(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('main:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMessage.objects.create(message_title='Письмо', message_body='Текст', owner=self.other)
+        with mock.patch('blog.services.random_published_blogs', return_value=[]) as blogs:
+            self.assertContains(self.client.get(reverse('main:index')), 'Кол-во получателей рассылок: 1')
+        blogs.assert_not_called()
+
+
+class OwnerAccessTestCase(TestCase):
+    """Чужие записи недоступны: 404 вместо страницы, сотрудник видит записи всех пользователей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        cls.other = User.objects.create(email='other@example.com')
+        cls.staff = User.objects.create(email='staff@example.com', is_staff=True)
+        period = MailingPeriod.objects.create(owner=cls.owner)
+        mailing_settings = MailingSettings.objects.create(
+            mailing_date=datetime.date(2024, 1, 1), mailing_time=datetime.time(10, 0), mailing_period=period,
+            mailing_status=MailingStatus.objects.create(), owner=cls.owner,
+        )
+        email_message = EmailMessage.objects.create(message_title='Письмо', message_body='Текст', owner=cls.owner)
+        cls.mailer = Mailer.objects.create(email_message=email_message, mailing_settings=mailing_settings,
+                                           owner=cls.owner)
+        client_record = Client.objects.create(email='client@example.com', first_name='Имя', last_name='Фамилия',
+                                              owner=cls.owner)
+        cls.urls = [
+            reverse(f'main:{prefix}_{action}', args=[record.pk])
+            for prefix, record in (('client', client_record), ('emailmessage', email_message),
+                                   ('mailer', cls.mailer), ('mail_settings', mailing_settings),
+                                   ('mail_period', period))
+            for action in ('detail', 'update', 'delete')
+        ]
+
+    def test_other_owner_gets_404(self):
+        self.client.force_login(self.other)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_owner_and_staff_see_records(self):
+        for user in (self.owner, self.staff):
+            self.client.force_login(user)
+            for url in self.urls:
+                with self.subTest(user=user.email, url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_other_owner_cannot_start_or_complete_mailer(self):
+        self.client.force_login(self.other)
+        for name in ('start_mailer', 'complete_mailer'):
+            with self.subTest(name=name):
+                response = self.client.post(reverse(f'main:{name}', args=[self.mailer.pk]))
+                self.assertEqual(response.status_code, 404)
+        self.assertFalse(MailingJob.objects.filter(mailer=self.mailer).exists())
+
+    def test_staff_can_start_any_mailer(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('main:start_mailer', args=[self.mailer.pk]),
+                                    HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.mailer.mailing_settings.mailing_status.refresh_from_db()
+        self.assertTrue(self.mailer.mailing_settings.mailing_status.is_started)
+
+
+class DashboardCountersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        cls.email_message = EmailMessage.objects.create(message_title='Письмо', message_body='Текст', owner=cls.owner)
+        cls.mailing_settings = MailingSettings.objects.create(
+            mailing_date=datetime.date(2024, 1, 1), mailing_time=datetime.time(10, 0),
+            mailing_period=MailingPeriod.objects.create(owner=cls.owner),
+            mailing_status=MailingStatus.objects.create(), owner=cls.owner,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCounters(self, mailers, active_mailers, clients):
+        self.assertEqual(stats.get_dashboard_counters(),
+                         {'mailers': mailers, 'active_mailers': active_mailers, 'clients': clients})
+
+    def test_signals_keep_counters(self):
+        self.assertCounters(0, 0, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            client_record = Client.objects.create(email='client@example.com', first_name='Имя', last_name='Фамилия',
+                                                  owner=self.owner)
+            mailer = Mailer.objects.create(email_message=self.email_message, mailing_settings=self.mailing_settings,
+                                           owner=self.owner)
+        self.assertCounters(1, 0, 1)
+
+        mailing_status = self.mailing_settings.mailing_status
+        mailing_status.is_started = True
+        with self.captureOnCommitCallbacks(execute=True):
+            mailing_status.save()
+        self.assertCounters(1, 1, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mailer.delete()
+            client_record.delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.assertCounters(0, 0, 0)
+        # bulk_create не отправляет сигналы, а счетчик мог быть испорчен вручную
+        Client.objects.bulk_create(
+            Client(email=f'client{number}@example.com', first_name='Имя', last_name='Фамилия', owner=self.owner)
+            for number in range(3)
+        )
+        cache.set(stats._counter_key('mailers'), 42, timeout=None)
+        self.assertCounters(42, 0, 0)
+
+        self.assertEqual(tasks.reconcile_dashboard_counters(), {'mailers': 0, 'active_mailers': 0, 'clients': 3})
+        self.assertCounters(0, 0, 3)
+
+
+class MessageLogPartitionsCommandTestCase(TestCase):
+
+    @skipIf(connection.vendor == 'postgresql', 'Таблица логов секционируется на PostgreSQL')
+    def test_requires_partitioned_table(self):
+        with self.assertRaises(CommandError):
+            call_command('messagelog_partitions')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Секционирование лога отправки есть только на PostgreSQL')
+class MessageLogPartitionsTestCase(TestCase):
+    today = datetime.date(2030, 5, 17)
+
+    def partition_of(self, log) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM "{partitions.TABLE}" WHERE id = %s', [log.pk])
+            return cursor.fetchone()[0]
+
+    def test_ensure_partitions_creates_months_ahead(self):
+        created = partitions.ensure_partitions(2, today=self.today)
+        self.assertEqual(created, [partitions.partition_name(datetime.date(2030, month, 1)) for month in (5, 6, 7)])
+        self.assertEqual(partitions.ensure_partitions(2, today=self.today), [])
+
+    def test_rows_in_default_partition_are_moved(self):
+        log = MessageLog.objects.create(status=True, last_attempt=datetime.datetime(2030, 6, 3, tzinfo=UTC))
+        self.assertEqual(self.partition_of(log), partitions.DEFAULT_PARTITION)
+
+        with self.assertLogs('main.partitions', 'WARNING'):
+            partitions.ensure_partitions(1, today=self.today)
+
+        self.assertEqual(self.partition_of(log), partitions.partition_name(datetime.date(2030, 6, 1)))
+        self.assertTrue(MessageLog.objects.filter(pk=log.pk).exists())
+
+    def test_expired_partitions_are_archived_and_dropped(self):
+        old_month = datetime.date(2001, 1, 1)
+        name = partitions.create_partition(old_month)
+        MessageLog.objects.create(status=True, last_attempt=datetime.datetime(2001, 1, 15, tzinfo=UTC))
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+
+        call_command('messagelog_partitions', archive_dir=archive_dir, stdout=io.StringIO())
+
+        self.assertNotIn(old_month, partitions.list_partitions())
+        with gzip.open(os.path.join(archive_dir, f'{name}.csv.gz'), 'rt') as archive:
+            self.assertEqual(len(archive.read().splitlines()), 2)
+
+class KeysetPaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+        Client.objects.bulk_create(
+            Client(email=f'client{number}@example.com', first_name='Имя', last_name=f'Фамилия{number}',
+                   owner=cls.owner)
+            for number in range(30)
+        )
+        cls.pks = list(Client.objects.order_by('pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('main:client_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_pages_link_to_each_other(self):
+        first = self.get_page()
+        self.assertEqual((first.has_previous(), first.has_next()), (False, True))
+        second = self.get_page(after=first.next_cursor)
+        self.assertEqual((second.has_previous(), second.has_next()), (True, False))
+        self.assertEqual([client.pk for client in self.get_page(before=second.previous_cursor)], self.pks[:24])
+
+    def test_out_of_range_cursor_has_no_links(self):
+        for params in ({'after': self.pks[-1] + 100}, {'before': self.pks[0]}):
+            with self.subTest(**params):
+                page = self.get_page(**params)
+                self.assertEqual(len(page), 0)
+                self.assertFalse(page.has_other_pages())
+        self.assertNotContains(self.client.get(reverse('main:client_list'), {'after': self.pks[-1]}), '=None')
+
+class ClientImportTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='owner@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def upload(self, content: str):
+        return self.client.post(reverse('main:client_import'), {
+            'file': SimpleUploadedFile('clients.csv', content.encode()), 'delimiter': ',',
+        })
+
+    def test_small_file_is_imported_in_request(self):
+        response = self.upload('email,first_name,last_name\nivan@example.com,Иван,Иванов\n')
+        self.assertContains(response, 'Добавлено: 1')
+        self.assertTrue(Client.objects.filter(email='ivan@example.com', owner=self.owner).exists())
+
+    def test_malformed_file_is_form_error(self):
+        # поле длиннее csv.field_size_limit() - csv.Error при чтении
+        response = self.upload('email,first_name,last_name,comment\n'
+                               f'ivan@example.com,Иван,Иванов,"{"x" * 200000}"\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Файл не удалось прочитать')
+
+    def test_duplicate_across_batches_is_not_counted_as_update(self):
+        content = 'email,first_name,last_name\n' + ''.join(
+            f'{email}@example.com,Имя,Фамилия\n' for email in ('first', 'second', 'third', 'first')
+        )
+        result = imports.import_clients(io.StringIO(content), self.owner, batch_size=2)
+        self.assertEqual((result.created, result.updated, result.duplicates), (3, 0, 1))
+
+        result = imports.import_clients(io.StringIO(content), self.owner, batch_size=2)
+        self.assertEqual((result.created, result.updated, result.duplicates), (0, 3, 1))
+        self.assertEqual(Client.objects.filter(owner=self.owner).count(), 3)
+
+    def test_large_file_is_imported_by_worker(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        rows = ''.join(f'client{number}@example.com,Имя,Фамилия\n' for number in range(50))
+        with override_settings(MEDIA_ROOT=media_root, CLIENT_IMPORT_SYNC_MAX_SIZE=100):
+            response = self.upload('email,first_name,last_name\n' + rows)
+
+            self.assertContains(response, 'импортируется в фоне')
+            self.assertEqual(Client.objects.filter(owner=self.owner).count(), 50)
+            self.assertEqual(default_storage.listdir('imports')[1], [])
+        report = OutboxEmail.objects.get(recipient=self.owner.email)
+        self.assertIn('Добавлено: 50', report.body)
+
+
+class ImageVariantsTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def make_image(self, name='photo.jpg', size=(2400, 1200), image_format='JPEG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_variants_are_generated_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.create(title='Запись', slug='zapis', preview=self.make_image())
+
+        name = blog.preview.name
+        self.assertTrue(images.variants_exist(name))
+        for size, (width, height) in settings.IMAGE_VARIANT_SIZES.items():
+            for extension in ('jpg', 'webp'):
+                with default_storage.open(images.variant_name(name, size, extension)) as file:
+                    variant = Image.open(file)
+                    self.assertLessEqual(variant.width, width)
+                    self.assertLessEqual(variant.height, height)
+                    # пропорции оригинала 2:1 сохраняются
+                    self.assertEqual(variant.width, variant.height * 2)
+
+        self.assertTrue(media_path.thumbnail(blog.preview, 'card').endswith('.card.jpg'))
+        self.assertTrue(media_path.webp(blog.preview, 'card').endswith('.card.webp'))
+
+    def test_original_is_served_until_variants_exist(self):
+        name = default_storage.save('preview/photo.png', self.make_image('photo.png', image_format='PNG'))
+        self.assertEqual(media_path.thumbnail(name, 'card'), f'/media/{name}')
+        self.assertEqual(media_path.webp(name, 'card'), '')
+
+        images.generate_variants(name)
+        self.assertTrue(media_path.thumbnail(name, 'small').endswith('.small.png'))
+
+    def test_small_image_is_not_enlarged(self):
+        name = default_storage.save('users/avatar.jpg', self.make_image('avatar.jpg', size=(64, 64)))
+        images.generate_variants(name)
+        with default_storage.open(images.variant_name(name, 'card', 'webp')) as file:
+            self.assertEqual(Image.open(file).size, (64, 64))
+
+    def assertVariantsDeleted(self, name):
+        self.assertFalse(images.variants_exist(name))
+        for size in settings.IMAGE_VARIANT_SIZES:
+            for extension in ('jpg', 'webp'):
+                self.assertFalse(default_storage.exists(images.variant_name(name, size, extension)))
+        self.assertTrue(default_storage.exists(name))
+
+    def test_render_does_not_check_storage(self):
+        name = default_storage.save('preview/photo.jpg', self.make_image())
+        images.generate_variants(name)
+        with mock.patch.object(FileSystemStorage, 'exists', autospec=True) as exists:
+            media_path.thumbnail(name, 'card')
+            media_path.webp(name, 'card')
+        exists.assert_not_called()
+
+    def test_variants_without_webp_support_are_served(self):
+        name = default_storage.save('preview/photo.jpg', self.make_image())
+        with mock.patch.object(images.features, 'check', return_value=False):
+            images.generate_variants(name)
+
+        self.assertTrue(images.variants_exist(name))
+        self.assertTrue(media_path.thumbnail(name, 'card').endswith('.card.jpg'))
+        self.assertEqual(media_path.webp(name, 'card'), '')
+
+        # ответ хранилища после вытеснения из кеша такой же
+        cache.clear()
+        self.assertEqual(images.variant_formats(name), ('jpg',))
+
+    def test_variants_are_deleted_with_blog(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.create(title='Запись', slug='zapis', preview=self.make_image())
+        name = blog.preview.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blog.delete()
+        self.assertVariantsDeleted(name)
+        self.assertEqual(media_path.thumbnail(name, 'card'), f'/media/{name}')
+
+    def test_replaced_avatar_variants_are_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(email='owner@example.com', avatar=self.make_image('avatar.jpg'))
+        old_name = user.avatar.name
+
+        user.avatar = self.make_image('new.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertVariantsDeleted(old_name)
+        self.assertTrue(images.variants_exist(user.avatar.name))
+
+
+class StaticFilesPipelineTestCase(SimpleTestCase):
+
+    def setUp(self):
+        source, static_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, static_root)
+        os.makedirs(os.path.join(source, 'css'))
+        os.makedirs(os.path.join(source, 'img'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as file:
+            file.write('body { background: url(../img/logo.svg); }\n' + '.card { margin: 0; }\n' * 200)
+        with open(os.path.join(source, 'img', 'logo.svg'), 'w') as file:
+            file.write('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=static_root,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'config.staticfiles.CompressedManifestStaticFilesStorage'
+            }},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_hashed_file_is_served_compressed_and_immutable(self):
+        url = static('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        # ссылка на изображение внутри стилей тоже указывает на имя с хешем
+        self.assertIn(os.path.basename(static('img/logo.svg')), body)
+
+    def test_refused_encoding_is_not_served(self):
+        url = static('css/site.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='*;q=0'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_accept_encoding_is_parsed_with_q_values(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br;q=0'), {'gzip', 'deflate'})
+        self.assertEqual(accepted_encodings('GZIP; q=0.8, identity;q=0'), {'gzip'})
+        self.assertEqual(accepted_encodings('br;q=0, *'), {'*', 'gzip'})
+        self.assertEqual(accepted_encodings('gzip;q=oops'), set())
+        self.assertEqual(accepted_encodings(''), set())
+
+    def test_unhashed_file_is_revalidated(self):
+        response = self.client.get('/static/css/site.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        revalidated = self.client.get('/static/css/site.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidated.status_code, 304)
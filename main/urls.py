@@ -1,5 +1,4 @@
 from django.urls import path
-from django.views.decorators.cache import cache_page
 
 from main.apps import MainConfig
 from main.views import IndexListView, ClientListView, ClientCreateView, ClientDetailView, ClientDeleteView, \
@@ -7,15 +6,17 @@ from main.views import IndexListView, ClientListView, ClientCreateView, ClientDe
     EmailMessageUpdateView, MailerListView, MailerCreateView, MailerDetailView, MailerDeleteView, MailerUpdateView, \
     MailingSettingsListView, MailingSettingsCreateView, MailingSettingsDetailView, MailingSettingsDeleteView, \
     MailingSettingsUpdateView, start_mailer, complete_mailer, MailingPeriodListView, MailingPeriodCreateView, \
-    MailingPeriodDetailView, MailingPeriodDeleteView, MailingPeriodUpdateView
+    MailingPeriodDetailView, MailingPeriodDeleteView, MailingPeriodUpdateView, mailing_job_status, ClientImportView, \
+    export_clients, export_logs, unsubscribe
 
 app_name = MainConfig.name
 
 
 urlpatterns = [
-    path('', cache_page(60)(IndexListView.as_view()), name='index'),
+    path('', IndexListView.as_view(), name='index'),
     path('clients/', ClientListView.as_view(), name='client_list'),
     path('create_client/', ClientCreateView.as_view(), name='client_form'),
+    path('import_clients/', ClientImportView.as_view(), name='client_import'),
     path('client/<int:pk>/', ClientDetailView.as_view(), name='client_detail'),
     path('delete/<int:pk>', ClientDeleteView.as_view(), name='client_delete'),
     path('update/<int:pk>', ClientUpdateView.as_view(), name='client_update'),
@@ -36,6 +37,10 @@ urlpatterns = [
     path('mail_settings/update/<int:pk>', MailingSettingsUpdateView.as_view(), name='mail_settings_update'),
     path('start_mailer/<int:mailer_id>', start_mailer, name='start_mailer'),
     path('complete_mailer/<int:mailer_id>', complete_mailer, name='complete_mailer'),
+    path('mailing_job/<int:job_id>/', mailing_job_status, name='mailing_job_status'),
+    path('export/clients/', export_clients, name='export_clients'),
+    path('export/logs/', export_logs, name='export_logs'),
+    path('unsubscribe/<str:token>/', unsubscribe, name='unsubscribe'),
     path('mail_periods/', MailingPeriodListView.as_view(), name='mail_period_list'),
     path('create_mail_period/', MailingPeriodCreateView.as_view(), name='mail_period_form'),
     path('mail_period/<int:pk>/', MailingPeriodDetailView.as_view(), name='mail_period_detail'),
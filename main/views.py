@@ -1,17 +1,27 @@
-from random import random
+import csv
+import io
+from uuid import uuid4
 
-from django.conf.global_settings import EMAIL_HOST_USER
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import HttpResponseRedirect, JsonResponse, Http404, HttpResponseBadRequest
+from django.shortcuts import render
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_GET, require_http_methods
 from django.urls import reverse_lazy, reverse
-from django.views.generic import ListView, CreateView, DetailView, DeleteView, UpdateView
+from django.views.generic import ListView, CreateView, DetailView, DeleteView, UpdateView, FormView
 
-from blog.models import Blog
-from main.forms import MailerCreateForm, MailingSettingsForm, ClientCreateForm, MailingPeriodForm
-from main.models import MailingSettings, Client, EmailMessage, Mailer, MailingPeriod, MailingStatus
-from main.services import random_choice
-from main.tasks import send_mail
+from blog import services as blog_services
+from main.forms import MailerCreateForm, MailingSettingsForm, ClientCreateForm, MailingPeriodForm, ClientImportForm
+from main import scheduler, stats, imports, exports, personalization, caching
+from main.mixins import OwnerObjectMixin, FragmentCacheMixin
+from main.pagination import KeysetPaginationMixin
+from main.tasks import import_clients_file
+from main.models import MailingSettings, Client, EmailMessage, Mailer, MailingPeriod, MailingStatus, MailingJob
 
 
 class IndexListView(LoginRequiredMixin, ListView):
@@ -20,40 +30,36 @@ class IndexListView(LoginRequiredMixin, ListView):
     context_object_name = 'clients'
 
     def get_context_data(self, **kwargs):
+        """
+        Фрагмент одинаков для всех пользователей (счетчики общие, шапка с меню находится вне его), поэтому
+        его ключ состоит из значений счетчиков и версии блога: изменения, которые не меняют счетчики,
+        фрагмент не сбрасывают. Счетчики читаются из кеша одним запросом, а записи блога передаются в шаблон
+        функцией, которую шаблон вызывает только внутри фрагмента, которого еще нет в кеше
+        """
         context = super().get_context_data(**kwargs)
-        context['mailers_count'] = len(Mailer.objects.all())
-        context['started_mailers_count'] = len(MailingStatus.objects.filter(is_started=True))
-        context['clients'] = len(Client.objects.all())
-        context['blogs'] = random_choice(Blog.objects.all())
+        counters = stats.get_dashboard_counters()
+        context['counters'] = counters
+        context['blogs'] = blog_services.random_published_blogs
+        context['cache_version'] = '.'.join(
+            [str(counters[name]) for name in stats.DASHBOARD_COUNTERS] + [caching.get_version(caching.BLOG_SCOPE)]
+        )
+        context['fragment_timeout'] = settings.FRAGMENT_CACHE_TIMEOUT
         return context
 
 
-class ClientListView(LoginRequiredMixin, ListView):
+class ClientListView(LoginRequiredMixin, FragmentCacheMixin, KeysetPaginationMixin, ListView):
     model = Client
+    fragment_name = 'client_list'
     context_object_name = 'clients'
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return Client.objects.all()
-        else:
-            return Client.objects.filter(owner=self.request.user)
+        return Client.objects.for_user(self.request.user)
 
 
-class ClientDetailView(LoginRequiredMixin, DetailView):
+class ClientDetailView(LoginRequiredMixin, OwnerObjectMixin, DetailView):
     model = Client
     context_object_name = 'client'
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
-    def get_object(self):
-        obj = super().get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Пользователь не является владельцем данной записи')
-        return obj
-
 
 class ClientCreateView(LoginRequiredMixin, CreateView):
     model = Client
@@ -65,51 +71,59 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class ClientUpdateView(LoginRequiredMixin, UpdateView):
+class ClientImportView(LoginRequiredMixin, FormView):
+    """
+    Загрузка клиентов из CSV файла. Небольшой файл импортируется сразу и после импорта показывается отчет
+    с ошибками по строкам, файл больше CLIENT_IMPORT_SYNC_MAX_SIZE импортирует воркер и присылает отчет на почту
+    """
+    form_class = ClientImportForm
+    template_name = 'main/client_import.html'
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        delimiter = form.cleaned_data['delimiter']
+        if upload.size > settings.CLIENT_IMPORT_SYNC_MAX_SIZE:
+            name = default_storage.save(f'imports/{uuid4()}.csv', upload)
+            import_clients_file.delay(name, self.request.user.pk, delimiter)
+            return self.render_to_response(self.get_context_data(form=ClientImportForm(), queued=True))
+
+        # файл читается потоком, большие загрузки Django хранит во временном файле, а не в памяти
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            result = imports.import_clients(stream, self.request.user, delimiter=delimiter)
+        except (ValueError, csv.Error) as e:
+            form.add_error('file', f'Файл не удалось прочитать: {e}' if isinstance(e, csv.Error) else str(e))
+            return self.form_invalid(form)
+
+        return self.render_to_response(self.get_context_data(form=ClientImportForm(), result=result))
+
+
+class ClientUpdateView(LoginRequiredMixin, OwnerObjectMixin, UpdateView):
     model = Client
     fields = '__all__'
 
     def get_success_url(self):
         return reverse('main:client_detail', args=[self.kwargs.get('pk')])
 
-    def dispatch(self, request, *args, **kwargs):
-        obj = self.get_object()
-        if obj.owner != self.request.user and not self.request.user.is_superuser:
-            raise PermissionDenied('Пользователь не является владельцем данной записи')
-        return super().dispatch(request, *args, **kwargs)
-
 
-class ClientDeleteView(LoginRequiredMixin, DeleteView):
+class ClientDeleteView(LoginRequiredMixin, OwnerObjectMixin, DeleteView):
     model = Client
     success_url = reverse_lazy('main:client_list')
 
 
-class EmailMessageListView(LoginRequiredMixin, ListView):
+class EmailMessageListView(LoginRequiredMixin, FragmentCacheMixin, KeysetPaginationMixin, ListView):
     model = EmailMessage
+    fragment_name = 'emailmessage_list'
     context_object_name = 'mails'
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return EmailMessage.objects.all()
-        else:
-            return EmailMessage.objects.filter(owner=self.request.user)
+        return EmailMessage.objects.for_user(self.request.user)
 
 
-class EmailMessageDetailView(LoginRequiredMixin, DetailView):
+class EmailMessageDetailView(LoginRequiredMixin, OwnerObjectMixin, DetailView):
     model = EmailMessage
     context_object_name = 'mail'
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
-    def get_object(self):
-        obj = super().get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Пользователь не является владельцем данной записи')
-        return obj
-
 
 class EmailMessageCreateView(LoginRequiredMixin, CreateView):
     model = EmailMessage
@@ -121,51 +135,32 @@ class EmailMessageCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class EmailMessageUpdateView(LoginRequiredMixin, UpdateView):
+class EmailMessageUpdateView(LoginRequiredMixin, OwnerObjectMixin, UpdateView):
     model = EmailMessage
     fields = ['message_title', 'message_body']
 
     def get_success_url(self):
         return reverse('main:emailmessage_detail', args=[self.kwargs.get('pk')])
 
-    def dispatch(self, request, *args, **kwargs):
-        obj = self.get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Пользователь не является владельцем данной записи')
-        return super().dispatch(request, *args, **kwargs)
-
 
-class EmailMessageDeleteView(LoginRequiredMixin, DeleteView):
+class EmailMessageDeleteView(LoginRequiredMixin, OwnerObjectMixin, DeleteView):
     model = EmailMessage
     success_url = reverse_lazy('main:emailmessage_list')
 
 
-class MailerListView(LoginRequiredMixin, ListView):
+class MailerListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    # список не кешируется фрагментом: в карточках формы запуска и остановки с CSRF токеном текущей сессии
     model = Mailer
     context_object_name = 'mailer_list'
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return Mailer.objects.all()
-        else:
-            return Mailer.objects.filter(owner=self.request.user)
+        return Mailer.objects.for_user(self.request.user)
 
 
-class MailerDetailView(LoginRequiredMixin, DetailView):
+class MailerDetailView(LoginRequiredMixin, OwnerObjectMixin, DetailView):
     model = Mailer
     context_object_name = 'mailer'
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
-    def get_object(self):
-        obj = super().get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Пользователь не является владельцем данной записи')
-        return obj
-
 
 class MailerCreateView(LoginRequiredMixin, CreateView):
     model = Mailer
@@ -186,51 +181,43 @@ class MailerCreateView(LoginRequiredMixin, CreateView):
         return HttpResponseRedirect(self.get_success_url())
 
 
-class MailerUpdateView(LoginRequiredMixin, UpdateView):
+class MailerUpdateView(LoginRequiredMixin, OwnerObjectMixin, UpdateView):
     model = Mailer
-    fields = ('clients', 'email_message', 'mailing_settings')
+    form_class = MailerCreateForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        # в списках выбора только клиенты, письма и настройки владельца рассылки
+        kwargs['user'] = self.object.owner
+        return kwargs
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        self.object.clients.set(form.cleaned_data['clients'])
+        return response
 
     def get_success_url(self):
         return reverse('main:mailer_detail', args=[self.kwargs.get('pk')])
 
-    def dispatch(self, request, *args, **kwargs):
-        obj = self.get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Вы не являетесь владельцем данной записи')
-        return super().dispatch(request, *args, **kwargs)
 
-
-class MailerDeleteView(LoginRequiredMixin, DeleteView):
+class MailerDeleteView(LoginRequiredMixin, OwnerObjectMixin, DeleteView):
     model = Mailer
     success_url = reverse_lazy('main:mailer_list')
 
 
-class MailingSettingsListView(LoginRequiredMixin, ListView):
+class MailingSettingsListView(LoginRequiredMixin, FragmentCacheMixin, KeysetPaginationMixin, ListView):
     model = MailingSettings
+    fragment_name = 'mailingsettings_list'
     context_object_name = 'settings_list'
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return MailingSettings.objects.all()
-        else:
-            return MailingSettings.objects.filter(owner=self.request.user)
+        return MailingSettings.objects.for_user(self.request.user)
 
 
-class MailingSettingsDetailView(LoginRequiredMixin, DetailView):
+class MailingSettingsDetailView(LoginRequiredMixin, OwnerObjectMixin, DetailView):
     model = MailingSettings
     context_object_name = 'settings'
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
-    def get_object(self):
-        obj = super().get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Вы не являетесь владельцем данной записи')
-        return obj
-
 
 class MailingSettingsCreateView(LoginRequiredMixin, CreateView):
     model = MailingSettings
@@ -239,83 +226,190 @@ class MailingSettingsCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.owner = self.request.user
-        mailing_status, created = MailingStatus.objects.get_or_create(is_created=True)
-        form.instance.mailing_status = mailing_status
+        # у каждой настройки свой статус, иначе запуск одной рассылки отмечал бы запущенными все остальные
+        form.instance.mailing_status = MailingStatus.objects.create()
         return super().form_valid(form)
 
 
-class MailingSettingsUpdateView(LoginRequiredMixin, UpdateView):
+class MailingSettingsUpdateView(LoginRequiredMixin, OwnerObjectMixin, UpdateView):
     model = MailingSettings
     form_class = MailingSettingsForm
 
     def get_success_url(self):
         return reverse('main:mail_settings_detail', args=[self.kwargs.get('pk')])
 
-    def dispatch(self, request, *args, **kwargs):
-        obj = self.get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Вы не являетесь владельцем данной записи')
-        return super().dispatch(request, *args, **kwargs)
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        scheduler.reschedule_settings(self.object)
+        return response
 
 
-class MailingSettingsDeleteView(LoginRequiredMixin, DeleteView):
+class MailingSettingsDeleteView(LoginRequiredMixin, OwnerObjectMixin, DeleteView):
     model = MailingSettings
     success_url = reverse_lazy('main:mail_settings_list')
 
 
+def get_user_mailer(user, mailer_id):
+    """Возвращает рассылку, если пользователь является ее владельцем или сотрудником"""
+    queryset = Mailer.objects.select_related('mailing_settings__mailing_status')
+    if not user.is_staff:
+        queryset = queryset.filter(owner=user)
+    try:
+        return queryset.get(pk=mailer_id)
+    except Mailer.DoesNotExist:
+        raise Http404('Рассылка не найдена')
+
+
+def wants_json(request) -> bool:
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+@login_required
+@require_POST
 def start_mailer(request, mailer_id):
-    mailer = Mailer.objects.get(pk=mailer_id)
+    """
+    Ставит рассылку в расписание и сразу возвращает ответ: когда наступит время запуска, планировщик передаст
+    отправку воркеру Celery, а в ответе передается идентификатор задачи, по которому можно узнать ее состояние
+    """
+    mailer = get_user_mailer(request.user, mailer_id)
+    job = None
     if not mailer.mailing_settings.mailing_status.is_started:
         mailer.mailing_settings.mailing_status.is_started = True
         mailer.mailing_settings.mailing_status.is_created = False
         mailer.mailing_settings.mailing_status.save()
 
-        clients_email = [client.email for client in mailer.clients.all()]
-        from_email = EMAIL_HOST_USER
+        job = scheduler.schedule_mailer(mailer)
 
-        send_mail(mailer, clients_email, mailer.email_message.message_title, mailer.email_message.message_body,
-                  mailer.mailing_settings.mailing_date, mailer.mailing_settings.mailing_time,
-                  mailer.mailing_settings.mailing_period, from_email)
+    if wants_json(request):
+        if job is None:
+            return JsonResponse({'error': 'Рассылка уже запущена'}, status=409)
+        return JsonResponse({
+            'job_id': job.pk,
+            'task_id': job.task_id,
+            'status': job.status,
+            'scheduled_at': job.scheduled_at.isoformat(),
+            'status_url': reverse('main:mailing_job_status', args=[job.pk]),
+        }, status=202)
 
-        return HttpResponseRedirect(request.META.get('HTTP_REFERER', 'mailer/'))
+    response = HttpResponseRedirect(request.META.get('HTTP_REFERER', 'mailer/'))
+    if job is not None:
+        response['X-Mailing-Job'] = job.pk
+    return response
 
 
+@login_required
+@require_POST
 def complete_mailer(request, mailer_id):
-    mailer = Mailer.objects.get(pk=mailer_id)
+    mailer = get_user_mailer(request.user, mailer_id)
     if mailer.mailing_settings.mailing_status.is_started:
         mailer.mailing_settings.mailing_status.is_started = False
         mailer.mailing_settings.mailing_status.is_complete = True
         mailer.mailing_settings.mailing_status.save()
-
-        return HttpResponseRedirect(request.META.get('HTTP_REFERER', 'mailer/'))
-
-
-class MailingPeriodListView(LoginRequiredMixin, ListView):
+        scheduler.unschedule_mailer(mailer)
+
+    return HttpResponseRedirect(request.META.get('HTTP_REFERER', 'mailer/'))
+
+
+@login_required
+@require_GET
+def mailing_job_status(request, job_id):
+    """Легковесный эндпоинт состояния задачи рассылки: один запрос к таблице задач по первичному ключу"""
+    queryset = MailingJob.objects.filter(pk=job_id)
+    if not request.user.is_staff:
+        queryset = queryset.filter(mailer__owner=request.user)
+    job = queryset.first()
+    if job is None:
+        raise Http404('Задача рассылки не найдена')
+
+    return JsonResponse({
+        'job_id': job.pk,
+        'task_id': job.task_id,
+        'mailer_id': job.mailer_id,
+        'status': job.status,
+        'counts': job.get_counts(),
+        'updated_at': job.updated_at.isoformat(),
+    })
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def unsubscribe(request, token):
+    """
+    Отписка получателя от рассылки по подписанной ссылке из письма. GET показывает подтверждение,
+    POST отписывает (в том числе one-click отписка почтового клиента по заголовку List-Unsubscribe-Post,
+    поэтому проверка CSRF отключена - подлинность запроса подтверждает подпись токена)
+    """
+    try:
+        mailer_id, client_id = personalization.read_unsubscribe_token(token)
+    except signing.BadSignature:
+        raise Http404('Ссылка отписки недействительна')
+
+    mailer = Mailer.objects.filter(pk=mailer_id).select_related('email_message').first()
+    if mailer is None:
+        raise Http404('Рассылка не найдена')
+
+    unsubscribed = request.method == 'POST'
+    if unsubscribed:
+        mailer.clients.remove(client_id)
+
+    return render(request, 'main/unsubscribe.html', {'mailer': mailer, 'unsubscribed': unsubscribed})
+
+
+def get_export_format(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return None
+    return export_format
+
+
+@login_required
+@require_GET
+def export_clients(request):
+    """Потоковая выгрузка клиентов пользователя (?format=csv|jsonl)"""
+    export_format = get_export_format(request)
+    if export_format is None:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+
+    return exports.streaming_export(exports.client_queryset(request.user), exports.CLIENT_FIELDS, export_format,
+                                    'clients')
+
+
+@login_required
+@require_GET
+def export_logs(request):
+    """
+    Потоковая выгрузка логов отправки (?format=csv|jsonl). Необязательные фильтры:
+    ?mailer=<pk рассылки> и ?since=<ГГГГ-ММ-ДД>
+    """
+    export_format = get_export_format(request)
+    if export_format is None:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+
+    try:
+        mailer_id = int(request.GET['mailer']) if request.GET.get('mailer') else None
+        since = parse_date(request.GET['since']) if request.GET.get('since') else None
+    except ValueError:
+        mailer_id = since = None
+    if (request.GET.get('mailer') and mailer_id is None) or (request.GET.get('since') and since is None):
+        return HttpResponseBadRequest('Некорректный фильтр выгрузки')
+
+    queryset = exports.log_queryset(request.user, mailer_id=mailer_id, since=since)
+    return exports.streaming_export(queryset, exports.LOG_FIELDS, export_format, 'message_logs')
+
+
+class MailingPeriodListView(LoginRequiredMixin, FragmentCacheMixin, KeysetPaginationMixin, ListView):
     model = MailingPeriod
+    fragment_name = 'mailingperiod_list'
     context_object_name = 'period_list'
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return MailingPeriod.objects.all()
-        else:
-            return MailingPeriod.objects.filter(owner=self.request.user)
+        return MailingPeriod.objects.for_user(self.request.user)
 
 
-class MailingPeriodDetailView(LoginRequiredMixin, DetailView):
+class MailingPeriodDetailView(LoginRequiredMixin, OwnerObjectMixin, DetailView):
     model = MailingPeriod
     context_object_name = 'period'
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset(*args, **kwargs)
-        queryset = queryset.filter(pk=self.kwargs['pk'])
-        return queryset
-
-    def get_object(self):
-        obj = super().get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Вы не являетесь владельцем данной записи')
-        return obj
-
 
 class MailingPeriodCreateView(LoginRequiredMixin, CreateView):
     model = MailingPeriod
@@ -327,20 +421,19 @@ class MailingPeriodCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class MailingPeriodUpdateView(LoginRequiredMixin, UpdateView):
+class MailingPeriodUpdateView(LoginRequiredMixin, OwnerObjectMixin, UpdateView):
     model = MailingPeriod
     form_class = MailingPeriodForm
 
     def get_success_url(self):
         return reverse('main:mail_period_detail', args=[self.kwargs.get('pk')])
 
-    def dispatch(self, request, *args, **kwargs):
-        obj = self.get_object()
-        if obj.owner != self.request.user and not self.request.user.is_staff:
-            raise PermissionDenied('Вы не являетесь владельцем данной записи')
-        return super().dispatch(request, *args, **kwargs)
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        scheduler.reschedule_period(self.object)
+        return response
 
 
-class MailingPeriodDeleteView(LoginRequiredMixin, DeleteView):
+class MailingPeriodDeleteView(LoginRequiredMixin, OwnerObjectMixin, DeleteView):
     model = MailingPeriod
     success_url = reverse_lazy('main:mail_period_list')
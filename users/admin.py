@@ -1,8 +1,15 @@
 from django.contrib import admin
 
-from users.models import User
+from users.models import User, OutboxEmail
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('pk', 'email', 'email_is_verified')
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'recipient', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('recipient',)
@@ -1,5 +1,7 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
+from django.template import loader
 
+from users import outbox
 from users.models import User
 
 
@@ -8,3 +10,16 @@ class UserRegisterForm(UserCreationForm):
     class Meta:
         model = User
         fields = ('email', 'password1', 'password2',)
+
+
+class OutboxPasswordResetForm(PasswordResetForm):
+    """Форма сброса пароля, которая записывает письмо в очередь отправки вместо отправки во время запроса"""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = loader.render_to_string(html_email_template_name, context) if html_email_template_name else None
+
+        outbox.enqueue_email(subject, body, to_email, from_email=from_email, html_body=html_body)
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_options_user_is_banned'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=250, verbose_name='Тема')),
+                ('body', models.TextField(verbose_name='Текст письма')),
+                ('html_body', models.TextField(blank=True, null=True, verbose_name='HTML версия письма')),
+                ('from_email', models.CharField(max_length=250, verbose_name='Отправитель')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Получатель')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Не отправлено')], db_index=True, default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+            ],
+            options={
+                'verbose_name': 'Письмо в очереди отправки',
+                'verbose_name_plural': 'Очередь отправки писем',
+            },
+        ),
+    ]
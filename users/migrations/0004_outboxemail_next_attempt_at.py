@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:48
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 NULLABLE = {'blank': True, 'null': True}
 
@@ -27,3 +28,37 @@ class User(AbstractUser):
                 'Can ban user'
             )
         ]
+
+
+class OutboxEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Не отправлено'),
+    )
+
+    subject = models.CharField(max_length=250, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст письма')
+    html_body = models.TextField(verbose_name='HTML версия письма', **NULLABLE)
+    from_email = models.CharField(max_length=250, verbose_name='Отправитель')
+    recipient = models.EmailField(verbose_name='Получатель')
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True,
+                              verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(verbose_name='Последняя ошибка', **NULLABLE)
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(verbose_name='Отправлено', **NULLABLE)
+
+    def __str__(self):
+        return f'{self.subject} для {self.recipient}: {self.get_status_display()}'
+
+    class Meta:
+        verbose_name = 'Письмо в очереди отправки'
+        verbose_name_plural = 'Очередь отправки писем'
@@ -0,0 +1,125 @@
+"""
+Очередь исходящих служебных писем (подтверждение почты, сброс пароля).
+
+Письмо записывается в таблицу OutboxEmail в той же транзакции, что и изменения пользователя, а отправляет его
+воркер Celery. Запрос не ждет SMTP сервер, а письмо не теряется при падении процесса: если задача не была
+поставлена в очередь или не выполнилась, письмо останется в статусе pending и его отправит drain_outbox.
+После неудачной попытки письмо откладывается с экспоненциально растущей паузой (OUTBOX_RETRY_DELAY).
+"""
+import datetime
+
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+
+from main.mailing import BatchMailSender, CONNECTION_ERRORS
+from users.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject: str, body: str, recipient: str, from_email: str = None,
+                  html_body: str = None) -> OutboxEmail:
+    """
+    Записывает письмо в очередь отправки. Задача отправки ставится только после фиксации транзакции,
+    поэтому воркер не увидит письмо пользователя, регистрация которого откатилась
+    """
+    email = OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL_HOST_USER or settings.DEFAULT_FROM_EMAIL,
+        recipient=recipient,
+    )
+    transaction.on_commit(lambda: _schedule_delivery(email.pk))
+    return email
+
+
+def _schedule_delivery(email_id: int):
+    from users.tasks import send_outbox_email
+
+    try:
+        send_outbox_email.delay(email_id)
+    except Exception:
+        # брокер недоступен: письмо уже в базе и будет отправлено периодической задачей
+        logger.warning('Не удалось поставить отправку письма %s в очередь', email_id, exc_info=True)
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    """Пауза перед следующей попыткой: OUTBOX_RETRY_DELAY после первой неудачи, затем вдвое больше каждый раз"""
+    return datetime.timedelta(seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def deliver(email_id: int, sender: BatchMailSender = None) -> bool:
+    """
+    Отправляет письмо из очереди, если оно еще ожидает отправки. Строка блокируется на время отправки
+    (SKIP LOCKED), поэтому одно письмо не отправят одновременно задача и периодическая разборка очереди
+    :param sender: отправитель с общим SMTP соединением, если письма отправляются пачкой
+    :return: True, если письмо отправлено
+    :raises: ошибку соединения, если передан sender и сервер недоступен даже после переподключения
+    (неудачная попытка уже записана), чтобы пачка остановилась
+    """
+    error = None
+    with transaction.atomic():
+        email = OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            pk=email_id, status=OutboxEmail.STATUS_PENDING
+        ).first()
+        if email is None:
+            return False
+
+        message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.recipient])
+        if email.html_body:
+            message.attach_alternative(email.html_body, 'text/html')
+
+        email.attempts += 1
+        try:
+            if sender is None:
+                with BatchMailSender() as single_sender:
+                    single_sender.send(message)
+            else:
+                sender.send(message)
+        except (smtplib.SMTPException, OSError) as e:
+            error = e
+            email.last_error = str(e)
+            if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboxEmail.STATUS_FAILED
+            email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+            email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+        else:
+            email.status = OutboxEmail.STATUS_SENT
+            email.sent_at = timezone.now()
+            email.last_error = None
+            email.save(update_fields=['attempts', 'last_error', 'status', 'sent_at'])
+            return True
+
+    if sender is not None and isinstance(error, CONNECTION_ERRORS):
+        raise error
+    return False
+
+
+def drain_outbox(batch_size: int = None) -> int:
+    """
+    Отправляет ожидающие письма, время следующей попытки которых наступило, через одно SMTP соединение.
+    Разорванное соединение BatchMailSender открывает заново; если сервер недоступен и после этого,
+    остальные письма ждут следующего запуска, не расходуя попытки
+    :return: количество отправленных писем
+    """
+    email_ids = list(OutboxEmail.objects.filter(
+        status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now()
+    ).order_by('pk').values_list('pk', flat=True)[:batch_size or settings.OUTBOX_BATCH_SIZE])
+    if not email_ids:
+        return 0
+
+    sent = 0
+    with BatchMailSender() as sender:
+        for email_id in email_ids:
+            try:
+                sent += deliver(email_id, sender)
+            except CONNECTION_ERRORS:
+                logger.warning('SMTP сервер недоступен, отправка очереди писем отложена', exc_info=True)
+                break
+    return sent
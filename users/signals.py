@@ -0,0 +1,34 @@
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from main.tasks import queue_image_variants, queue_image_variants_deletion
+from users.models import User
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    # имя аватара из базы: по нему при сохранении видно, что аватар заменили или убрали
+    avatar = instance.__dict__.get('avatar')
+    instance._loaded_avatar = avatar if isinstance(avatar, str) else None
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    loaded_avatar = getattr(instance, '_loaded_avatar', None)
+    if loaded_avatar and loaded_avatar != instance.avatar.name:
+        queue_image_variants_deletion(loaded_avatar)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # пользователь сохраняется при каждом входе (last_login), аватар проверяется, только если он мог измениться
+    if update_fields is None or 'avatar' in update_fields:
+        queue_image_variants(instance.avatar)
+        instance._loaded_avatar = instance.avatar.name
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    queue_image_variants_deletion(instance.avatar.name)
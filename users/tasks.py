@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from users import outbox
+
+
+@shared_task()
+def send_outbox_email(email_id: int):
+    """Отправляет письмо из очереди сразу после регистрации или запроса сброса пароля"""
+    return outbox.deliver(email_id)
+
+
+@shared_task()
+def drain_outbox():
+    """Периодически отправляет письма, которые не удалось отправить сразу"""
+    return outbox.drain_outbox()
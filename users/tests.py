@@ -1,3 +1,100 @@
+import datetime
+import smtplib
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from main.tests import QueryBudgetTestCase
+from users import outbox
+from users.models import User, OutboxEmail
+
+
+class UsersQueryBudgetTestCase(QueryBudgetTestCase):
+    namespace = 'users'
+    budgets = {
+        'users:login': (0, 300),
+        'users:logout': (4, 300),
+        'users:register': (0, 300),
+        'users:verify_email': (2, 300),
+        'users:verification_failed': (0, 300),
+        'users:verification_pass': (0, 300),
+        'users:reset_password': (0, 300),
+        'users:password_reset_done': (0, 300),
+        'users:password_reset_confirm': (5, 300),
+        'users:password_reset_complete': (0, 300),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(User(email=f'user{number}@example.com') for number in range(2000))
+        cls.user = User.objects.create(email='new@example.com', is_active=False, token='verification-token')
+
+    def test_budgets(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        for name in ('users:login', 'users:register', 'users:verification_failed', 'users:verification_pass',
+                     'users:reset_password', 'users:password_reset_done', 'users:password_reset_complete'):
+            self.assertWithinBudget(name, reverse(name))
+
+        self.assertWithinBudget('users:verify_email', reverse('users:verify_email', args=[uid, self.user.token]),
+                                status=302)
+        self.user.refresh_from_db()
+        reset_token = default_token_generator.make_token(self.user)
+        self.assertWithinBudget('users:password_reset_confirm',
+                                reverse('users:password_reset_confirm', args=[uid, reset_token]), status=302)
+
+        self.client.force_login(self.user)
+        self.assertWithinBudget('users:logout', reverse('users:logout'), method='post', status=302)
+
+    def test_budgets_cover_all_routes(self):
+        self.assertBudgetsCoverAllRoutes()
+
+
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        self.emails = [
+            outbox.enqueue_email('Подтверждение почты', 'Текст', f'user{number}@example.com') for number in range(3)
+        ]
+
+    def test_drain_reconnects_after_disconnect(self):
+        send_messages = EmailBackend.send_messages
+        calls = []
+
+        def disconnect_once(backend, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', disconnect_once):
+            self.assertEqual(outbox.drain_outbox(), 3)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(list(OutboxEmail.objects.values_list('attempts', flat=True)), [1, 1, 1])
+
+    def test_unreachable_server_backs_off_without_spending_attempts(self):
+        error = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=error):
+            self.assertEqual(outbox.drain_outbox(), 0)
+            first, *rest = OutboxEmail.objects.order_by('pk')
+            self.assertEqual(first.attempts, 1)
+            self.assertEqual([email.attempts for email in rest], [0, 0])
+            self.assertAlmostEqual(first.next_attempt_at, timezone.now() + outbox.retry_delay(1),
+                                   delta=datetime.timedelta(seconds=5))
+
+            # письмо с неудачной попыткой пропускается, пока не наступит время следующей
+            outbox.drain_outbox()
+            first.refresh_from_db()
+            self.assertEqual(first.attempts, 1)
 
-# Create your tests here.
+    def test_retry_delay_doubles(self):
+        self.assertEqual([outbox.retry_delay(attempt).total_seconds() for attempt in (1, 2, 3)],
+                         [settings.OUTBOX_RETRY_DELAY, settings.OUTBOX_RETRY_DELAY * 2, settings.OUTBOX_RETRY_DELAY * 4])
@@ -2,7 +2,7 @@ from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import LoginView, PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, \
     PasswordResetCompleteView
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.template.loader import render_to_string
@@ -12,8 +12,8 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.views.generic import CreateView
 from django.contrib import messages
 
-from config import settings
-from users.forms import UserRegisterForm
+from users import outbox
+from users.forms import UserRegisterForm, OutboxPasswordResetForm
 from users.models import User
 
 
@@ -35,26 +35,28 @@ class RegisterView(CreateView):
     success_url = reverse_lazy('users:login')
 
     def form_valid(self, form):
-        new_user = form.save(commit=False)
-        new_user.is_active = False
-        new_user.save()
-
-        # Генерируем токен для верификации
-        token = default_token_generator.make_token(new_user)
-        new_user.token = token
-        new_user.save()
-        uid = urlsafe_base64_encode(force_bytes(new_user.pk))
-        token_link = reverse('users:verify_email', kwargs={'uidb64': uid, 'token': token})
-
-        # Отправляем письмо с ссылкой на верификацию
-        current_site = get_current_site(self.request)
-        mail_subject = f'Подтвердите вашу почту для регистрации на сайте {current_site}'
-        message = render_to_string('users/verify_email_message.html', {
-            'user': new_user,
-            'domain': current_site.domain,
-            'token_link': token_link,
-        })
-        send_mail(mail_subject, message, settings.EMAIL_HOST_USER, [new_user.email])
+        # Пользователь и письмо с подтверждением сохраняются в одной транзакции, письмо отправит воркер Celery
+        with transaction.atomic():
+            new_user = form.save(commit=False)
+            new_user.is_active = False
+            new_user.save()
+
+            # Генерируем токен для верификации
+            token = default_token_generator.make_token(new_user)
+            new_user.token = token
+            new_user.save()
+            uid = urlsafe_base64_encode(force_bytes(new_user.pk))
+            token_link = reverse('users:verify_email', kwargs={'uidb64': uid, 'token': token})
+
+            # Ставим в очередь письмо с ссылкой на верификацию
+            current_site = get_current_site(self.request)
+            mail_subject = f'Подтвердите вашу почту для регистрации на сайте {current_site}'
+            message = render_to_string('users/verify_email_message.html', {
+                'user': new_user,
+                'domain': current_site.domain,
+                'token_link': token_link,
+            })
+            outbox.enqueue_email(mail_subject, message, new_user.email)
 
         return super().form_valid(form)
 
@@ -87,6 +89,7 @@ def verification_pass(request):
 
 
 class CustomPasswordResetView(PasswordResetView):
+    form_class = OutboxPasswordResetForm
     email_template_name = 'users/password_reset_email.html'
     success_url = reverse_lazy('users:password_reset_done')
 